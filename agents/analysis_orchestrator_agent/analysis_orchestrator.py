@@ -7,7 +7,9 @@ Motor principal que transforma planos em queries SQL otimizadas para AWS Athena
 import os
 import json
 import time
-from openai import OpenAI
+from agents.llm_client import get_llm_client
+from agents.conversation_context import fit_context
+from agents.prompt_cache import CompiledPrompt
 from typing import Dict, Any, List
 from pathlib import Path
 from dotenv import load_dotenv
@@ -26,7 +28,7 @@ class AnalysisOrchestratorAgent:
         print("✅ Agente inicializado")
         print("="*80 + "\n")
         
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = get_llm_client('analysis_orchestrator')
         self.model = "gpt-4o"
         
         # Carregar .env para verificar BD_REFERENCE
@@ -44,9 +46,13 @@ class AnalysisOrchestratorAgent:
             print(f"   🔧 Usando roles.json (AWS Athena)")
         
         # Carregar roles (contém TUDO: schemas, instruções e funções proibidas)
+        # e compilar o system prompt UMA vez (json.dumps de até 35 KB por query antes)
         roles_path = Path(__file__).parent / roles_file
-        with open(roles_path, 'r', encoding='utf-8') as f:
-            self.roles = json.load(f)
+        self.prompt = CompiledPrompt(roles_path, self._build_system_prompt)
+    
+    @property
+    def roles(self) -> Dict[str, Any]:
+        return self.prompt.roles
     
     def generate_query(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -75,7 +81,7 @@ class AnalysisOrchestratorAgent:
         intent_category = state.get("intent_category", "unknown")
         username = state.get("username", "")
         projeto = state.get("projeto", "")
-        conversation_context = state.get("conversation_context", "")
+        conversation_context = fit_context(state.get("conversation_context", ""), 'analysis_orchestrator')
         has_history = state.get("has_history", False)
         
         # Header
@@ -97,8 +103,8 @@ class AnalysisOrchestratorAgent:
         start_time = time.time()
         
         try:
-            # Construir prompt para o GPT
-            system_prompt = self._build_system_prompt()
+            # Construir prompt para o GPT (system compilado = prefixo fixo para o prompt caching)
+            system_prompt = self.prompt.get()
             base_user_prompt = self._build_user_prompt(plan, pergunta, intent_category)
             
             # Injetar contexto ANTES do prompt se houver histórico
@@ -172,15 +178,15 @@ class AnalysisOrchestratorAgent:
                 "previous_module": "analysis_orchestrator"
             }
     
-    def _build_system_prompt(self) -> str:
+    def _build_system_prompt(self, roles: Dict[str, Any]) -> str:
         """Constrói o prompt do sistema com todas as regras e contexto"""
         
-        return f"""{self.roles['system_prompt_template']}
+        return f"""{roles['system_prompt_template']}
 
-{json.dumps(self.roles['security_rules'], indent=2, ensure_ascii=False)}
+{json.dumps(roles['security_rules'], indent=2, ensure_ascii=False)}
 
 📐 REGRAS COMPLETAS (DATABASE SCHEMA + INSTRUÇÕES + FUNÇÕES PROIBIDAS):
-{json.dumps(self.roles, indent=2, ensure_ascii=False)}
+{json.dumps(roles, indent=2, ensure_ascii=False)}
 
 ✅ CHECKLIST DE VALIDAÇÃO:
 Antes de retornar, verifique:
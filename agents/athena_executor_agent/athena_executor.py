@@ -8,7 +8,7 @@ Verifica a variável BD_REFERENCE para decidir qual banco usar
 import os
 import sys
 from pathlib import Path
-from typing import Dict, Any
+from typing import Callable, Dict, Any, Optional
 from datetime import datetime
 import awswrangler as wr
 import boto3
@@ -120,19 +120,41 @@ class AthenaExecutorAgent:
         finally:
             conn.close()
     
-    def _execute_athena(self, query_sql: str) -> pd.DataFrame:
+    def _execute_athena(self, query_sql: str, on_query_started: Optional[Callable[[str], None]] = None) -> pd.DataFrame:
         """Executa query no Athena e retorna DataFrame"""
-        return wr.athena.read_sql_query(
+        if on_query_started is None:
+            return wr.athena.read_sql_query(
+                sql=query_sql,
+                database=self.athena_database,
+                boto3_session=self.boto3_session,
+                s3_output=self.athena_output_s3,
+            )
+        
+        # Execução em duas etapas para expor o QueryExecutionId (permite cancelar com stop_query)
+        query_execution_id = wr.athena.start_query_execution(
             sql=query_sql,
             database=self.athena_database,
             boto3_session=self.boto3_session,
             s3_output=self.athena_output_s3,
         )
+        on_query_started(query_execution_id)
+        return wr.athena.get_query_results(
+            query_execution_id=query_execution_id,
+            boto3_session=self.boto3_session,
+        )
+    
+    def stop_query(self, query_execution_id: str):
+        """Cancela uma query em andamento no Athena"""
+        wr.athena.stop_query_execution(
+            query_execution_id=query_execution_id,
+            boto3_session=self.boto3_session,
+        )
     
     def execute(self,
                 query_sql: str,
                 username: str,
-                projeto: str) -> Dict[str, Any]:
+                projeto: str,
+                on_query_started: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """
         Executa query SQL no banco configurado (Athena ou PostgreSQL)
         
@@ -140,6 +162,8 @@ class AthenaExecutorAgent:
             query_sql: Query SQL final a ser executada
             username: Usuário que solicitou
             projeto: Projeto do usuário
+            on_query_started: Recebe o QueryExecutionId assim que a query
+                começa no Athena (execução especulativa, que pode ser cancelada)
             
         Returns:
             Dict com resultado da execução
@@ -167,7 +191,7 @@ class AthenaExecutorAgent:
             # Executar query no banco correto
             if self.bd_reference == "Athena":
                 print(f"   ➡️  EXECUTANDO NO ATHENA")
-                df = self._execute_athena(query_sql)
+                df = self._execute_athena(query_sql, on_query_started)
             else:
                 print(f"   ➡️  EXECUTANDO NO POSTGRESQL")
                 print(f"   📍 Host: {self.postgres_host}:{self.postgres_port}")
@@ -16,7 +16,8 @@ from datetime import datetime
 backend_path = str(Path(__file__).parent.parent.parent)
 sys.path.insert(0, backend_path)
 
-from openai import OpenAI
+from agents.llm_client import get_llm_client
+from agents.conversation_context import fit_context
 
 class AutoCorrectionAgent:
     """
@@ -30,7 +31,7 @@ class AutoCorrectionAgent:
     
     def __init__(self):
         """Inicializa o agente"""
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self.client = get_llm_client('auto_correction')
         self.roles = self._load_roles()
         self.model = 'gpt-4o'
         
@@ -251,6 +252,7 @@ class AutoCorrectionAgent:
         
         # Adicionar contexto de conversa se houver
         context_section = ""
+        conversation_context = fit_context(conversation_context, 'auto_correction')
         if has_history and conversation_context:
             context_section = f"{conversation_context}\n\n"
         
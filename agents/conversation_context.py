@@ -0,0 +1,310 @@
+"""
+Contexto da conversa com orçamento de tokens
+
+O handle_start_job concatenava o conversation_history INTEIRO no
+conversation_context, e cada agente o colocava na frente do prompt: o custo
+de toda chamada crescia com o tamanho da conversa. Agora:
+
+- As últimas CONTEXT_RECENT_MESSAGES mensagens entram na íntegra
+- As mais antigas viram um resumo por usuário/projeto no Redis
+  (conversation_summary:{username}:{projeto}), atualizado de forma
+  INCREMENTAL em background: o resumo anterior + as mensagens que saíram da
+  janela, em lotes de CONTEXT_SUMMARY_BATCH. Nunca é recalculado do zero
+  enquanto o histórico enviado pelo navegador continuar o mesmo (conferido
+  pela impressão digital da última mensagem resumida)
+- O contexto montado respeita CONTEXT_TOKEN_BUDGET (tokens contados com
+  tiktoken) e cada agente corta de novo para o próprio orçamento com
+  fit_context(contexto, agente): {AGENTE}_CONTEXT_TOKENS no .env. O corte
+  descarta as mensagens mais antigas primeiro e mantém o resumo
+
+O formato do texto continua o mesmo de antes (blocos "--- HISTÓRICO DA
+CONVERSA ---" / "Usuário:" / "Assistente:"), então os workers repassam
+conversation_context sem mudança.
+"""
+
+import os
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+from redis import Redis
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 1500))             # Teto do contexto montado (tokens)
+CONTEXT_RECENT_MESSAGES = int(os.getenv('CONTEXT_RECENT_MESSAGES', 6))          # Mensagens mais recentes na íntegra
+CONTEXT_SUMMARY_BATCH = int(os.getenv('CONTEXT_SUMMARY_BATCH', 4))              # Mensagens pendentes que disparam o resumo
+CONTEXT_SUMMARY_MODEL = os.getenv('CONTEXT_SUMMARY_MODEL', 'gpt-4o-mini')       # Modelo do resumo
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv('CONTEXT_SUMMARY_MAX_TOKENS', 300))  # Tamanho máximo do resumo
+CONTEXT_SUMMARY_TTL = int(os.getenv('CONTEXT_SUMMARY_TTL', 7 * 86400))          # Validade do resumo sem uso (s)
+CONTEXT_MESSAGE_MAX_TOKENS = 1000  # Corte de uma mensagem isolada enviada ao resumo
+CONTEXT_TOKEN_MODEL = 'gpt-4o'     # Tokenizador usado na contagem
+
+HISTORY_HEADER = "\n\n--- HISTÓRICO DA CONVERSA ---\n"
+HISTORY_FOOTER = "--- FIM DO HISTÓRICO ---\n\n"
+SUMMARY_LABEL = "Resumo da conversa anterior: "
+TRUNCATED_MARK = " [...]"
+
+SUMMARY_PROMPT = """Você mantém o resumo de uma conversa entre um usuário e um assistente de análise de dados.
+
+Atualize o resumo existente incorporando as novas mensagens. Preserve o que outros agentes precisam para entender perguntas de acompanhamento: métricas, filtros, períodos, tabelas e colunas citadas, conclusões e pedidos do usuário. Descarte cumprimentos e detalhes de formatação.
+
+Responda SOMENTE com o resumo atualizado, em português, em até {max_words} palavras.
+
+RESUMO ATUAL:
+{summary}
+
+NOVAS MENSAGENS:
+{messages}"""
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """Encoding do tiktoken, carregado no primeiro uso (None se não der para carregar)"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.encoding_for_model(CONTEXT_TOKEN_MODEL)
+                except Exception as e:
+                    # Sem o arquivo do encoding (máquina sem internet): estimativa por caracteres
+                    print(f"⚠️  tiktoken indisponível ({e}) - contando ~4 caracteres por token")
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Tokens do texto no tokenizador do modelo"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Primeiros max_tokens tokens do texto (com marca de corte se cortou)"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    keep = max(max_tokens - count_tokens(TRUNCATED_MARK), 0)
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:keep * 4] + TRUNCATED_MARK
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:keep]) + TRUNCATED_MARK
+
+
+def agent_budget(agent: str) -> int:
+    """Orçamento de contexto do agente: {AGENTE}_CONTEXT_TOKENS ou CONTEXT_TOKEN_BUDGET"""
+    return int(os.getenv(f"{agent.upper()}_CONTEXT_TOKENS", CONTEXT_TOKEN_BUDGET))
+
+
+def summary_key(username: str, projeto: str) -> str:
+    return f"conversation_summary:{username}:{projeto}"
+
+
+def _message_line(message: Dict[str, Any]) -> str:
+    sender_label = "Usuário" if message.get('sender') == 'user' else "Assistente"
+    return f"{sender_label}: {message.get('message', '')}\n"
+
+
+def _fingerprint(history: List[Dict[str, Any]], covered: int) -> str:
+    """Impressão digital do trecho já resumido (quantidade + última mensagem)"""
+    if covered <= 0:
+        return ''
+    last = history[covered - 1]
+    raw = f"{covered}|{last.get('sender')}|{last.get('message', '')}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def render_context(summary: str, lines: List[str], max_tokens: int) -> str:
+    """
+    Monta o bloco de histórico dentro do orçamento
+    
+    Resumo primeiro (cortado se sozinho já estoura), depois as mensagens mais
+    recentes que couberem, em ordem cronológica.
+    """
+    if not summary and not lines:
+        return ""
+    
+    budget = max_tokens - count_tokens(HISTORY_HEADER) - count_tokens(HISTORY_FOOTER)
+    summary_line = ""
+    if summary:
+        summary = " ".join(summary.split())  # Uma linha só (fit_context separa o resumo por linha)
+        summary_line = truncate_tokens(f"{SUMMARY_LABEL}{summary}", budget // 2 - 1)
+        summary_line = summary_line + "\n" if summary_line else ""
+        budget -= count_tokens(summary_line)
+    
+    kept = []
+    for line in reversed(lines):
+        tokens = count_tokens(line)
+        if tokens > budget:
+            if not kept and budget > 0:
+                # Nem a última mensagem cabe inteira: vai cortada
+                kept.append(truncate_tokens(line, budget - 1).rstrip('\n') + "\n")
+            break
+        kept.append(line)
+        budget -= tokens
+    
+    if not summary_line and not kept:
+        return ""
+    return HISTORY_HEADER + summary_line + "".join(reversed(kept)) + HISTORY_FOOTER
+
+
+def _split_context(context: str) -> Optional[tuple]:
+    """(resumo, linhas de mensagem) de um contexto montado por render_context, ou None se não reconhecer o formato"""
+    start = context.find(HISTORY_HEADER.strip())
+    end = context.rfind(HISTORY_FOOTER.strip())
+    if start < 0 or end < start:
+        return None
+    body = context[start + len(HISTORY_HEADER.strip()):end].strip('\n')
+    
+    summary, lines = "", []
+    for raw in body.split('\n'):
+        if raw.startswith(SUMMARY_LABEL) and not lines and not summary:
+            summary = raw[len(SUMMARY_LABEL):]
+        elif raw.startswith(("Usuário: ", "Assistente: ")) or not lines:
+            lines.append(raw + "\n")
+        else:
+            lines[-1] += raw + "\n"  # Continuação de mensagem com quebra de linha
+    return summary, lines
+
+
+def fit_context(context: str, agent: str) -> str:
+    """
+    Corta o conversation_context para o orçamento do agente
+    
+    Mantém o resumo e descarta as mensagens mais antigas primeiro. Contexto
+    fora do formato conhecido é cortado direto por tokens.
+    """
+    if not context:
+        return context
+    max_tokens = agent_budget(agent)
+    if count_tokens(context) <= max_tokens:
+        return context
+    
+    parts = _split_context(context)
+    if parts is None:
+        return truncate_tokens(context, max_tokens)
+    summary, lines = parts
+    return render_context(summary, lines, max_tokens)
+
+
+class ConversationContextBuilder:
+    """Monta o conversation_context do job e mantém o resumo incremental da conversa"""
+    
+    def __init__(self, redis_client: Redis, llm_client=None):
+        self.redis_client = redis_client  # decode_responses=True
+        self._llm = llm_client
+        self._llm_lock = threading.Lock()
+    
+    @property
+    def llm(self):
+        if self._llm is None:
+            with self._llm_lock:
+                if self._llm is None:
+                    from agents.llm_client import get_llm_client
+                    self._llm = get_llm_client('context_summary')
+        return self._llm
+    
+    def _load_summary(self, username: str, projeto: str, history: List[Dict[str, Any]]) -> tuple:
+        """(resumo, mensagens cobertas) válidos para este histórico; (vazio, 0) se não bate"""
+        state = self.redis_client.hgetall(summary_key(username, projeto))
+        if not state:
+            return "", 0
+        covered = int(state.get('covered', 0))
+        if covered > len(history) or state.get('anchor', '') != _fingerprint(history, covered):
+            # Histórico diferente do resumido (projeto limpo, mensagens apagadas): recomeça
+            return "", 0
+        return state.get('summary', ''), covered
+    
+    def build(self, username: str, projeto: str, history: List[Dict[str, Any]]) -> str:
+        """
+        conversation_context do job: resumo + mensagens ainda não resumidas
+        (as mais recentes primeiro), dentro de CONTEXT_TOKEN_BUDGET
+        
+        Dispara a atualização do resumo em background quando há mensagens
+        suficientes fora da janela recente.
+        """
+        if not history:
+            return ""
+        
+        try:
+            summary, covered = self._load_summary(username, projeto, history)
+        except Exception as e:
+            print(f"⚠️  Resumo da conversa indisponível: {e}")
+            summary, covered = "", 0
+        
+        context = render_context(summary, [_message_line(m) for m in history[covered:]], CONTEXT_TOKEN_BUDGET)
+        
+        pending = len(history) - CONTEXT_RECENT_MESSAGES - covered
+        if pending >= CONTEXT_SUMMARY_BATCH:
+            threading.Thread(
+                target=self.update_summary,
+                args=(username, projeto, list(history)),
+                daemon=True
+            ).start()
+        
+        return context
+    
+    def update_summary(self, username: str, projeto: str, history: List[Dict[str, Any]]) -> bool:
+        """
+        Incorpora ao resumo as mensagens que saíram da janela recente
+        
+        Um resumo por vez por usuário/projeto (lock no Redis); a chamada que
+        perde o lock não faz nada - a próxima pergunta dispara de novo.
+        
+        Returns:
+            True se o resumo foi atualizado
+        """
+        key = summary_key(username, projeto)
+        lock_key = f"conversation_summary_lock:{username}:{projeto}"
+        if not self.redis_client.set(lock_key, '1', nx=True, ex=120):
+            return False
+        
+        try:
+            summary, covered = self._load_summary(username, projeto, history)
+            target = len(history) - CONTEXT_RECENT_MESSAGES
+            if target - covered < CONTEXT_SUMMARY_BATCH:
+                return False
+            
+            messages = "".join(
+                truncate_tokens(_message_line(m), CONTEXT_MESSAGE_MAX_TOKENS)
+                for m in history[covered:target]
+            )
+            prompt = SUMMARY_PROMPT.format(
+                max_words=int(CONTEXT_SUMMARY_MAX_TOKENS * 0.7),
+                summary=summary or "(nenhum)",
+                messages=messages
+            )
+            response = self.llm.chat.completions.create(
+                model=CONTEXT_SUMMARY_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                max_tokens=CONTEXT_SUMMARY_MAX_TOKENS
+            )
+            new_summary = (response.choices[0].message.content or "").strip()
+            if not new_summary:
+                return False
+            
+            pipe = self.redis_client.pipeline()
+            pipe.hset(key, mapping={
+                'summary': new_summary,
+                'covered': target,
+                'anchor': _fingerprint(history, target)
+            })
+            pipe.expire(key, CONTEXT_SUMMARY_TTL)
+            pipe.execute()
+            print(f"📝 Resumo da conversa de {username}/{projeto} atualizado: "
+                  f"{target} mensagens cobertas (+{target - covered}), {count_tokens(new_summary)} tokens")
+            return True
+        except Exception as e:
+            print(f"⚠️  Erro ao atualizar o resumo da conversa de {username}/{projeto}: {e}")
+            return False
+        finally:
+            self.redis_client.delete(lock_key)
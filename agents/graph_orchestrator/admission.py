@@ -0,0 +1,133 @@
+"""
+Controle de admissão do start_job (servidor websocket)
+
+Antes de submeter um job novo:
+
+1. Profundidade global das filas: acima de ADMISSION_MAX_QUEUE_DEPTH jobs
+   aguardando worker, o job é recusado na hora com "ocupado, tente em N s"
+   (com a espera estimada) em vez de crescer a fila de todo mundo
+2. Token bucket no Redis por usuário e por projeto
+   (ratelimit:user:{username} / ratelimit:project:{username}:{projeto}): cada
+   pergunta consome uma ficha, que repõe a {RATE}/minuto até o limite de
+   {BURST}. O projeto é escopado pelo dono, como as sub-filas (queue_owner):
+   projetos de usuários diferentes com o mesmo nome ("default",
+   "test_project") não dividem o mesmo bucket
+
+Os dois buckets são verificados e consumidos atomicamente (token_bucket.py,
+o mesmo script do orçamento do cliente LLM): se um recusar, o outro não perde
+ficha. O relógio é o do servidor websocket.
+"""
+
+import os
+import math
+import time
+import threading
+from typing import Any, Dict, List, Optional
+
+from agents.graph_orchestrator.graph_orchestrator import GraphOrchestrator, queue_owner
+from agents.graph_orchestrator.autoscaler import discover_modules
+from agents.token_bucket import take_tokens
+
+# =====================================================
+# CONFIGURAÇÃO
+# =====================================================
+
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv('ADMISSION_MAX_QUEUE_DEPTH', 200))       # Jobs aguardando (todas as filas); 0 desliga
+ADMISSION_USER_RATE = float(os.getenv('ADMISSION_USER_RATE', 10))                  # Perguntas/minuto por usuário; 0 desliga
+ADMISSION_USER_BURST = int(os.getenv('ADMISSION_USER_BURST', 5))                   # Rajada máxima por usuário
+ADMISSION_PROJECT_RATE = float(os.getenv('ADMISSION_PROJECT_RATE', 60))            # Perguntas/minuto por projeto; 0 desliga
+ADMISSION_PROJECT_BURST = int(os.getenv('ADMISSION_PROJECT_BURST', 20))            # Rajada máxima por projeto
+ADMISSION_DEPTH_CACHE = float(os.getenv('ADMISSION_DEPTH_CACHE', 1))               # Segundos de cache da profundidade das filas
+ADMISSION_DEFAULT_PROCESSING_TIME = float(os.getenv('ADMISSION_DEFAULT_PROCESSING_TIME', 5))  # Módulo sem amostras ainda
+
+
+class AdmissionController:
+    """Decide se um job novo entra no grafo (fila global + limites por usuário/projeto)"""
+    
+    def __init__(self, orchestrator: GraphOrchestrator, modules: Optional[List[str]] = None):
+        self.orchestrator = orchestrator
+        self.modules = modules or discover_modules()
+        self._lock = threading.Lock()
+        self._load_cache = (0.0, None)  # (quando, {'depth', 'estimated_wait'})
+        self._metrics = {'admitted': 0, 'busy': 0, 'rate_limited': 0}
+    
+    def queue_load(self) -> Dict[str, Any]:
+        """
+        Jobs aguardando worker em todas as filas e espera estimada para esvaziar
+        (cacheado por ADMISSION_DEPTH_CACHE segundos: picos não martelam o Redis)
+        
+        A espera estimada é a da fila mais lenta (jobs × tempo médio do módulo),
+        já que os módulos processam em paralelo.
+        """
+        cached_at, load = self._load_cache
+        if load is not None and time.time() - cached_at < ADMISSION_DEPTH_CACHE:
+            return load
+        
+        depths = self.orchestrator.list_queues(self.modules)
+        times = self.orchestrator.processing_times(self.modules)
+        load = {
+            'depth': sum(depths.values()),
+            'estimated_wait': max(
+                [depth * (times.get(module) or ADMISSION_DEFAULT_PROCESSING_TIME) for module, depth in depths.items()],
+                default=0.0
+            )
+        }
+        self._load_cache = (time.time(), load)
+        return load
+    
+    def _take_tokens(self, username: str, projeto: str) -> float:
+        """Consome uma ficha dos buckets do usuário e do projeto - 0 se admitido, senão segundos de espera"""
+        buckets = []
+        if ADMISSION_USER_RATE > 0:
+            buckets.append((f"ratelimit:user:{username}", ADMISSION_USER_BURST, ADMISSION_USER_RATE / 60, 1))
+        if ADMISSION_PROJECT_RATE > 0:
+            buckets.append((f"ratelimit:project:{queue_owner(username, projeto)}", ADMISSION_PROJECT_BURST, ADMISSION_PROJECT_RATE / 60, 1))
+        return take_tokens(self.orchestrator.redis_client, buckets)
+    
+    def _count(self, outcome: str):
+        with self._lock:
+            self._metrics[outcome] += 1
+    
+    def check(self, username: str, projeto: str) -> Optional[Dict[str, Any]]:
+        """
+        Verifica a admissão de um job novo
+        
+        Returns:
+            None se o job pode ser submetido, senão o motivo da recusa:
+            {'type': 'busy' | 'rate_limited', 'message', 'retry_after', ...}
+        """
+        if ADMISSION_MAX_QUEUE_DEPTH > 0:
+            load = self.queue_load()
+            if load['depth'] >= ADMISSION_MAX_QUEUE_DEPTH:
+                # Tempo para a fila voltar abaixo do limite (proporcional ao excesso)
+                excess = load['depth'] - ADMISSION_MAX_QUEUE_DEPTH + 1
+                retry_after = max(1, math.ceil(load['estimated_wait'] * excess / load['depth']))
+                self._count('busy')
+                return {
+                    'type': 'busy',
+                    'message': f'Sistema ocupado ({load["depth"]} consultas na fila). Tente novamente em {retry_after}s.',
+                    'retry_after': retry_after,
+                    'estimated_wait': math.ceil(load['estimated_wait']),
+                    'queue_depth': load['depth']
+                }
+        
+        wait = self._take_tokens(username, projeto)
+        if wait > 0:
+            retry_after = max(1, math.ceil(wait))
+            self._count('rate_limited')
+            return {
+                'type': 'rate_limited',
+                'message': f'Muitas consultas em sequência. Tente novamente em {retry_after}s.',
+                'retry_after': retry_after
+            }
+        
+        self._count('admitted')
+        return None
+    
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de admissão e última carga medida"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics['max_queue_depth'] = ADMISSION_MAX_QUEUE_DEPTH
+        metrics['last_load'] = self._load_cache[1]
+        return metrics
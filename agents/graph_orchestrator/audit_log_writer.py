@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Audit Log Writer - grava os logs por módulo no PostgreSQL em lote
+
+Consome o stream audit_log (publicado pelo ModuleWorker a cada etapa com
+AUDIT_LOG_MODE=stream) no consumer group audit_writers e grava cada lote de
+até AUDIT_LOG_BATCH_SIZE eventos com HistoryPreferencesAgent.save_interaction
+numa ÚNICA transação (um commit por lote, uma conexão persistente). O
+caminho do usuário nunca espera a gravação do log.
+
+- Cada evento roda num SAVEPOINT: um evento com erro é descartado sem
+  derrubar o resto do lote
+- Ack (XACK) só depois do commit: se o banco cair, o lote fica pendente e é
+  relido (id '0') quando a conexão voltar
+- Um writer só: as buscas de parent_id dependem da ordem dos eventos. O
+  consumer tem nome fixo (AUDIT_LOG_CONSUMER) para o processo reiniciado
+  reler os próprios pendentes; ao iniciar, ele ainda reivindica (XAUTOCLAIM)
+  os pendentes de qualquer outro consumer do grupo (nome antigo, writer
+  com outro AUDIT_LOG_CONSUMER) - nenhum lote não commitado fica órfão
+
+Uso:
+    python agents/graph_orchestrator/audit_log_writer.py
+"""
+
+import sys
+import os
+import time
+from pathlib import Path
+from typing import List
+
+import psycopg2
+import redis
+from redis import Redis
+
+# Adicionar paths
+backend_path = str(Path(__file__).parent.parent.parent)
+sys.path.insert(0, backend_path)
+
+from agents.graph_orchestrator.graph_orchestrator import (
+    JOB_STORE_CONFIG, AUDIT_LOG_STREAM, load_blob
+)
+from agents.graph_orchestrator.job_codec import decode_job
+from agents.history_preferences_agent.history_preferences import HistoryPreferencesAgent
+
+AUDIT_LOG_GROUP = 'audit_writers'
+AUDIT_LOG_CONSUMER = os.getenv('AUDIT_LOG_CONSUMER', 'audit-writer')       # Nome fixo: sobrevive a restart (pid novo)
+AUDIT_LOG_BATCH_SIZE = int(os.getenv('AUDIT_LOG_BATCH_SIZE', 200))         # Eventos por transação
+AUDIT_LOG_BLOCK_MS = int(os.getenv('AUDIT_LOG_BLOCK_MS', 1000))            # Espera por eventos novos
+AUDIT_LOG_RETRY_INTERVAL = int(os.getenv('AUDIT_LOG_RETRY_INTERVAL', 5))   # Segundos antes de tentar de novo após erro
+
+
+class AuditLogWriter:
+    """Consumidor do stream audit_log que grava em lote no PostgreSQL"""
+    
+    def __init__(self):
+        self.redis_client = Redis(**JOB_STORE_CONFIG)  # Eventos codificados com job_codec (binário)
+        self.agent = HistoryPreferencesAgent()
+        self.consumer_name = AUDIT_LOG_CONSUMER
+        self.conn = None
+        self.running = False
+    
+    def _connection(self):
+        """Conexão persistente (reaberta se caiu)"""
+        if self.conn is None or self.conn.closed:
+            self.conn = psycopg2.connect(**self.agent.db_config)
+        return self.conn
+    
+    def _ensure_group(self):
+        """Cria o consumer group do audit log (idempotente)"""
+        try:
+            self.redis_client.xgroup_create(AUDIT_LOG_STREAM, AUDIT_LOG_GROUP, id='0', mkstream=True)
+            print(f"   ✓ Consumer group '{AUDIT_LOG_GROUP}' criado em {AUDIT_LOG_STREAM}")
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+    
+    def _claim_orphans(self) -> int:
+        """
+        Reivindica para este consumer os eventos pendentes de outros consumers
+        do grupo (writer que caiu com outro nome) e remove os consumers vazios
+        
+        Returns:
+            Número de eventos reivindicados
+        """
+        claimed = 0
+        start_id = '0-0'
+        while True:
+            result = self.redis_client.xautoclaim(
+                AUDIT_LOG_STREAM, AUDIT_LOG_GROUP, self.consumer_name,
+                min_idle_time=0, start_id=start_id, count=AUDIT_LOG_BATCH_SIZE
+            )
+            start_id = result[0]
+            claimed += len(result[1])
+            if start_id in (b'0-0', '0-0'):
+                break
+        
+        for consumer in self.redis_client.xinfo_consumers(AUDIT_LOG_STREAM, AUDIT_LOG_GROUP):
+            name = consumer['name'].decode('utf-8') if isinstance(consumer['name'], bytes) else consumer['name']
+            if name != self.consumer_name and consumer['pending'] == 0:
+                self.redis_client.xgroup_delconsumer(AUDIT_LOG_STREAM, AUDIT_LOG_GROUP, name)
+        return claimed
+    
+    def _read(self, last_id: str) -> List[tuple]:
+        """Próximo lote: pendentes deste consumer (last_id '0') ou eventos novos ('>')"""
+        result = self.redis_client.xreadgroup(
+            AUDIT_LOG_GROUP,
+            self.consumer_name,
+            {AUDIT_LOG_STREAM: last_id},
+            count=AUDIT_LOG_BATCH_SIZE,
+            block=None if last_id == '0' else AUDIT_LOG_BLOCK_MS
+        )
+        return [entry for _, entries in result or [] for entry in entries]
+    
+    def _load_state(self, fields) -> dict:
+        state = decode_job(fields[b'state'])
+        # athena_executor: carregar results_full do blob (claim-check) para gravar no log
+        if state.get('previous_module') == 'athena_executor' and state.get('results_full_ref') and not state.get('results_full'):
+            rows = load_blob(self.redis_client, state['results_full_ref'])
+            state['results_full'] = rows if rows is not None else state.get('results_preview', [])
+        return state
+    
+    def write_batch(self, entries: List[tuple]) -> int:
+        """
+        Grava um lote numa transação e dá ack
+        
+        Returns:
+            Número de eventos gravados (os descartados por erro também recebem ack)
+        """
+        conn = self._connection()
+        cursor = conn.cursor()
+        saved = 0
+        try:
+            with self.agent.batch_transaction(conn):
+                for message_id, fields in entries:
+                    if not fields:
+                        continue  # Pendente que já saiu do stream (MAXLEN)
+                    try:
+                        state = self._load_state(fields)
+                    except ValueError as e:
+                        print(f"   ⚠️  Evento {message_id} ilegível - descartado: {e}")
+                        continue
+                    
+                    cursor.execute("SAVEPOINT audit_event")
+                    result = self.agent.save_interaction(state)
+                    if result.get('interaction_saved'):
+                        cursor.execute("RELEASE SAVEPOINT audit_event")
+                        saved += 1
+                    else:
+                        cursor.execute("ROLLBACK TO SAVEPOINT audit_event")
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        
+        self.redis_client.xack(AUDIT_LOG_STREAM, AUDIT_LOG_GROUP, *[message_id for message_id, _ in entries])
+        return saved
+    
+    def start(self):
+        """Inicia o writer (loop infinito)"""
+        self.running = True
+        self._ensure_group()
+        claimed = self._claim_orphans()
+        print(f"\n📝 Audit Log Writer iniciado")
+        print(f"   📮 Consumindo stream: {AUDIT_LOG_STREAM} (grupo {AUDIT_LOG_GROUP}, consumer {self.consumer_name})")
+        if claimed:
+            print(f"   ♻️  {claimed} eventos pendentes de outros consumers reivindicados")
+        print(f"   📦 Lote: até {AUDIT_LOG_BATCH_SIZE} eventos por transação\n")
+        
+        last_id = '0'  # Primeiro os pendentes (lote que não chegou a ser commitado)
+        while self.running:
+            try:
+                entries = self._read(last_id)
+                if not entries:
+                    last_id = '>'
+                    continue
+                
+                start = time.time()
+                saved = self.write_batch(entries)
+                print(f"   ✅ Lote: {saved}/{len(entries)} eventos gravados em {(time.time() - start) * 1000:.0f}ms")
+            except KeyboardInterrupt:
+                print(f"\n⏹️  Audit Log Writer parando...")
+                self.running = False
+            except Exception as e:
+                print(f"❌ Erro no audit log writer: {str(e)}")
+                if self.conn is not None and not self.conn.closed:
+                    self.conn.close()
+                self.conn = None
+                last_id = '0'  # Reprocessar o lote pendente
+                time.sleep(AUDIT_LOG_RETRY_INTERVAL)
+
+
+if __name__ == '__main__':
+    writer = AuditLogWriter()
+    writer.start()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Autoscaler dos workers do Graph Orchestrator
+
+Substitui o deploy fixo de um processo por módulo: a cada
+AUTOSCALER_INTERVAL segundos lê a profundidade das filas
+(GraphOrchestrator.list_queues) e o tempo médio de processamento recente de
+cada módulo (processing_times:{module}) e ajusta o número de processos
+worker_{module}.py entre o mínimo e o máximo configurados.
+
+Processos necessários por módulo:
+
+    ceil(jobs na fila × tempo médio / (AUTOSCALER_TARGET_WAIT × concorrência))
+
+limitado a [{MODULO}_MIN_WORKERS, {MODULO}_MAX_WORKERS]
+(padrão AUTOSCALER_MIN_WORKERS / AUTOSCALER_MAX_WORKERS).
+
+Scale-down é gracioso: o worker recebe SIGTERM, para de pegar jobs e termina
+os que já estão em andamento (ModuleWorker._handle_stop_signal). Só é morto
+se passar de AUTOSCALER_DRAIN_TIMEOUT segundos drenando.
+
+Uso:
+    python agents/graph_orchestrator/autoscaler.py
+    (ou WORKER_AUTOSCALE=true no start_workers.sh / pm2)
+"""
+
+import sys
+import os
+import math
+import time
+import signal
+import subprocess
+from pathlib import Path
+from typing import Dict, List
+
+# Adicionar paths
+backend_path = str(Path(__file__).parent.parent.parent)
+sys.path.insert(0, backend_path)
+
+from agents.graph_orchestrator.graph_orchestrator import GraphOrchestrator
+
+AUTOSCALER_INTERVAL = int(os.getenv('AUTOSCALER_INTERVAL', 10))                     # Segundos entre avaliações
+AUTOSCALER_TARGET_WAIT = float(os.getenv('AUTOSCALER_TARGET_WAIT', 30))             # Segundos aceitáveis para esvaziar a fila
+AUTOSCALER_MIN_WORKERS = int(os.getenv('AUTOSCALER_MIN_WORKERS', 1))
+AUTOSCALER_MAX_WORKERS = int(os.getenv('AUTOSCALER_MAX_WORKERS', 4))
+AUTOSCALER_SCALE_DOWN_DELAY = int(os.getenv('AUTOSCALER_SCALE_DOWN_DELAY', 60))     # Demanda menor por esse tempo antes de reduzir
+AUTOSCALER_DRAIN_TIMEOUT = int(os.getenv('AUTOSCALER_DRAIN_TIMEOUT', 600))          # Deve cobrir o job mais lento
+AUTOSCALER_DEFAULT_PROCESSING_TIME = float(os.getenv('AUTOSCALER_DEFAULT_PROCESSING_TIME', 5))  # Sem amostras ainda
+
+WORKERS_DIR = Path(__file__).parent
+
+
+def discover_modules() -> List[str]:
+    """Módulos com worker (worker_{module}.py neste diretório)"""
+    return sorted(path.stem[len('worker_'):] for path in WORKERS_DIR.glob('worker_*.py'))
+
+
+def module_limits(module: str) -> tuple:
+    """(mínimo, máximo) de processos do módulo - override por {MODULO}_MIN_WORKERS / _MAX_WORKERS"""
+    minimum = int(os.getenv(f"{module.upper()}_MIN_WORKERS", AUTOSCALER_MIN_WORKERS))
+    maximum = int(os.getenv(f"{module.upper()}_MAX_WORKERS", AUTOSCALER_MAX_WORKERS))
+    return minimum, max(minimum, maximum)
+
+
+def module_concurrency(module: str) -> int:
+    """Jobs simultâneos por processo (mesma regra do ModuleWorker)"""
+    return max(1, int(os.getenv(f"{module.upper()}_CONCURRENCY", os.getenv('WORKER_CONCURRENCY', 1))))
+
+
+class ModuleProcesses:
+    """Processos worker de um módulo (ativos e em drenagem)"""
+    
+    def __init__(self, module: str):
+        self.module = module
+        self.script = str(WORKERS_DIR / f"worker_{module}.py")
+        self.minimum, self.maximum = module_limits(module)
+        self.concurrency = module_concurrency(module)
+        self.active: List[subprocess.Popen] = []
+        self.draining: Dict[subprocess.Popen, float] = {}  # processo -> prazo para terminar
+        self.low_since = None  # Desde quando a demanda está abaixo do número de processos
+    
+    def reap(self):
+        """Remove processos que terminaram; mata os que estouraram o prazo de drenagem"""
+        for proc in [p for p in self.active if p.poll() is not None]:
+            print(f"   ⚠️  Worker {self.module} (PID {proc.pid}) saiu com código {proc.returncode}")
+            self.active.remove(proc)
+        
+        for proc, deadline in list(self.draining.items()):
+            if proc.poll() is not None:
+                print(f"   ✅ Worker {self.module} (PID {proc.pid}) drenado")
+                del self.draining[proc]
+            elif time.time() > deadline:
+                print(f"   ☠️  Worker {self.module} (PID {proc.pid}) não drenou em {AUTOSCALER_DRAIN_TIMEOUT}s - SIGKILL")
+                proc.kill()
+                proc.wait()
+                del self.draining[proc]
+    
+    def desired(self, depth: int, avg_time: float) -> int:
+        """Processos necessários para esvaziar a fila em AUTOSCALER_TARGET_WAIT segundos"""
+        needed = math.ceil(depth * avg_time / (AUTOSCALER_TARGET_WAIT * self.concurrency))
+        return min(max(needed, self.minimum), self.maximum)
+    
+    def scale_to(self, target: int):
+        """Sobe processos imediatamente; reduz só após AUTOSCALER_SCALE_DOWN_DELAY"""
+        current = len(self.active)
+        
+        if target > current:
+            self.low_since = None
+            for _ in range(target - current):
+                proc = subprocess.Popen(
+                    [sys.executable, self.script],
+                    cwd=backend_path,
+                    env={**os.environ, 'PYTHONPATH': backend_path}
+                )
+                self.active.append(proc)
+            print(f"   ⬆️  {self.module}: {current} → {target} worker(s)")
+        
+        elif target < current:
+            if self.low_since is None:
+                self.low_since = time.time()
+            if time.time() - self.low_since < AUTOSCALER_SCALE_DOWN_DELAY:
+                return
+            self.low_since = None
+            for _ in range(current - target):
+                # Drenar os mais novos primeiro (os antigos já estão "aquecidos")
+                self.drain(self.active.pop())
+            print(f"   ⬇️  {self.module}: {current} → {target} worker(s) (drenando {current - target})")
+        
+        else:
+            self.low_since = None
+    
+    def drain(self, proc: subprocess.Popen):
+        """SIGTERM: o worker termina os jobs em andamento e sai"""
+        proc.send_signal(signal.SIGTERM)
+        self.draining[proc] = time.time() + AUTOSCALER_DRAIN_TIMEOUT
+
+
+class Autoscaler:
+    """Supervisor que dimensiona os workers de cada módulo pela fila"""
+    
+    def __init__(self, modules: List[str] = None):
+        self.orchestrator = GraphOrchestrator()
+        self.modules = modules or discover_modules()
+        self.processes = {module: ModuleProcesses(module) for module in self.modules}
+        self.running = False
+    
+    def tick(self):
+        """Uma avaliação: profundidade × tempo médio → processos por módulo"""
+        depths = self.orchestrator.list_queues(self.modules)
+        times = self.orchestrator.processing_times(self.modules)
+        
+        for module, processes in self.processes.items():
+            processes.reap()
+            avg_time = times.get(module) or AUTOSCALER_DEFAULT_PROCESSING_TIME
+            processes.scale_to(processes.desired(depths.get(module, 0), avg_time))
+    
+    def status(self) -> Dict[str, Dict[str, int]]:
+        """Processos ativos/drenando por módulo"""
+        return {
+            module: {'active': len(p.active), 'draining': len(p.draining)}
+            for module, p in self.processes.items()
+        }
+    
+    def _handle_stop_signal(self, signum, frame):
+        self.running = False
+    
+    def start(self):
+        """Inicia o autoscaler (loop infinito)"""
+        self.running = True
+        signal.signal(signal.SIGTERM, self._handle_stop_signal)
+        
+        print(f"\n📈 Autoscaler iniciado")
+        print(f"   ⏱️  Intervalo: {AUTOSCALER_INTERVAL}s | fila esvaziada em até {AUTOSCALER_TARGET_WAIT:.0f}s")
+        for module, processes in self.processes.items():
+            print(f"   📦 {module}: {processes.minimum}-{processes.maximum} worker(s) × {processes.concurrency} job(s)")
+        print()
+        
+        try:
+            while self.running:
+                try:
+                    self.tick()
+                except Exception as e:
+                    print(f"❌ Erro no autoscaler: {str(e)}")
+                time.sleep(AUTOSCALER_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+    
+    def shutdown(self):
+        """Drena todos os workers antes de sair"""
+        print(f"\n⏹️  Autoscaler parando - drenando todos os workers...")
+        for processes in self.processes.values():
+            while processes.active:
+                processes.drain(processes.active.pop())
+        
+        while any(p.draining for p in self.processes.values()):
+            for processes in self.processes.values():
+                processes.reap()
+            time.sleep(1)
+        print(f"✅ Workers finalizados")
+
+
+if __name__ == '__main__':
+    autoscaler = Autoscaler()
+    autoscaler.start()
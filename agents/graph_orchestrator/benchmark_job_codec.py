@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos codecs de job:* (job_codec.py)
+
+Monta jobs realistas (execution_chain completa até o response_composer, com
+resultados do Athena) e mede para cada codec:
+    - tamanho serializado
+    - tempo de encode / decode
+    - memória no Redis (MEMORY USAGE), se o Redis estiver acessível
+
+Uso:
+    python agents/graph_orchestrator/benchmark_job_codec.py
+    python agents/graph_orchestrator/benchmark_job_codec.py --rows 50000 --iterations 50
+"""
+
+import sys
+import time
+import uuid
+import random
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Adicionar paths
+backend_path = str(Path(__file__).parent.parent.parent)
+sys.path.insert(0, backend_path)
+
+from agents.graph_orchestrator.job_codec import encode_job, decode_job, orjson, ormsgpack, zstandard
+from agents.graph_orchestrator.graph_orchestrator import REDIS_CONFIG
+from redis import Redis
+
+CODECS = ['json', 'orjson', 'msgpack', 'orjson+zstd', 'msgpack+zstd']
+
+
+def build_athena_rows(row_count: int):
+    """Linhas no formato de report_orders (df.to_dict('records'))"""
+    random.seed(42)
+    base = datetime(2025, 1, 1)
+    status = ['paid', 'pending', 'cancelled', 'refunded']
+    rows = []
+    for i in range(row_count):
+        rows.append({
+            'order_id': f"ORD-{100000 + i}",
+            'customer_id': random.randint(1, 5000),
+            'order_date': (base + timedelta(minutes=17 * i)).isoformat(),
+            'status': random.choice(status),
+            'total_amount': round(random.uniform(10, 5000), 2),
+            'installments': random.randint(1, 12),
+            'state': random.choice(['SP', 'RJ', 'MG', 'RS', 'PR', 'BA']),
+            'product_category': random.choice(['eletronicos', 'moda', 'casa', 'beleza'])
+        })
+    return rows
+
+
+def build_job(row_count: int, with_full_results: bool):
+    """
+    Job no estado em que chega ao response_composer
+
+    with_full_results=False simula o claim-check (results_full fora do job)
+    """
+    rows = build_athena_rows(row_count)
+    pergunta = "Qual o faturamento por estado nos últimos 3 meses?"
+
+    data = {
+        'pergunta': pergunta,
+        'username': 'benchmark_user',
+        'projeto': 'ezpocket',
+        'intent_valid': True,
+        'intent_category': 'analytical_query',
+        'plan': "1. Filtrar pedidos pagos dos últimos 3 meses\n2. Agrupar por estado\n3. Somar total_amount",
+        'plan_steps': ['Filtrar pedidos', 'Agrupar por estado', 'Somar faturamento'],
+        'query_validated': "SELECT state, SUM(total_amount) FROM report_orders WHERE status = 'paid' GROUP BY state",
+        'row_count': row_count,
+        'columns': list(rows[0].keys()),
+        'results_preview': rows[:100],
+        'conversation_context': "Usuário perguntou anteriormente sobre ticket médio. " * 20,
+    }
+    if with_full_results:
+        data['results_full'] = rows
+    else:
+        data['results_full_ref'] = f"blob:{uuid.uuid4().hex}"
+
+    modules = ['intent_validator', 'history_preferences', 'plan_builder', 'plan_confirm',
+               'analysis_orchestrator', 'sql_validator', 'auto_correction', 'athena_executor',
+               'python_runtime']
+    chain = []
+    for module in modules:
+        step_output = {'previous_module': module, 'execution_time': random.uniform(0.1, 3)}
+        if module == 'athena_executor':
+            step_output.update({k: v for k, v in data.items() if k.startswith('results_')})
+        chain.append({
+            'module': module,
+            'input': {k: v for k, v in data.items() if not k.startswith('results_')},
+            'output': step_output,
+            'execution_time': step_output['execution_time'],
+            'timestamp': datetime.now().isoformat(),
+            'success': True
+        })
+
+    return {
+        'job_id': str(uuid.uuid4()),
+        'username': 'benchmark_user',
+        'projeto': 'ezpocket',
+        'start_module': 'intent_validator',
+        'current_module': 'response_composer',
+        'data': data,
+        'execution_chain': chain,
+        'status': 'processing',
+        'created_at': datetime.now().isoformat()
+    }
+
+
+def available(codec: str) -> bool:
+    base, _, compression = codec.partition('+')
+    if base == 'orjson' and orjson is None:
+        return False
+    if base == 'msgpack' and ormsgpack is None:
+        return False
+    if compression == 'zstd' and zstandard is None:
+        return False
+    return True
+
+
+def bench(job, codec: str, iterations: int):
+    """Retorna (bytes, encode_ms, decode_ms)"""
+    encoded = encode_job(job, codec)
+    raw = encoded.encode('utf-8') if isinstance(encoded, str) else encoded
+    assert decode_job(raw) == decode_job(encode_job(job, 'json')), f"round-trip divergente ({codec})"
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        encode_job(job, codec)
+    encode_ms = (time.perf_counter() - start) * 1000 / iterations
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        decode_job(raw)
+    decode_ms = (time.perf_counter() - start) * 1000 / iterations
+
+    return raw, encode_ms, decode_ms
+
+
+def redis_memory(redis_client, raw: bytes):
+    """MEMORY USAGE de uma chave temporária com o valor codificado"""
+    key = f"benchmark:job_codec:{uuid.uuid4().hex}"
+    try:
+        redis_client.set(key, raw, ex=60)
+        return redis_client.memory_usage(key)
+    finally:
+        redis_client.delete(key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dos codecs de job:*')
+    parser.add_argument('--rows', type=int, default=10000, help='Linhas do resultado do Athena')
+    parser.add_argument('--iterations', type=int, default=20, help='Repetições por medida')
+    args = parser.parse_args()
+
+    redis_client = Redis(**{**REDIS_CONFIG, 'decode_responses': False})
+    try:
+        redis_client.ping()
+    except Exception as e:
+        print(f"⚠️  Redis indisponível ({e}) - medindo só tamanho e tempo")
+        redis_client = None
+
+    scenarios = [
+        (f"results_full inline ({args.rows:,} linhas)", build_job(args.rows, with_full_results=True)),
+        ("claim-check (preview 100 linhas)", build_job(args.rows, with_full_results=False)),
+    ]
+
+    for title, job in scenarios:
+        print(f"\n{'='*86}")
+        print(f"📊 {title}")
+        print(f"{'='*86}")
+        print(f"{'codec':<14}{'bytes':>14}{'vs json':>10}{'encode ms':>12}{'decode ms':>12}{'redis bytes':>16}")
+
+        json_size = None
+        for codec in CODECS:
+            if not available(codec):
+                print(f"{codec:<14}{'(dependência não instalada)':>40}")
+                continue
+            raw, encode_ms, decode_ms = bench(job, codec, args.iterations)
+            json_size = json_size or len(raw)
+            memory = redis_memory(redis_client, raw) if redis_client else None
+            print(f"{codec:<14}{len(raw):>14,}{len(raw) / json_size:>9.1%} {encode_ms:>11.2f} {decode_ms:>11.2f}"
+                  f"{(f'{memory:,}' if memory else '-'):>16}")
+
+
+if __name__ == '__main__':
+    main()
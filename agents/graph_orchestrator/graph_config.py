@@ -37,6 +37,17 @@ GRAPH_CONNECTIONS = {
     "history_preferences": [],
 }
 
+# =====================================================
+# PONTOS DE JUNÇÃO (fan-in)
+# =====================================================
+# Formato: módulo de junção → [módulos de origem das branches]
+# O módulo só executa quando as branches vindas de TODAS as origens da mesma
+# árvore (root_job_id) chegaram; roda uma vez, com data['join_inputs'] =
+# {origem: data da branch}. As branches que chegaram antes são encerradas.
+# Ex: "response_composer": ["python_runtime", "history_preferences"]
+
+GRAPH_JOINS = {}
+
 # =====================================================
 # CONFIGURAÇÃO DETALHADA (Para documentação e UI)
 # =====================================================
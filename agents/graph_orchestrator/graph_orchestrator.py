@@ -20,10 +20,16 @@ from dotenv import load_dotenv
 import redis
 from redis import Redis
 import uuid
+import socket
+import threading
+import hashlib
+import signal
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 
 # Importar configuração do grafo
-from agents.graph_orchestrator.graph_config import GRAPH_CONNECTIONS
+from agents.graph_orchestrator.graph_config import GRAPH_CONNECTIONS, GRAPH_JOINS
+from agents.graph_orchestrator.job_codec import encode_job, decode_job
 
 load_dotenv()
 
@@ -38,6 +44,365 @@ REDIS_CONFIG = {
     'decode_responses': True
 }
 
+# Valores job:* podem ser binários (ver job_codec.py): lidos/gravados por um
+# cliente SEM decode_responses, via load_job / save_job
+JOB_STORE_CONFIG = {**REDIS_CONFIG, 'decode_responses': False}
+
+def load_job(job_store: Redis, job_id: str) -> Optional[Dict]:
+    """Lê e decodifica job:{job_id} (None se não existe)"""
+    return decode_job(job_store.get(f"job:{job_id}"))
+
+def save_job(job_store: Redis, job_id: str, job_data: Dict, ttl: int):
+    """Codifica (JOB_CODEC) e grava job:{job_id} com TTL - aceita pipeline"""
+    return job_store.setex(f"job:{job_id}", ttl, encode_job(job_data))
+
+# Índice de jobs por usuário/projeto: user_jobs:{username}:{projeto} recebe
+# cada job raiz e cada branch, então reset/logout custam O(jobs do usuário)
+# em vez de varrer job:* e esvaziar as filas.
+
+USER_JOBS_TTL = 3600  # Renovado a cada job novo (mesmo TTL dos jobs)
+
+def user_jobs_key(username: str, projeto: str) -> str:
+    return f"user_jobs:{username}:{projeto}"
+
+def index_user_job(redis_client: Redis, username: str, projeto: str, job_id: str):
+    """Registra job_id no índice do usuário/projeto - aceita pipeline"""
+    index_key = user_jobs_key(username, projeto)
+    redis_client.sadd(index_key, job_id)
+    redis_client.expire(index_key, USER_JOBS_TTL)
+
+def user_pending_keys(username: str, projeto: str) -> List[str]:
+    """Chaves de input pendente (HITL) do usuário/projeto - nomes exatos, sem SCAN"""
+    keys = []
+    for module in ['plan_confirm', 'user_feedback', 'user_proposed_plan']:
+        keys.append(f"{module}:pending:{username}:{projeto}")
+        keys.append(f"{module}:response:{username}:{projeto}")
+        keys.append(f"waiting:{module}:{username}:{projeto}")
+    keys.append(f"user_feedback:temp_rating:{username}:{projeto}")
+    return keys
+
+def user_memory_keys(username: str, projeto: str) -> List[str]:
+    """Chaves de histórico/memória do usuário/projeto no Redis"""
+    return [
+        f"history:{username}:{projeto}",
+        f"memory:{username}:{projeto}",
+        f"context:{username}:{projeto}",
+        f"chat_history:{username}:{projeto}",
+    ]
+
+# Jobs em estado terminal (completed/failed/cancelled) entram no zset
+# finished_jobs com score = horário da conclusão. O janitor (janitor.py)
+# expira os antigos com ZRANGEBYSCORE em lotes limitados - nenhuma
+# requisição do usuário varre job:* para limpar.
+
+FINISHED_JOBS_KEY = 'finished_jobs'
+
+def mark_finished(redis_client: Redis, job_data: Dict):
+    """Registra o job (já em estado terminal) em finished_jobs - aceita pipeline"""
+    member = json.dumps([
+        job_data.get('job_id'),
+        job_data.get('username', 'unknown'),
+        job_data.get('projeto', 'default'),
+        job_data.get('waiting_module')
+    ])
+    redis_client.zadd(FINISHED_JOBS_KEY, {member: time.time()})
+    
+    # Sai da árvore do job raiz (ver track_jobs)
+    job_id = job_data.get('job_id')
+    root_job_id = job_data.get('root_job_id') or job_id
+    redis_client.srem(outstanding_key(root_job_id), job_id)
+    if job_data.get('status') == 'failed':
+        failed_key = f"failed_branches:{root_job_id}"
+        redis_client.sadd(failed_key, job_id)
+        redis_client.expire(failed_key, TREE_TTL)
+
+# Conclusão da árvore em O(1): outstanding:{root_job_id} guarda os jobs
+# ainda vivos da árvore (raiz e branches) - entram no submit/split
+# (track_jobs) e saem em mark_finished. SCARD == 0 → todas as branches
+# terminaram, sem carregar nenhuma. SADD/SREM em vez de INCR/DECR deixa o
+# decremento idempotente (job finalizado duas vezes, ex: cancelamento +
+# worker, não desconta em dobro). failed_branches:{root_job_id} guarda as
+# que falharam.
+
+TREE_TTL = 3600  # Mesmo TTL dos jobs
+
+def outstanding_key(root_job_id: str) -> str:
+    return f"outstanding:{root_job_id}"
+
+def track_jobs(redis_client: Redis, root_job_id: str, *job_ids: str):
+    """Registra jobs vivos na árvore do job raiz - aceita pipeline"""
+    key = outstanding_key(root_job_id)
+    redis_client.sadd(key, *job_ids)
+    redis_client.expire(key, TREE_TTL)
+
+# A execution_chain NÃO fica dentro de job:{id}: cada etapa é anexada em
+# chain:{job_id} (lista append-only), então um hop grava só a própria etapa
+# e leitores buscam a partir de um offset (LRANGE offset -1).
+# Jobs antigos ainda podem ter 'execution_chain' no documento (legado).
+
+def append_step(job_store: Redis, job_id: str, step: Dict, ttl: int):
+    """Anexa uma etapa em chain:{job_id} e alinha o TTL ao do job - aceita pipeline"""
+    chain_key = f"chain:{job_id}"
+    job_store.rpush(chain_key, encode_job(step))
+    job_store.expire(chain_key, ttl)
+
+def read_chain(job_store: Redis, job_id: str, offset: int = 0) -> List[Dict]:
+    """Lê as etapas de chain:{job_id} a partir de offset"""
+    return [decode_job(raw) for raw in job_store.lrange(f"chain:{job_id}", offset, -1)]
+
+# =====================================================
+# TRANSPORTE DAS FILAS (list | stream)
+# =====================================================
+# list   → queue:{module} com RPUSH/BLPOP (padrão, comportamento original)
+# stream → stream:{module} com consumer group: ack explícito, reclaim de
+#          mensagens pendentes após visibility timeout (worker que caiu/foi
+#          reiniciado pelo pm2 não perde o job) e N workers por módulo
+
+QUEUE_TRANSPORT = os.getenv('QUEUE_TRANSPORT', 'list').lower()
+STREAM_GROUP = os.getenv('STREAM_GROUP', 'workers')
+STREAM_MAXLEN = int(os.getenv('STREAM_MAXLEN', 10000))
+# STREAM_VISIBILITY_TIMEOUT (s no .env, convertido para ms do XAUTOCLAIM):
+# mensagem sem ack há mais tempo que isso é reivindicada por outro worker.
+# Deve ser MAIOR que o process() mais longo do módulo (ex.: query no Athena) -
+# jobs interativos estacionam e dão ack, então a espera do usuário não conta.
+# O reclaim roda a cada max(timeout / 4, 5s) em _consume_stream
+STREAM_VISIBILITY_TIMEOUT_MS = int(os.getenv('STREAM_VISIBILITY_TIMEOUT', 600)) * 1000
+STREAM_MAX_DELIVERIES = int(os.getenv('STREAM_MAX_DELIVERIES', 3))
+
+# Tempos de process() por módulo (processing_times:{module}, últimas N
+# execuções) - usados pelo autoscaler (autoscaler.py) para dimensionar workers
+PROCESSING_TIME_SAMPLES = 100
+
+# =====================================================
+# ESCALONAMENTO JUSTO (transporte list)
+# =====================================================
+# fifo → queue:{module} única (comportamento original): quem dispara muitas
+#        perguntas atrasa todo mundo que vem atrás
+# fair → uma sub-fila por usuário/projeto e prioridade:
+#          queue:{module}:{prioridade}:{username}:{projeto}
+#        queue_owners:{module}:{prioridade} é o anel (round-robin) de donos com
+#        jobs na fila e queue_ready:{module} tem uma ficha por job depositado
+#        (o worker espera com BLPOP na ficha e retira o job com FAIR_DEQUEUE_LUA)
+#
+# Prioridades (estritas, a mais alta primeiro):
+#   high   → continuação interativa (resposta do usuário / prazo de input expirado)
+#   normal → fluxo principal da pergunta
+#   low    → branch paralela de módulos de background (gravação de histórico)
+#
+# SÓ REDIS STANDALONE (ou réplica/sentinel): o FAIR_DEQUEUE_LUA monta o nome
+# da sub-fila a partir do dono lido do anel e acessa chaves que não foram
+# declaradas em KEYS. Em Redis Cluster (ou proxy que roteia por chave) o
+# script falha - lá use QUEUE_SCHEDULING=fifo ou QUEUE_TRANSPORT=stream.
+
+QUEUE_SCHEDULING = os.getenv('QUEUE_SCHEDULING', 'fair').lower()
+QUEUE_PRIORITIES = ('high', 'normal', 'low')
+QUEUE_BACKGROUND_MODULES = {
+    module.strip() for module in os.getenv('QUEUE_BACKGROUND_MODULES', 'history_preferences').split(',')
+    if module.strip()
+}
+
+# KEYS: sub-fila, anel de donos, fichas | ARGV: job_id, dono
+FAIR_ENQUEUE_LUA = """
+redis.call('RPUSH', KEYS[1], ARGV[1])
+if not redis.call('LPOS', KEYS[2], ARGV[2]) then
+    redis.call('RPUSH', KEYS[2], ARGV[2])
+end
+redis.call('RPUSH', KEYS[3], '1')
+"""
+
+# KEYS: anéis de donos (da prioridade mais alta para a mais baixa)
+# ARGV: prefixo das sub-filas de cada anel (mesma ordem)
+# Gira o anel (RPOPLPUSH) e retira um job do próximo dono; dono sem jobs sai do anel
+# As sub-filas (ARGV[i] .. dono) NÃO estão em KEYS - só dá para saber qual
+# acessar depois de ler o anel: exige Redis standalone (ver acima)
+FAIR_DEQUEUE_LUA = """
+for i, ring in ipairs(KEYS) do
+    for _ = 1, redis.call('LLEN', ring) do
+        local owner = redis.call('RPOPLPUSH', ring, ring)
+        local subqueue = ARGV[i] .. owner
+        local job_id = redis.call('LPOP', subqueue)
+        if redis.call('LLEN', subqueue) == 0 then
+            redis.call('LREM', ring, 1, owner)
+        end
+        if job_id then
+            return job_id
+        end
+    end
+end
+return false
+"""
+
+
+def queue_owner(username: str, projeto: str) -> str:
+    """Dono da sub-fila (unidade de justiça do escalonamento fair)"""
+    return f"{username}:{projeto}"
+
+
+def user_queue_keys(module: str, username: str, projeto: str) -> List[str]:
+    """Sub-filas do usuário/projeto no módulo (todas as prioridades)"""
+    owner = queue_owner(username, projeto)
+    return [f"queue:{module}:{priority}:{owner}" for priority in QUEUE_PRIORITIES]
+
+
+def enqueue_job(redis_client: Redis, module: str, job_id: str,
+                owner: Optional[str] = None, priority: str = 'normal'):
+    """
+    Deposita job_id na fila do módulo usando o transporte configurado
+    (aceita tanto o cliente Redis quanto um pipeline)
+    
+    Args:
+        owner: queue_owner(username, projeto) - sub-fila no escalonamento fair
+        priority: 'high' | 'normal' | 'low' (ver QUEUE_PRIORITIES)
+    """
+    if QUEUE_TRANSPORT == 'stream':
+        redis_client.xadd(
+            f"stream:{module}",
+            {'job_id': job_id},
+            maxlen=STREAM_MAXLEN,
+            approximate=True
+        )
+    elif QUEUE_SCHEDULING == 'fair':
+        owner = owner or queue_owner('unknown', 'default')
+        if priority not in QUEUE_PRIORITIES:
+            priority = 'normal'
+        redis_client.eval(
+            FAIR_ENQUEUE_LUA, 3,
+            f"queue:{module}:{priority}:{owner}",
+            f"queue_owners:{module}:{priority}",
+            f"queue_ready:{module}",
+            job_id, owner
+        )
+    else:
+        redis_client.rpush(f"queue:{module}", job_id)
+
+# =====================================================
+# JOBS AGUARDANDO INPUT DO USUÁRIO (human-in-the-loop)
+# =====================================================
+# Módulos interativos (plan_confirm, user_feedback, user_proposed_plan) não
+# seguram o worker esperando a resposta: o job fica "estacionado" com status
+# waiting_input e é re-enfileirado quando a resposta chega (resume_waiting_job)
+# ou quando o prazo expira (zset waiting_deadlines:{module}).
+
+WAITING_INPUT_STATUS = 'waiting_input'
+WAIT_EXPIRY_CHECK_INTERVAL = 2  # Segundos entre verificações de prazos expirados
+
+# =====================================================
+# EVENTOS DE PROGRESSO (Redis Streams)
+# =====================================================
+# Cada job raiz tem um stream job_events:{root_job_id} onde workers publicam
+# etapas da execution_chain, mudanças de status, pedidos de input do usuário
+# e os pedaços da resposta final em streaming (worker_response_composer).
+# O servidor websocket consome com XREAD bloqueante (push, sem polling).
+
+JOB_EVENTS_MAXLEN = int(os.getenv('JOB_EVENTS_MAXLEN', 1000))
+JOB_EVENTS_TTL = 3600  # Mesmo TTL dos jobs
+
+def publish_job_event(redis_client: Redis, root_job_id: str, event_type: str, payload: Dict[str, Any]):
+    """
+    Publica um evento no stream do job raiz
+    
+    Args:
+        redis_client: Cliente Redis
+        root_job_id: Job raiz (o job_id que o websocket monitora)
+        event_type: 'step' | 'status' | 'input_needed' | 'answer_delta'
+        payload: Dados do evento (serializados em JSON)
+    """
+    if not root_job_id:
+        return
+    
+    events_key = f"job_events:{root_job_id}"
+    try:
+        redis_client.xadd(
+            events_key,
+            {'type': event_type, 'payload': json.dumps(payload, default=str)},
+            maxlen=JOB_EVENTS_MAXLEN,
+            approximate=True
+        )
+        redis_client.expire(events_key, JOB_EVENTS_TTL)
+    except Exception as e:
+        # Eventos são best-effort: nunca derrubar o processamento do job
+        print(f"   ⚠️  Erro ao publicar evento {event_type}: {e}")
+
+def parse_job_event(event_id: str, fields: Dict[str, str]) -> tuple:
+    """Converte uma entrada de job_events:* em (event_id, event_type, payload)"""
+    try:
+        payload = json.loads(fields.get('payload', '{}'))
+    except ValueError:
+        payload = {}
+    return event_id, fields.get('type'), payload
+
+# =====================================================
+# AUDIT LOG (logs por módulo no PostgreSQL)
+# =====================================================
+# branch → cada etapa abre uma branch para history_preferences só para gravar
+#          a linha de log (comportamento original: dobra filas, branches e deep copies)
+# stream → o ModuleWorker publica o estado da etapa no stream audit_log, na
+#          mesma transição do job, e segue sem a branch; audit_log_writer.py
+#          grava os eventos em lote no PostgreSQL (uma transação por lote)
+
+AUDIT_LOG_MODE = os.getenv('AUDIT_LOG_MODE', 'stream').lower()
+AUDIT_LOG_MODULE = 'history_preferences'
+AUDIT_LOG_STREAM = 'audit_log'
+AUDIT_LOG_MAXLEN = int(os.getenv('AUDIT_LOG_MAXLEN', 100000))
+
+def emit_audit_log(redis_client: Redis, state: Dict[str, Any]):
+    """Publica o estado de uma etapa no stream do audit log - aceita pipeline (cliente binário)"""
+    redis_client.xadd(AUDIT_LOG_STREAM, {'state': encode_job(state)}, maxlen=AUDIT_LOG_MAXLEN, approximate=True)
+
+# =====================================================
+# REPLAY (benchmark sem OpenAI / Athena - ver replay.py)
+# =====================================================
+# Com REPLAY_RECORDING o ModuleWorker devolve as saídas gravadas de um job
+# real em vez de chamar o process() da subclasse
+
+REPLAY_RECORDING = os.getenv('REPLAY_RECORDING')                          # Arquivo gerado por replay.py record
+REPLAY_LATENCY_SCALE = float(os.getenv('REPLAY_LATENCY_SCALE', 0))        # Fração da latência gravada a injetar
+
+# =====================================================
+# CLAIM-CHECK PARA RESULTADOS GRANDES
+# =====================================================
+# results_full (todas as linhas da query) é gravado UMA vez em blob:{sha256}
+# e só a referência (results_full_ref) + results_preview trafegam pelo grafo.
+# Sem isso o resultado era re-serializado em job:*, duplicado na execution_chain
+# e copiado (deepcopy) para cada branch.
+
+RESULT_BLOB_TTL = int(os.getenv('RESULT_BLOB_TTL', 3600))        # Mesmo TTL dos jobs
+RESULT_BLOB_MIN_ROWS = int(os.getenv('RESULT_BLOB_MIN_ROWS', 100))  # Abaixo disso fica inline
+
+def store_blob(redis_client: Redis, value: Any, ttl: int = RESULT_BLOB_TTL, owner: Optional[str] = None) -> str:
+    """
+    Grava valor JSON em chave endereçada por conteúdo
+    
+    Args:
+        owner: Dono (queue_owner(username, projeto)) registrado em
+               blob_owners:{sha256} - só ele pode paginar o blob (get_result_page)
+    
+    Returns:
+        Chave do blob (blob:{sha256}) - conteúdo idêntico reaproveita a mesma chave
+    """
+    payload = json.dumps(value, default=str, ensure_ascii=False)
+    blob_key = f"blob:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+    
+    # Já existe (mesmo resultado): só renovar o TTL
+    if not redis_client.set(blob_key, payload, ex=ttl, nx=True):
+        redis_client.expire(blob_key, ttl)
+    if owner:
+        # Mesmo conteúdo de usuários diferentes: cada um entra no conjunto de donos
+        pipe = redis_client.pipeline()
+        pipe.sadd(blob_owners_key(blob_key), owner)
+        pipe.expire(blob_owners_key(blob_key), ttl)
+        pipe.execute()
+    return blob_key
+
+def blob_owners_key(blob_key: str) -> str:
+    """Conjunto de donos do blob (blob:{sha256} → blob_owners:{sha256})"""
+    return f"blob_owners:{blob_key.split(':', 1)[1]}"
+
+def load_blob(redis_client: Redis, blob_key: str) -> Optional[Any]:
+    """Lê blob gravado por store_blob (None se expirou)"""
+    payload = redis_client.get(blob_key)
+    return json.loads(payload) if payload is not None else None
+
 # =====================================================
 # GRAPH ORCHESTRATOR
 # =====================================================
@@ -49,6 +414,7 @@ class GraphOrchestrator:
     
     def __init__(self):
         self.redis_client = Redis(**REDIS_CONFIG)
+        self.job_store = Redis(**JOB_STORE_CONFIG)
         self.connections = GRAPH_CONNECTIONS
         
     def submit_job(
@@ -81,21 +447,20 @@ class GraphOrchestrator:
             'start_module': start_module,
             'current_module': start_module,
             'data': initial_data,
-            'execution_chain': [],
             'status': 'pending',
-            'created_at': datetime.now().isoformat()
+            'created_at': datetime.now().isoformat(),
+            'tree_tracked': True  # Conclusão via outstanding:{job_id} (get_tree_status)
         }
         
         # Salvar job info
-        self.redis_client.setex(
-            f"job:{job_id}",
-            3600,  # TTL: 1 hora
-            json.dumps(job_data)
-        )
+        pipe = self.job_store.pipeline(transaction=True)
+        save_job(pipe, job_id, job_data, 3600)  # TTL: 1 hora
+        index_user_job(pipe, username, projeto, job_id)
+        track_jobs(pipe, job_id, job_id)
         
         # Adicionar à fila do módulo inicial
-        queue_name = f"queue:{start_module}"
-        self.redis_client.rpush(queue_name, job_id)
+        enqueue_job(pipe, start_module, job_id, queue_owner(username, projeto))
+        pipe.execute()
         
         print(f"\n✅ Job {job_id} submetido para {start_module}")
         print(f"   👤 Usuário: {username}")
@@ -104,41 +469,58 @@ class GraphOrchestrator:
         
         return job_id
     
-    def get_job_status(self, job_id: str) -> Optional[Dict]:
-        """Consulta status de um job"""
-        job_json = self.redis_client.get(f"job:{job_id}")
-        if job_json:
-            return json.loads(job_json)
-        return None
+    def get_job_status(self, job_id: str, with_chain: bool = True) -> Optional[Dict]:
+        """
+        Consulta status de um job
+        
+        Args:
+            job_id: Job a consultar
+            with_chain: Incluir execution_chain (False = só o documento do job)
+        """
+        job = load_job(self.job_store, job_id)
+        if job and with_chain:
+            self._attach_chains([job])
+        return job
+    
+    def get_execution_chain(self, job_id: str, offset: int = 0) -> List[Dict]:
+        """
+        Etapas do job a partir de offset (ex: quantas o leitor já viu)
+        sem baixar o documento do job nem as etapas anteriores
+        """
+        job = load_job(self.job_store, job_id)
+        legacy_chain = (job or {}).get('execution_chain', [])
+        if not legacy_chain:
+            return read_chain(self.job_store, job_id, offset)
+        
+        # Job legado: etapas antigas no documento + novas na lista
+        if offset >= len(legacy_chain):
+            return read_chain(self.job_store, job_id, offset - len(legacy_chain))
+        return legacy_chain[offset:] + read_chain(self.job_store, job_id)
+    
+    def _attach_chains(self, jobs: List[Dict]):
+        """Preenche execution_chain de cada job com um único round trip (LRANGE em pipeline)"""
+        pipe = self.job_store.pipeline(transaction=False)
+        for job in jobs:
+            pipe.lrange(f"chain:{job.get('job_id')}", 0, -1)
+        
+        for job, raw_steps in zip(jobs, pipe.execute()):
+            job['execution_chain'] = job.get('execution_chain', []) + [decode_job(raw) for raw in raw_steps]
     
     def get_job_with_branches(self, job_id: str) -> Optional[Dict]:
         """
         Consulta job principal e todas as branches paralelas (recursivamente)
         Consolida execution_chain de todas as branches e sub-branches
         """
-        main_job = self.get_job_status(job_id)
+        main_job = self.get_job_status(job_id, with_chain=False)
         if not main_job:
             return None
         
-        # Função recursiva para buscar todas as branches aninhadas
-        def get_all_child_jobs(parent_id: str) -> list:
-            children = []
-            for key in self.redis_client.scan_iter(match="job:*"):
-                job_data_json = self.redis_client.get(key)
-                if job_data_json:
-                    job_data = json.loads(job_data_json)
-                    
-                    # Se é filho direto deste parent
-                    if job_data.get('parent_job_id') == parent_id:
-                        children.append(job_data)
-                        # Buscar recursivamente os filhos deste job
-                        children.extend(get_all_child_jobs(job_data.get('job_id')))
-            
-            return children
-        
-        # Buscar TODAS as branches recursivamente
+        # Buscar TODAS as branches (e sub-branches) pelo índice do job raiz
+        # O índice é mantido pelo ModuleWorker ao criar cada branch, então o custo
+        # é proporcional às branches DESTE job (e não a todos os jobs do Redis)
         all_jobs = [main_job]
-        branch_jobs = get_all_child_jobs(job_id)
+        branch_jobs = self.get_branch_jobs(job_id)
+        self._attach_chains(all_jobs + branch_jobs)
         
         # Consolidar execution_chain de todos os jobs
         consolidated_chain = []
@@ -148,22 +530,26 @@ class GraphOrchestrator:
         # Ordenar por timestamp
         consolidated_chain.sort(key=lambda x: x.get('timestamp', ''))
         
-        # Verificar status de todas as branches E do job principal
-        main_status = main_job.get('status', 'unknown')
-        all_completed = all(job.get('status') == 'completed' for job in branch_jobs)
-        any_failed = any(job.get('status') == 'failed' for job in branch_jobs)
-        
-        # Determinar status consolidado
-        if branch_jobs:
-            if any_failed:
-                consolidated_status = 'partial_failure'
-            elif all_completed and main_status == 'completed':
-                # Só considera completo quando TODAS as branches E o job principal completaram
-                consolidated_status = 'completed'
-            else:
-                consolidated_status = 'processing_branches'
+        if main_job.get('tree_tracked'):
+            # Contadores da árvore (O(1)) - não depende de ler o status de cada branch
+            consolidated_status = self.get_tree_status(job_id, main_job)['consolidated_status']
         else:
-            consolidated_status = main_status
+            # Job legado (sem outstanding:*): verificar status de todas as branches E do job principal
+            main_status = main_job.get('status', 'unknown')
+            all_completed = all(job.get('status') == 'completed' for job in branch_jobs)
+            any_failed = any(job.get('status') == 'failed' for job in branch_jobs)
+            
+            # Determinar status consolidado
+            if branch_jobs:
+                if any_failed:
+                    consolidated_status = 'partial_failure'
+                elif all_completed and main_status == 'completed':
+                    # Só considera completo quando TODAS as branches E o job principal completaram
+                    consolidated_status = 'completed'
+                else:
+                    consolidated_status = 'processing_branches'
+            else:
+                consolidated_status = main_status
         
         # Criar job consolidado
         result = main_job.copy()
@@ -182,14 +568,293 @@ class GraphOrchestrator:
         
         return result
     
-    def list_queues(self) -> Dict[str, int]:
-        """Lista tamanho de todas as filas"""
-        queues = {}
-        for module in self.connections.keys():
-            queue_name = f"queue:{module}"
-            size = self.redis_client.llen(queue_name)
-            queues[module] = size
-        return queues
+    def get_tree_status(self, root_job_id: str, root_job: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
+        """
+        Status consolidado da árvore do job em O(1): um GET do job raiz e um
+        pipeline de SCARD (outstanding, failed_branches, children)
+        
+        Returns:
+            {'job_id', 'status', 'consolidated_status', 'branches_count', 'outstanding'}
+            ou None se o job raiz não existe
+        """
+        root_job = root_job or load_job(self.job_store, root_job_id)
+        if not root_job:
+            return None
+        if not root_job.get('tree_tracked'):
+            # Job legado: consolidar lendo as branches
+            legacy = self.get_job_with_branches(root_job_id)
+            return {
+                'job_id': root_job_id,
+                'status': legacy['status'],
+                'consolidated_status': legacy['consolidated_status'],
+                'branches_count': legacy['branches_count'],
+                'outstanding': None
+            }
+        
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.scard(outstanding_key(root_job_id))
+        pipe.scard(f"failed_branches:{root_job_id}")
+        pipe.scard(f"children:{root_job_id}")
+        outstanding, failed, branches = pipe.execute()
+        
+        main_status = root_job.get('status', 'unknown')
+        if not branches:
+            consolidated_status = main_status
+        elif failed:
+            consolidated_status = 'partial_failure'
+        elif outstanding == 0:
+            # Raiz e TODAS as branches terminaram
+            consolidated_status = 'completed'
+        else:
+            consolidated_status = 'processing_branches'
+        
+        return {
+            'job_id': root_job_id,
+            'status': main_status,
+            'consolidated_status': consolidated_status,
+            'branches_count': branches,
+            'outstanding': outstanding
+        }
+    
+    def resume_waiting_job(self, module: str, username: str, projeto: str) -> Optional[str]:
+        """
+        Re-enfileira o job estacionado aguardando input do usuário neste módulo
+        (chamado depois que a resposta foi gravada no Redis)
+        
+        Returns:
+            job_id retomado ou None se não havia job aguardando
+        """
+        waiting_key = f"waiting:{module}:{username}:{projeto}"
+        job_id = self.redis_client.get(waiting_key)
+        if not job_id:
+            return None
+        
+        # ZREM é o "lock": só quem remove o prazo re-enfileira (evita duplicar com o timeout)
+        if not self.redis_client.zrem(f"waiting_deadlines:{module}", job_id):
+            return None
+        
+        self.redis_client.delete(waiting_key)
+        # Continuação interativa: o usuário está esperando - passa na frente na fila
+        enqueue_job(self.redis_client, module, job_id, queue_owner(username, projeto), priority='high')
+        print(f"▶️  Job {job_id[:8]}... retomado em {module} (input do usuário recebido)")
+        return job_id
+    
+    def cancel_speculations(self, jobs: List[Dict], reason: str) -> int:
+        """
+        Descarta o SQL especulativo (speculation.py) das árvores destes jobs e
+        para a query do Athena em andamento
+        
+        Returns:
+            Número de especulações canceladas
+        """
+        from agents.graph_orchestrator.speculation import speculation_enabled, cancel_speculation  # speculation.py importa este módulo
+        if not speculation_enabled():
+            return 0
+        
+        root_job_ids = {job.get('root_job_id') or job['job_id'] for job in jobs}
+        return sum(cancel_speculation(self.redis_client, root_job_id, reason) for root_job_id in root_job_ids)
+    
+    def get_user_jobs(self, username: str, projeto: str, job_ids: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Jobs (raiz e branches) do usuário/projeto via índice user_jobs:{username}:{projeto}
+        Custo proporcional aos jobs DESTE usuário (um SMEMBERS + um MGET)
+        """
+        if job_ids is None:
+            job_ids = list(self.redis_client.smembers(user_jobs_key(username, projeto)))
+        if not job_ids:
+            return []
+        
+        jobs = []
+        for job_json in self.job_store.mget([f"job:{job_id}" for job_id in job_ids]):
+            if not job_json:
+                continue  # Job expirou
+            try:
+                jobs.append(decode_job(job_json))
+            except ValueError:
+                continue
+        return jobs
+    
+    def remove_jobs_from_queues(self, jobs: List[Dict]) -> int:
+        """
+        Remove os jobs da fila onde estão aguardando (LREM em queue:{current_module}
+        e nas sub-filas do dono) sem esvaziar/recriar a fila - os demais jobs
+        mantêm a posição
+        
+        No transporte stream as mensagens ficam no stream: os jobs são descartados
+        pelo worker via cancelled_jobs / status cancelled.
+        
+        Returns:
+            Número de entradas removidas
+        """
+        if QUEUE_TRANSPORT != 'list':
+            return 0
+        
+        pipe = self.redis_client.pipeline(transaction=False)
+        queued = []
+        for job in jobs:
+            if job.get('status') in ['completed', 'failed'] or not job.get('current_module'):
+                continue
+            module = job['current_module']
+            pipe.lrem(f"queue:{module}", 0, job['job_id'])
+            for subqueue in user_queue_keys(module, job.get('username', 'unknown'), job.get('projeto', 'default')):
+                pipe.lrem(subqueue, 0, job['job_id'])
+            queued.append(module)
+        
+        results = iter(pipe.execute())
+        removed = 0
+        removed_fair = {}
+        for module in queued:
+            removed += next(results)
+            fair = sum(next(results) for _ in QUEUE_PRIORITIES)
+            removed += fair
+            removed_fair[module] = removed_fair.get(module, 0) + fair
+        
+        # Uma ficha por job tirado das sub-filas (o dono vazio sai do anel no próximo dequeue)
+        for module, count in removed_fair.items():
+            if count:
+                self.redis_client.ltrim(f"queue_ready:{module}", count, -1)
+        if removed:
+            print(f"[CLEANUP] 🗑️  {removed} job(s) removidos das filas")
+        return removed
+    
+    def get_branch_jobs(self, root_job_id: str) -> List[Dict]:
+        """
+        Retorna todas as branches (diretas e aninhadas) de um job raiz
+        usando o índice children:{root_job_id} (um único SMEMBERS + MGET)
+        """
+        branch_ids = self.redis_client.smembers(f"children:{root_job_id}")
+        if not branch_ids:
+            return []
+        
+        branch_ids = list(branch_ids)
+        branch_jobs = []
+        for job_json in self.job_store.mget([f"job:{branch_id}" for branch_id in branch_ids]):
+            if not job_json:
+                continue  # Branch expirou/foi deletada
+            try:
+                branch_jobs.append(decode_job(job_json))
+            except ValueError:
+                continue  # Valor corrompido: não derrubar o status da árvore
+        
+        return branch_jobs
+    
+    def read_job_events(self, root_job_id: str, last_event_id: str = '0', block_ms: int = 5000) -> List[tuple]:
+        """
+        Lê eventos novos do stream do job (bloqueia até block_ms se não houver)
+        
+        Args:
+            root_job_id: Job raiz monitorado
+            last_event_id: Último ID já consumido ('0' = desde o início)
+            block_ms: Tempo máximo de bloqueio em milissegundos
+            
+        Returns:
+            Lista de (event_id, event_type, payload)
+        """
+        result = self.redis_client.xread({f"job_events:{root_job_id}": last_event_id}, block=block_ms)
+        return [parse_job_event(event_id, fields) for _, entries in result or [] for event_id, fields in entries]
+    
+    def get_result_page(self, results_ref: str, owner: str, page: int = 1, page_size: int = 20) -> Optional[Dict[str, Any]]:
+        """
+        Página de um resultado gravado por claim-check (results_full_ref / blob:*)
+        
+        Args:
+            results_ref: Chave do blob (blob:{sha256})
+            owner: queue_owner(username, projeto) de quem pede - precisa estar
+                   entre os donos registrados por store_blob
+            page: Página (começa em 1)
+            page_size: Linhas por página
+            
+        Returns:
+            {'rows', 'page', 'page_size', 'row_count', 'has_more'} ou None se o
+            blob expirou ou não pertence a owner
+        """
+        if not results_ref or not results_ref.startswith('blob:'):
+            return None
+        if not self.redis_client.sismember(blob_owners_key(results_ref), owner):
+            return None
+        
+        rows = load_blob(self.redis_client, results_ref)
+        if rows is None:
+            return None
+        
+        start = (page - 1) * page_size
+        return {
+            'rows': rows[start:start + page_size],
+            'page': page,
+            'page_size': page_size,
+            'row_count': len(rows),
+            'has_more': start + page_size < len(rows)
+        }
+    
+    def list_queues(self, modules: Optional[List[str]] = None) -> Dict[str, int]:
+        """
+        Lista tamanho de todas as filas (jobs aguardando um worker)
+        
+        Args:
+            modules: Módulos a consultar (padrão: os nós de GRAPH_CONNECTIONS)
+        """
+        if QUEUE_TRANSPORT == 'stream':
+            return {module: metrics['lag'] + metrics['pending'] for module, metrics in self.queue_metrics(modules).items()}
+        
+        modules = list(modules or self.connections.keys())
+        pipe = self.redis_client.pipeline(transaction=False)
+        for module in modules:
+            pipe.llen(f"queue:{module}")
+            # Escalonamento fair: uma ficha por job nas sub-filas
+            pipe.llen(f"queue_ready:{module}")
+        sizes = pipe.execute()
+        return {module: sizes[2 * i] + sizes[2 * i + 1] for i, module in enumerate(modules)}
+    
+    def processing_times(self, modules: List[str]) -> Dict[str, Optional[float]]:
+        """
+        Tempo médio de processamento recente por módulo (últimas
+        PROCESSING_TIME_SAMPLES execuções) - None se ainda não há amostras
+        """
+        pipe = self.redis_client.pipeline(transaction=False)
+        for module in modules:
+            pipe.lrange(f"processing_times:{module}", 0, -1)
+        
+        averages = {}
+        for module, samples in zip(modules, pipe.execute()):
+            values = [float(sample) for sample in samples]
+            averages[module] = sum(values) / len(values) if values else None
+        return averages
+    
+    def queue_metrics(self, modules: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+        """
+        Métricas por módulo no transporte stream (XINFO GROUPS)
+        
+        Args:
+            modules: Módulos a consultar (padrão: os nós de GRAPH_CONNECTIONS)
+        
+        Returns:
+            {module: {'length', 'lag', 'pending', 'consumers'}}
+            - lag: entradas ainda não entregues a nenhum worker
+            - pending: entregues mas ainda sem ack (em processamento ou órfãs)
+        """
+        metrics = {}
+        for module in modules or self.connections.keys():
+            stream_key = f"stream:{module}"
+            module_metrics = {'length': 0, 'lag': 0, 'pending': 0, 'consumers': 0}
+            
+            try:
+                module_metrics['length'] = self.redis_client.xlen(stream_key)
+                # Sem consumer group ainda (nenhum worker subiu): tudo está atrasado
+                module_metrics['lag'] = module_metrics['length']
+                for group in self.redis_client.xinfo_groups(stream_key):
+                    if group.get('name') != STREAM_GROUP:
+                        continue
+                    lag = group.get('lag')
+                    # lag é None quando o Redis não consegue calcular (stream trimado)
+                    module_metrics['lag'] = lag if lag is not None else module_metrics['length']
+                    module_metrics['pending'] = group.get('pending', 0)
+                    module_metrics['consumers'] = group.get('consumers', 0)
+            except redis.ResponseError:
+                # Stream ainda não existe (nenhum job depositado)
+                pass
+            
+            metrics[module] = module_metrics
+        return metrics
     
     def cleanup_user_session(self, username: str, projeto: str) -> Dict[str, Any]:
         """
@@ -220,156 +885,60 @@ class GraphOrchestrator:
             'queue_jobs_removed': 0
         }
         
-        # 1. BUSCAR E DELETAR **TODOS** OS JOBS DO USUÁRIO (qualquer status)
+        # 1. JOBS DO USUÁRIO (índice user_jobs:{username}:{projeto} - sem varrer job:*)
         print(f"\n[CLEANUP] 🔍 Buscando TODOS os jobs de {username}/{projeto}...")
+        index_key = user_jobs_key(username, projeto)
+        job_ids = list(self.redis_client.smembers(index_key))
+        user_jobs = self.get_user_jobs(username, projeto, job_ids)
         
-        job_pattern = "job:*"
-        deleted_job_ids = []  # Para deletar parent/child jobs depois
-        
-        for job_key in self.redis_client.scan_iter(match=job_pattern):
-            try:
-                job_data_raw = self.redis_client.get(job_key)
-                if not job_data_raw:
-                    continue
-                    
-                job_data = json.loads(job_data_raw)
-                
-                # Verificar se o job pertence ao usuário/projeto (QUALQUER STATUS)
-                if (job_data.get('username') == username and 
-                    job_data.get('projeto') == projeto):
-                    
-                    job_id = job_data.get('job_id')
-                    status = job_data.get('status', 'unknown')
-                    print(f"[CLEANUP] 🗑️  Deletando job {status}: {job_id[:8]}...")
-                    
-                    # Guardar job_id para limpar relacionados depois
-                    deleted_job_ids.append(job_id)
-                    
-                    # Deletar o job
-                    self.redis_client.delete(job_key)
-                    stats['jobs_deleted'] += 1
-                    
-                    # Deletar branches deste job
-                    branch_pattern = f"job:{job_id}:branch:*"
-                    for branch_key in self.redis_client.scan_iter(match=branch_pattern):
-                        self.redis_client.delete(branch_key)
-                        stats['branches_deleted'] += 1
-                        print(f"[CLEANUP] 🗑️  Deletando branch: {branch_key}")
-            
-            except (json.JSONDecodeError, TypeError) as e:
-                continue
-        
-        # Deletar jobs que tenham parent_job_id de algum job deletado
-        if deleted_job_ids:
-            print(f"\n[CLEANUP] 🧹 Limpando jobs filhos (parent_job_id)...")
-            for job_key in self.redis_client.scan_iter(match=job_pattern):
-                try:
-                    job_data_raw = self.redis_client.get(job_key)
-                    if not job_data_raw:
-                        continue
-                    job_data = json.loads(job_data_raw)
-                    parent_id = job_data.get('parent_job_id')
-                    if parent_id in deleted_job_ids:
-                        print(f"[CLEANUP] 🗑️  Deletando job filho: {job_data.get('job_id', '')[:8]}...")
-                        self.redis_client.delete(job_key)
-                        stats['jobs_deleted'] += 1
-                except:
-                    continue
-        
-        # 2. DELETAR CHAVES PENDENTES DE INPUT
-        print(f"\n[CLEANUP] 🔑 Limpando chaves pendentes...")
-        pending_patterns = [
-            f"plan_confirm:*:{username}:{projeto}",
-            f"user_feedback:*:{username}:{projeto}",
-            f"user_proposed_plan:*:{username}:{projeto}",
-        ]
-        
-        for pattern in pending_patterns:
-            for key in self.redis_client.scan_iter(match=pattern):
-                self.redis_client.delete(key)
-                stats['pending_keys_deleted'] += 1
-                print(f"[CLEANUP] 🗑️  Deletando chave: {key}")
-        
-        # 3. DELETAR HISTÓRICO/MEMÓRIA NO REDIS
-        print(f"\n[CLEANUP] 💾 Limpando histórico/memória...")
-        memory_patterns = [
-            f"history:{username}:{projeto}",
-            f"memory:{username}:{projeto}",
-            f"context:{username}:{projeto}",
-            f"chat_history:{username}:{projeto}",
-        ]
-        
-        for pattern in memory_patterns:
-            for key in self.redis_client.scan_iter(match=pattern):
-                self.redis_client.delete(key)
-                stats['memory_keys_deleted'] += 1
-                print(f"[CLEANUP] 🗑️  Deletando memória: {key}")
-        
-        # 4. MARCAR JOBS PARA CANCELAMENTO (jobs em processamento)
-        print(f"\n[CLEANUP] 🚫 Marcando jobs em processamento para cancelamento...")
-        # Criar chave de cancelamento que os workers irão verificar
+        # 2. MARCAR JOBS ATIVOS PARA CANCELAMENTO (worker que já pegou o job pula o resto)
         cancel_key = f"cancelled_jobs:{username}:{projeto}"
-        
-        # Buscar todos os jobs do usuário e adicionar seus IDs à lista de cancelamento
-        job_pattern = "job:*"
-        cancelled_job_ids = []
-        for job_key in self.redis_client.scan_iter(match=job_pattern):
-            try:
-                job_data = json.loads(self.redis_client.get(job_key))
-                if (job_data.get('username') == username and 
-                    job_data.get('projeto') == projeto and
-                    job_data.get('status') in ['pending', 'processing']):
-                    job_id = job_data.get('job_id')
-                    cancelled_job_ids.append(job_id)
-                    print(f"[CLEANUP] 🚫 Marcando job para cancelamento: {job_id}")
-            except:
-                continue
-        
-        # Salvar lista de jobs cancelados no Redis (expira em 60s)
+        cancelled_job_ids = [
+            job['job_id'] for job in user_jobs
+            if job.get('status') in ['pending', 'processing', WAITING_INPUT_STATUS]
+        ]
         if cancelled_job_ids:
             self.redis_client.sadd(cancel_key, *cancelled_job_ids)
             self.redis_client.expire(cancel_key, 60)
             print(f"[CLEANUP] 🚫 {len(cancelled_job_ids)} jobs marcados para cancelamento")
         
-        # 5. REMOVER JOBS DAS FILAS (previne processamento de jobs antigos)
+        # SQL especulativo da árvore (plan_confirm estacionado vai ser apagado e não volta para descartar)
+        self.cancel_speculations(user_jobs, 'sessão encerrada')
+        
+        # 3. REMOVER JOBS DAS FILAS (LREM - jobs de outros usuários não mudam de posição)
         print(f"\n[CLEANUP] 📮 Limpando filas...")
-        for module in self.connections.keys():
-            queue_name = f"queue:{module}"
-            queue_length = self.redis_client.llen(queue_name)
-            
-            if queue_length > 0:
-                # Processar cada job na fila
-                temp_jobs = []
-                for _ in range(queue_length):
-                    job_id = self.redis_client.lpop(queue_name)
-                    if job_id:
-                        # Verificar se o job pertence ao usuário
-                        job_key = f"job:{job_id}"
-                        job_data_raw = self.redis_client.get(job_key)
-                        
-                        if job_data_raw:
-                            try:
-                                job_data = json.loads(job_data_raw)
-                                if (job_data.get('username') != username or 
-                                    job_data.get('projeto') != projeto):
-                                    # Manter jobs de outros usuários
-                                    temp_jobs.append(job_id)
-                                else:
-                                    stats['queue_jobs_removed'] += 1
-                                    print(f"[CLEANUP] 🗑️  Removendo job da fila {queue_name}: {job_id}")
-                            except json.JSONDecodeError:
-                                temp_jobs.append(job_id)
-                
-                # Re-adicionar jobs que não são do usuário
-                for job_id in temp_jobs:
-                    self.redis_client.rpush(queue_name, job_id)
+        stats['queue_jobs_removed'] = self.remove_jobs_from_queues(user_jobs)
+        
+        # 4. DELETAR JOBS (qualquer status) e branches
+        pipe = self.redis_client.pipeline(transaction=False)
+        for job in user_jobs:
+            print(f"[CLEANUP] 🗑️  Deletando job {job.get('status', 'unknown')}: {job['job_id'][:8]}...")
+            if job.get('parent_job_id'):
+                stats['branches_deleted'] += 1
+            else:
+                stats['jobs_deleted'] += 1
+            if job.get('waiting_module'):
+                pipe.zrem(f"waiting_deadlines:{job['waiting_module']}", job['job_id'])
         
-        # 5. LIMPEZA EXTRA: Remover jobs antigos completados/falhados
-        print(f"\n[CLEANUP] 🧹 Limpando jobs antigos completados/falhados...")
-        old_jobs_deleted = self.cleanup_old_jobs(max_age_minutes=5)
-        stats['old_jobs_deleted'] = old_jobs_deleted
+        for job_id in job_ids:
+            # Também para ids cujo job já expirou (etapas/eventos podem ter sobrado)
+            pipe.delete(
+                f"job:{job_id}", f"chain:{job_id}", f"children:{job_id}", f"job_events:{job_id}",
+                outstanding_key(job_id), f"failed_branches:{job_id}"
+            )
+        pipe.delete(index_key)
+        
+        pipe.execute()
+        
+        # Chaves pendentes (HITL) e histórico/memória: nomes exatos, DEL direto
+        print(f"\n[CLEANUP] 🔑 Limpando chaves pendentes e histórico/memória...")
+        stats['pending_keys_deleted'] = self.redis_client.delete(*user_pending_keys(username, projeto))
+        stats['memory_keys_deleted'] = self.redis_client.delete(*user_memory_keys(username, projeto))
         
-        # 6. RESUMO
+        # Jobs antigos de TODOS os usuários não são mais varridos aqui:
+        # o janitor (janitor.py) expira finished_jobs em segundo plano
+        
+        # 5. RESUMO
         print(f"\n{'='*80}")
         print(f"✅ LIMPEZA CONCLUÍDA - {username}/{projeto}")
         print(f"{'='*80}")
@@ -379,52 +948,72 @@ class GraphOrchestrator:
         print(f"   🗑️  Chaves pendentes deletadas: {stats['pending_keys_deleted']}")
         print(f"   🗑️  Memória/histórico deletado: {stats['memory_keys_deleted']}")
         print(f"   🗑️  Jobs removidos das filas: {stats['queue_jobs_removed']}")
-        print(f"   🗑️  Jobs antigos deletados: {stats['old_jobs_deleted']}")
         print(f"{'='*80}\n")
         
         return stats
     
-    def cleanup_old_jobs(self, max_age_minutes: int = 10) -> int:
+    def cleanup_old_jobs(self, max_age_minutes: int = 10, batch_size: int = 500) -> int:
         """
-        Remove jobs completados/falhados mais antigos que max_age_minutes.
-        Útil para evitar acúmulo de jobs antigos no Redis.
+        Remove um lote de jobs completados/falhados/cancelados mais antigos que
+        max_age_minutes, lidos do zset finished_jobs (ZRANGEBYSCORE) - sem varrer job:*
+        
+        Para cada job: apaga job/chain, tira do índice do usuário e do
+        cancelled_jobs:{username}:{projeto} e, se ele morreu aguardando input,
+        apaga as chaves pendentes (HITL) que ficaram órfãs.
+        Chamado pelo janitor (janitor.py) em loop até o lote vir incompleto.
         
         Args:
             max_age_minutes: Idade máxima dos jobs em minutos (padrão: 10)
+            batch_size: Máximo de jobs removidos nesta chamada
             
         Returns:
             Número de jobs deletados
         """
-        from datetime import datetime, timedelta
-        
-        deleted_count = 0
-        cutoff_time = datetime.now() - timedelta(minutes=max_age_minutes)
+        cutoff = time.time() - max_age_minutes * 60
+        members = self.redis_client.zrangebyscore(FINISHED_JOBS_KEY, '-inf', cutoff, start=0, num=batch_size)
+        if not members:
+            return 0
         
-        print(f"\n🧹 Limpando jobs mais antigos que {max_age_minutes} minutos...")
-        
-        job_pattern = "job:*"
-        for job_key in self.redis_client.scan_iter(match=job_pattern):
+        entries = []
+        for member in members:
             try:
-                job_data = json.loads(self.redis_client.get(job_key))
-                status = job_data.get('status')
-                
-                # Só deletar jobs completados ou falhados
-                if status in ['completed', 'failed', 'cancelled']:
-                    # Verificar timestamp
-                    completed_at = job_data.get('completed_at') or job_data.get('failed_at')
-                    if completed_at:
-                        job_time = datetime.fromisoformat(completed_at)
-                        if job_time < cutoff_time:
-                            self.redis_client.delete(job_key)
-                            deleted_count += 1
-                            
+                job_id, username, projeto, waiting_module = json.loads(member)
             except (json.JSONDecodeError, TypeError, ValueError):
-                continue
+                job_id = username = projeto = waiting_module = None  # Membro inválido: só sai do zset
+            entries.append((member, job_id, username, projeto, waiting_module))
+        
+        # Chaves de espera de jobs que morreram aguardando input: só apagar as
+        # pendentes se o waiting:* ainda for deste job (ou já tiver expirado)
+        waiting_entries = [e for e in entries if e[1] and e[4]]
+        waiting_owners = self.redis_client.mget(
+            [f"waiting:{e[4]}:{e[2]}:{e[3]}" for e in waiting_entries]
+        ) if waiting_entries else []
+        orphan_waits = [
+            e for e, owner in zip(waiting_entries, waiting_owners)
+            if owner is None or owner == e[1]
+        ]
+        
+        pipe = self.redis_client.pipeline(transaction=False)
+        for member, job_id, username, projeto, _ in entries:
+            if job_id:
+                pipe.delete(f"job:{job_id}", f"chain:{job_id}")
+                pipe.srem(user_jobs_key(username, projeto), job_id)
+                pipe.srem(f"cancelled_jobs:{username}:{projeto}", job_id)
+            pipe.zrem(FINISHED_JOBS_KEY, member)
         
+        for _, job_id, username, projeto, waiting_module in orphan_waits:
+            pipe.delete(
+                f"{waiting_module}:pending:{username}:{projeto}",
+                f"{waiting_module}:response:{username}:{projeto}",
+                f"waiting:{waiting_module}:{username}:{projeto}"
+            )
+            pipe.zrem(f"waiting_deadlines:{waiting_module}", job_id)
+        
+        pipe.execute()
+        
+        deleted_count = sum(1 for e in entries if e[1])
         if deleted_count > 0:
-            print(f"✅ {deleted_count} jobs antigos deletados")
-        else:
-            print(f"✅ Nenhum job antigo para deletar")
+            print(f"🧹 {deleted_count} jobs antigos deletados (> {max_age_minutes} min)")
         
         return deleted_count
     
@@ -463,14 +1052,166 @@ class ModuleWorker:
     """
     Worker base que processa jobs de uma fila específica
     Cada módulo deve herdar desta classe
+    
+    Concorrência: por padrão processa 1 job por vez. Com WORKER_CONCURRENCY
+    (ou {MODULO}_CONCURRENCY, ex: PLAN_BUILDER_CONCURRENCY=8) o worker executa
+    até N jobs simultâneos em um pool de threads - útil porque quase todo o
+    tempo é espera de I/O (OpenAI, Athena, PostgreSQL). O process() da
+    subclasse precisa ser thread-safe para N > 1.
     """
     
-    def __init__(self, module_name: str):
+    def __init__(self, module_name: str, concurrency: Optional[int] = None):
         self.module_name = module_name
         self.redis_client = Redis(**REDIS_CONFIG)
+        self.job_store = Redis(**JOB_STORE_CONFIG)
         self.queue_name = f"queue:{module_name}"
+        self.stream_name = f"stream:{module_name}"
+        self.ready_name = f"queue_ready:{module_name}"
+        self.consumer_name = f"{socket.gethostname()}-{os.getpid()}"
         self.connections = GRAPH_CONNECTIONS
+        # Nó de junção: origens das branches que ele espera (GRAPH_JOINS)
+        self.join_sources = GRAPH_JOINS.get(module_name, [])
         self.running = False
+        
+        # Máximo de jobs em execução simultânea neste processo
+        if concurrency is None:
+            concurrency = int(os.getenv(
+                f"{module_name.upper()}_CONCURRENCY",
+                os.getenv('WORKER_CONCURRENCY', 1)
+            ))
+        self.concurrency = max(1, concurrency)
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._executor = None
+        self._last_wait_check = 0.0
+        
+        # Modo replay: saídas gravadas no lugar do process()
+        self.replay = None
+        if REPLAY_RECORDING:
+            from agents.graph_orchestrator.replay import ReplayPlayer
+            self.replay = ReplayPlayer.load(REPLAY_RECORDING, self.redis_client, REPLAY_LATENCY_SCALE)
+    
+    def wait_for_input(self, timeout: int = 300, input_needed: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Retorno de process() que estaciona o job até o usuário responder
+        
+        O worker é liberado imediatamente. O job volta para a fila deste módulo
+        quando a resposta chega (GraphOrchestrator.resume_waiting_job) ou quando
+        o prazo expira; nessa nova execução data['_wait'] vem preenchido com
+        {'since', 'deadline', 'expired'}.
+        
+        Args:
+            input_needed: Payload do evento 'input_needed' - publicado por
+                          _park_job só DEPOIS que waiting:* está gravado (se o
+                          process() publicasse, uma resposta rápida chegaria
+                          antes do job estar estacionado e ficaria sem retomada)
+        """
+        return {'_wait_for_input': {'timeout': timeout, 'input_needed': input_needed}}
+    
+    def _begin_transition(self, message_id: Optional[str] = None):
+        """
+        Abre um pipeline MULTI/EXEC para uma transição de estado do job
+        
+        Tudo que a transição grava (job, filas, branches, índices e o ack da
+        mensagem do stream) vai em UM round trip e é aplicado de uma vez:
+        se o worker cair antes do execute(), nada foi aplicado e a mensagem
+        continua pendente para ser reivindicada.
+        """
+        pipe = self.job_store.pipeline(transaction=True)
+        if message_id:
+            pipe.xack(self.stream_name, STREAM_GROUP, message_id)
+        return pipe
+    
+    def _park_job(self, job_id: str, job_data: Dict, wait_request: Dict[str, Any], pipe=None):
+        """Estaciona o job aguardando input do usuário (status waiting_input)"""
+        timeout = wait_request.get('timeout', 300)
+        deadline = time.time() + timeout
+        username = job_data.get('username', 'unknown')
+        projeto = job_data.get('projeto', 'default')
+        
+        # Em uma re-espera (retomada sem resposta) manter o início original
+        if job_data.get('waiting_module') != self.module_name or not job_data.get('waiting_since'):
+            job_data['waiting_since'] = time.time()
+        job_data['status'] = WAITING_INPUT_STATUS
+        job_data['waiting_module'] = self.module_name
+        job_data['wait_deadline'] = deadline
+        job_data['current_module'] = self.module_name
+        
+        pipe = pipe if pipe is not None else self._begin_transition()
+        save_job(pipe, job_id, job_data, 3600)
+        pipe.set(f"waiting:{self.module_name}:{username}:{projeto}", job_id, ex=timeout + 60)
+        pipe.zadd(f"waiting_deadlines:{self.module_name}", {job_id: deadline})
+        pipe.execute()
+        
+        print(f"   ⏸️  Job {job_id[:8]}... estacionado aguardando input (máx {timeout}s) - worker liberado")
+        
+        # Só agora o navegador pode responder: resume_waiting_job já encontra o job
+        if wait_request.get('input_needed'):
+            self.publish_event(job_data.get('root_job_id') or job_id, 'input_needed', wait_request['input_needed'])
+        
+        # Resposta gravada antes do estacionamento (re-espera, resposta por outro caminho): retomar já
+        if self.redis_client.exists(f"{self.module_name}:response:{username}:{projeto}"):
+            if self.redis_client.zrem(f"waiting_deadlines:{self.module_name}", job_id):
+                self.redis_client.delete(f"waiting:{self.module_name}:{username}:{projeto}")
+                enqueue_job(self.redis_client, self.module_name, job_id, queue_owner(username, projeto), priority='high')
+                print(f"   ▶️  Resposta já estava no Redis - job {job_id[:8]}... retomado")
+    
+    def _resume_expired_waits(self):
+        """Re-enfileira jobs deste módulo cujo prazo de espera por input expirou"""
+        deadlines_key = f"waiting_deadlines:{self.module_name}"
+        expired = self.redis_client.zrangebyscore(deadlines_key, 0, time.time(), start=0, num=50)
+        
+        for job_id in expired:
+            # ZREM é o "lock": só um worker (ou o resume do websocket) re-enfileira
+            if self.redis_client.zrem(deadlines_key, job_id):
+                job_data = load_job(self.job_store, job_id) or {}
+                owner = queue_owner(job_data.get('username', 'unknown'), job_data.get('projeto', 'default'))
+                enqueue_job(self.redis_client, self.module_name, job_id, owner, priority='high')
+                print(f"   ⏱️  Prazo de input expirado - job {job_id[:8]}... re-enfileirado")
+    
+    def _maybe_resume_expired_waits(self):
+        """Chama _resume_expired_waits no máximo a cada WAIT_EXPIRY_CHECK_INTERVAL segundos"""
+        now = time.time()
+        if now - self._last_wait_check < WAIT_EXPIRY_CHECK_INTERVAL:
+            return
+        self._last_wait_check = now
+        try:
+            self._resume_expired_waits()
+        except Exception as e:
+            print(f"   ⚠️  Erro ao verificar prazos de input: {e}")
+    
+    def offload_results(self, output: Dict[str, Any], owner: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Claim-check: troca results_full por results_full_ref quando o resultado
+        passa de RESULT_BLOB_MIN_ROWS linhas (results_preview continua inline)
+        
+        Args:
+            owner: queue_owner(username, projeto) do job - quem pode paginar o blob
+        """
+        rows = output.get('results_full')
+        if rows and len(rows) > RESULT_BLOB_MIN_ROWS:
+            output['results_full_ref'] = store_blob(self.redis_client, rows, owner=owner)
+            del output['results_full']
+            print(f"   📦 results_full ({len(rows)} linhas) gravado em {output['results_full_ref'][:20]}...")
+        return output
+    
+    def resolve_results(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Retorna cópia rasa de data com results_full carregado do blob
+        (não altera o data do job, que continua só com a referência)
+        """
+        blob_key = data.get('results_full_ref')
+        if not blob_key or data.get('results_full'):
+            return data
+        
+        rows = load_blob(self.redis_client, blob_key)
+        if rows is None:
+            print(f"   ⚠️  Blob {blob_key[:20]}... expirou - usando results_preview")
+            rows = data.get('results_preview', [])
+        return {**data, 'results_full': rows}
+    
+    def publish_event(self, root_job_id: str, event_type: str, payload: Dict[str, Any]):
+        """Publica evento de progresso no stream do job raiz (ver publish_job_event)"""
+        publish_job_event(self.redis_client, root_job_id, event_type, payload)
     
     def is_job_cancelled(self, job_id: str, username: str, projeto: str) -> bool:
         """
@@ -484,14 +1225,17 @@ class ModuleWorker:
             print(f"[{self.module_name}] 🚫 Job {job_id[:8]}... foi CANCELADO - Pulando processamento")
             # Atualizar status do job para cancelled
             job_key = f"job:{job_id}"
-            job_data_raw = self.redis_client.get(job_key)
+            job_data_raw = self.job_store.get(job_key)
             if job_data_raw:
                 try:
-                    job_data = json.loads(job_data_raw)
+                    job_data = decode_job(job_data_raw)
                     job_data['status'] = 'cancelled'
                     job_data['cancelled_at'] = datetime.now().isoformat()
                     job_data['cancelled_reason'] = 'User logout/refresh'
-                    self.redis_client.setex(job_key, 60, json.dumps(job_data))
+                    pipe = self.job_store.pipeline(transaction=True)
+                    save_job(pipe, job_id, job_data, 60)
+                    mark_finished(pipe, job_data)
+                    pipe.execute()
                 except:
                     pass
         
@@ -501,20 +1245,88 @@ class ModuleWorker:
         """Inicia o worker (loop infinito processando fila)"""
         self.running = True
         print(f"\n🚀 Worker {self.module_name} iniciado")
-        print(f"   📮 Consumindo fila: {self.queue_name}")
+        if QUEUE_TRANSPORT == 'stream':
+            print(f"   📮 Consumindo stream: {self.stream_name} (grupo {STREAM_GROUP}, consumer {self.consumer_name})")
+        elif QUEUE_SCHEDULING == 'fair':
+            print(f"   📮 Consumindo fila: {self.queue_name} (fair: sub-filas por usuário/projeto, prioridades {'/'.join(QUEUE_PRIORITIES)})")
+        else:
+            print(f"   📮 Consumindo fila: {self.queue_name}")
         print(f"   ⬇️  Depositará em: {self.connections.get(self.module_name, [])}")
+        print(f"   🧵 Concorrência: {self.concurrency} job(s) simultâneo(s)")
+        if self.replay:
+            print(f"   🎬 REPLAY: saídas gravadas do job {self.replay.recording.get('root_job_id', '?')[:8]}... (latência ×{self.replay.latency_scale})")
         print("   ⏳ Aguardando jobs...\n")
         
+        # SIGTERM (autoscaler/pm2): parar de pegar jobs e terminar os em andamento
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self._handle_stop_signal)
+        
+        if self.concurrency > 1:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.concurrency,
+                thread_name_prefix=f"worker-{self.module_name}"
+            )
+        
+        try:
+            if QUEUE_TRANSPORT == 'stream':
+                self._consume_stream()
+            else:
+                self._consume_list()
+        finally:
+            if self._executor:
+                print(f"   ⏳ Aguardando jobs em andamento terminarem...")
+                self._executor.shutdown(wait=True)
+                self._executor = None
+    
+    def _handle_stop_signal(self, signum, frame):
+        """Drenagem graciosa: o loop de consumo termina e start() espera os jobs em andamento"""
+        print(f"\n⏹️  Worker {self.module_name} recebeu sinal {signum} - drenando jobs em andamento...")
+        self.running = False
+    
+    def _dequeue_fair(self) -> Optional[str]:
+        """Retira o próximo job das sub-filas: prioridade mais alta, dono seguinte no anel"""
+        return self.redis_client.eval(
+            FAIR_DEQUEUE_LUA, len(QUEUE_PRIORITIES),
+            *[f"queue_owners:{self.module_name}:{priority}" for priority in QUEUE_PRIORITIES],
+            *[f"queue:{self.module_name}:{priority}:" for priority in QUEUE_PRIORITIES]
+        )
+    
+    def _consume_list(self):
+        """
+        Loop de consumo no transporte list (BLPOP)
+        
+        Escuta as fichas do escalonamento fair (queue_ready:{module}) e a fila
+        FIFO queue:{module} (QUEUE_SCHEDULING=fifo ou jobs depositados antes da troca)
+        """
         while self.running:
+            slot_acquired = False
             try:
+                self._maybe_resume_expired_waits()
+                
+                # Só retira um job da fila quando há vaga para executá-lo
+                slot_acquired = self._slots.acquire(timeout=1)
+                if not slot_acquired:
+                    continue
+                
                 # Bloqueia até ter um job (timeout 1s)
-                result = self.redis_client.blpop(self.queue_name, timeout=1)
+                result = self.redis_client.blpop([self.ready_name, self.queue_name], timeout=1)
                 
                 if result:
-                    _, job_id_bytes = result
+                    queue_name, job_id_bytes = result
                     # Converter bytes para string se necessário
                     job_id = job_id_bytes.decode('utf-8') if isinstance(job_id_bytes, bytes) else job_id_bytes
-                    self.process_job(job_id)
+                    if queue_name == self.ready_name:
+                        # Ficha: o job vem da sub-fila escolhida pelo escalonador
+                        job_id = self._dequeue_fair()
+                elif QUEUE_SCHEDULING == 'fair':
+                    # Ocioso: recolhe job cuja ficha se perdeu (worker caiu entre BLPOP e dequeue)
+                    job_id = self._dequeue_fair()
+                else:
+                    job_id = None
+                
+                if job_id:
+                    self._dispatch(job_id)
+                    slot_acquired = False  # A vaga agora pertence ao job
                     
             except KeyboardInterrupt:
                 print(f"\n⏹️  Worker {self.module_name} parando...")
@@ -522,34 +1334,225 @@ class ModuleWorker:
             except Exception as e:
                 print(f"❌ Erro no worker: {str(e)}")
                 time.sleep(1)
+            finally:
+                if slot_acquired:
+                    self._slots.release()
+    
+    def _dispatch(self, job_id: str, message_id: Optional[str] = None):
+        """
+        Executa o job inline (concorrência 1) ou no pool de threads
+        A vaga já reservada em self._slots é liberada quando o job termina
+        """
+        if self._executor is None:
+            self._run_job(job_id, message_id)
+        else:
+            self._executor.submit(self._run_job, job_id, message_id)
+    
+    def _run_job(self, job_id: str, message_id: Optional[str] = None):
+        """Processa o job, dá ack (transporte stream) e libera a vaga"""
+        try:
+            acked = self.process_job(job_id, message_id)
+            # Ack só depois de processar: se o worker cair antes, outro reivindica.
+            # Nas transições normais o ack já foi junto no MULTI/EXEC do process_job
+            if message_id and not acked:
+                self.redis_client.xack(self.stream_name, STREAM_GROUP, message_id)
+        except Exception as e:
+            print(f"❌ Erro no worker ao processar job {job_id[:8]}...: {str(e)}")
+        finally:
+            self._slots.release()
     
-    def process_job(self, job_id: str):
-        """Processa um job"""
+    def _ensure_consumer_group(self):
+        """Cria o consumer group do módulo (idempotente)"""
+        try:
+            self.redis_client.xgroup_create(self.stream_name, STREAM_GROUP, id='0', mkstream=True)
+            print(f"   ✓ Consumer group '{STREAM_GROUP}' criado em {self.stream_name}")
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+    
+    def _reclaim_pending(self) -> List[tuple]:
+        """
+        Reivindica mensagens entregues a workers que não deram ack dentro do
+        visibility timeout (worker caiu/foi reiniciado no meio do job)
+        """
+        result = self.redis_client.xautoclaim(
+            self.stream_name,
+            STREAM_GROUP,
+            self.consumer_name,
+            min_idle_time=STREAM_VISIBILITY_TIMEOUT_MS,
+            start_id='0-0',
+            count=10
+        )
+        claimed = [entry for entry in result[1] if entry and entry[1]]
+        
+        entries = []
+        for message_id, fields in claimed:
+            # Descartar mensagens "venenosas" que já derrubaram workers várias vezes
+            pending = self.redis_client.xpending_range(
+                self.stream_name, STREAM_GROUP, min=message_id, max=message_id, count=1
+            )
+            deliveries = pending[0]['times_delivered'] if pending else 1
+            if deliveries > STREAM_MAX_DELIVERIES:
+                job_id = fields.get('job_id', '')
+                print(f"   ☠️  Job {job_id[:8]}... entregue {deliveries}x sem ack - marcando como failed")
+                self._fail_job(job_id, f'Abandonado após {deliveries} entregas sem ack')
+                self.redis_client.xack(self.stream_name, STREAM_GROUP, message_id)
+                continue
+            
+            print(f"   ♻️  Reivindicando job órfão {fields.get('job_id', '')[:8]}... (entrega #{deliveries})")
+            entries.append((message_id, fields))
+        
+        return entries
+    
+    def _fail_job(self, job_id: str, error: str):
+        """Marca um job como failed (usado quando o job nem chega a ser processado)"""
+        job_json = self.job_store.get(f"job:{job_id}")
+        if not job_json:
+            return
+        try:
+            job_data = decode_job(job_json)
+        except ValueError:
+            return
+        
+        job_data['status'] = 'failed'
+        job_data['error'] = error
+        job_data['failed_at'] = datetime.now().isoformat()
+        pipe = self.job_store.pipeline(transaction=True)
+        save_job(pipe, job_id, job_data, 300)
+        mark_finished(pipe, job_data)
+        pipe.execute()
+        self.publish_event(job_data.get('root_job_id') or job_id, 'status', {
+            'job_id': job_id, 'module': self.module_name, 'status': 'failed', 'error': error
+        })
+    
+    def _arrive_at_join(self, job_id: str, job_data: Dict, root_job_id: str,
+                        message_id: Optional[str] = None) -> Optional[Dict[str, Dict]]:
+        """
+        Registra a chegada de uma branch neste nó de junção (GRAPH_JOINS)
+        
+        A chegada (HSET em join:{root_job_id}:{module}) e a leitura das que já
+        chegaram vão num único MULTI/EXEC: só a última branch vê todas as
+        origens e segue para o process(); as anteriores são encerradas aqui.
+        
+        Returns:
+            {origem: data da branch} se esta foi a última chegada, senão None
+        """
+        join_key = f"join:{root_job_id}:{self.module_name}"
+        pipe = self.job_store.pipeline(transaction=True)
+        pipe.hset(join_key, job_data['from_module'], encode_job(job_data.get('data', {})))
+        pipe.expire(join_key, TREE_TTL)
+        pipe.hgetall(join_key)
+        arrivals = {
+            source.decode('utf-8') if isinstance(source, bytes) else source: decode_job(data)
+            for source, data in pipe.execute()[-1].items()
+        }
+        
+        missing = [source for source in self.join_sources if source not in arrivals]
+        if not missing:
+            print(f"   🔗 Junção completa ({', '.join(self.join_sources)}) - executando {self.module_name}")
+            return arrivals
+        
+        # Ainda faltam branches: esta chegada termina aqui (a última executa o nó)
+        job_data['status'] = 'completed'
+        job_data['completed_at'] = datetime.now().isoformat()
+        job_data['note'] = f"Joined into {self.module_name}"
+        pipe = self._begin_transition(message_id)
+        save_job(pipe, job_id, job_data, 300)
+        mark_finished(pipe, job_data)
+        pipe.execute()
+        print(f"   🔗 Branch de {job_data['from_module']} chegou na junção - aguardando {', '.join(missing)}")
+        return None
+    
+    def _consume_stream(self):
+        """Loop de consumo no transporte stream (consumer group + ack + reclaim)"""
+        self._ensure_consumer_group()
+        last_reclaim = 0.0
+        reclaim_interval = max(STREAM_VISIBILITY_TIMEOUT_MS / 1000 / 4, 5)
+        reclaimed = []  # Jobs órfãos reivindicados aguardando vaga
+        
+        while self.running:
+            slot_acquired = False
+            try:
+                self._maybe_resume_expired_waits()
+                
+                # Periodicamente recuperar jobs de workers que morreram
+                if not reclaimed and time.time() - last_reclaim >= reclaim_interval:
+                    reclaimed = self._reclaim_pending()
+                    last_reclaim = time.time()
+                
+                # Só lê um job do stream quando há vaga para executá-lo
+                slot_acquired = self._slots.acquire(timeout=1)
+                if not slot_acquired:
+                    continue
+                
+                if reclaimed:
+                    entry = reclaimed.pop(0)
+                else:
+                    # Bloqueia até ter um job novo (timeout 1s)
+                    result = self.redis_client.xreadgroup(
+                        STREAM_GROUP,
+                        self.consumer_name,
+                        {self.stream_name: '>'},
+                        count=1,
+                        block=1000
+                    )
+                    entries = [e for _, stream_entries in result or [] for e in stream_entries]
+                    if not entries:
+                        continue
+                    entry = entries[0]
+                
+                message_id, fields = entry
+                self._dispatch(fields.get('job_id', ''), message_id)
+                slot_acquired = False  # A vaga agora pertence ao job
+                    
+            except KeyboardInterrupt:
+                print(f"\n⏹️  Worker {self.module_name} parando...")
+                self.running = False
+            except Exception as e:
+                print(f"❌ Erro no worker: {str(e)}")
+                time.sleep(1)
+            finally:
+                if slot_acquired:
+                    self._slots.release()
+    
+    def process_job(self, job_id: str, message_id: Optional[str] = None) -> bool:
+        """
+        Processa um job
+        
+        Args:
+            job_id: Job a processar
+            message_id: Mensagem do stream (transporte stream) - o ack vai junto
+                        na transição atômica do job
+        
+        Returns:
+            True se o ack de message_id já foi aplicado na transição; False
+            nos demais caminhos (job ausente/cancelado/falhou) - _run_job dá o ack
+        """
         print(f"📍 {self.module_name} processando job {job_id[:8]}...")
         
         # Carregar job
-        job_json = self.redis_client.get(f"job:{job_id}")
+        job_json = self.job_store.get(f"job:{job_id}")
         if not job_json:
             print(f"   ❌ Job não encontrado")
-            return
+            return False
         
         try:
-            job_data = json.loads(job_json)
-        except json.JSONDecodeError as e:
-            print(f"   ❌ Erro ao decodificar JSON: {e}")
-            return
+            job_data = decode_job(job_json)
+        except ValueError as e:
+            print(f"   ❌ Erro ao decodificar job: {e}")
+            return False
         
         # VERIFICAR SE JOB FOI CANCELADO (status direto)
         if job_data.get('status') == 'cancelled':
             print(f"   🚫 Job cancelado (motivo: {job_data.get('cancelled_reason', 'unknown')}) - pulando processamento")
-            return
+            return False
         
         # VERIFICAR SE JOB ESTÁ NA LISTA DE CANCELAMENTO (F5/logout)
         username = job_data.get('username', 'unknown')
         projeto = job_data.get('projeto', 'default')
         if self.is_job_cancelled(job_id, username, projeto):
             print(f"   🚫 Job {job_id[:8]}... está na lista de cancelamento - pulando")
-            return
+            return False
         
         try:
             start_time = time.time()
@@ -567,6 +1570,30 @@ class ModuleWorker:
             # RASTREIO: Adicionar job_id ao data_input para salvar no banco
             data_input['job_id'] = job_id
             
+            # Job raiz: workers interativos publicam eventos no stream dele
+            root_job_id = job_data.get('root_job_id') or job_id
+            data_input['root_job_id'] = root_job_id
+            
+            # JUNÇÃO (fan-in): só a última branch a chegar executa o módulo
+            join_key = None
+            if job_data.get('from_module') in self.join_sources:
+                join_inputs = self._arrive_at_join(job_id, job_data, root_job_id, message_id)
+                if join_inputs is None:
+                    return True
+                data_input['join_inputs'] = join_inputs
+                join_key = f"join:{root_job_id}:{self.module_name}"
+            
+            # RETOMADA: job estava estacionado aguardando input neste módulo
+            if job_data.get('status') == WAITING_INPUT_STATUS and job_data.get('waiting_module') == self.module_name:
+                deadline = job_data.get('wait_deadline', 0)
+                data_input['_wait'] = {
+                    'since': job_data.get('waiting_since', time.time()),
+                    'deadline': deadline,
+                    'expired': time.time() >= deadline
+                }
+                job_data['status'] = 'pending'
+                print(f"   ▶️  Retomando job estacionado (prazo expirado: {data_input['_wait']['expired']})")
+            
             # DEBUG: Mostrar o que chegou
             print(f"   🔍 DEBUG: type(data_input) = {type(data_input)}")
             print(f"   🔍 DEBUG: data_input = {data_input}")
@@ -579,11 +1606,17 @@ class ModuleWorker:
                 except Exception as e:
                     print(f"   ❌ Erro ao decodificar string: {e}")
                     print(f"   ❌ data não é um dict válido: {type(data_input)}")
-                    return
+                    return False
             
-            # PROCESSAR MÓDULO (implementado pela subclasse)
+            # PROCESSAR MÓDULO (implementado pela subclasse; no replay, saída gravada)
             try:
-                output = self.process(data_input)
+                if self.replay:
+                    output = self.offload_results(
+                        self.replay.play(self.module_name, data_input),
+                        queue_owner(data_input['username'], data_input['projeto'])
+                    )
+                else:
+                    output = self.process(data_input)
             except Exception as e:
                 print(f"   ❌ Erro no process(): {e}")
                 import traceback
@@ -592,14 +1625,28 @@ class ModuleWorker:
                 # Marcar job como failed
                 job_data['status'] = 'failed'
                 job_data['error'] = str(e)
-                self.redis_client.setex(
-                    f"job:{job_id}",
-                    3600,
-                    json.dumps(job_data)
-                )
-                return
+                job_data['failed_at'] = datetime.now().isoformat()
+                pipe = self.job_store.pipeline(transaction=True)
+                save_job(pipe, job_id, job_data, 3600)
+                mark_finished(pipe, job_data)
+                pipe.execute()
+                self.publish_event(root_job_id, 'status', {
+                    'job_id': job_id, 'module': self.module_name, 'status': 'failed', 'error': str(e)
+                })
+                return False
             
             execution_time = time.time() - start_time
+            data_input.pop('_wait', None)
+            
+            # Módulo interativo pediu para esperar input do usuário: estacionar e liberar o worker
+            wait_request = output.pop('_wait_for_input', None)
+            if wait_request:
+                self._park_job(job_id, job_data, wait_request, self._begin_transition(message_id))
+                return True
+            
+            # Espera (se houve) terminou: não propagar para as branches
+            for wait_field in ('waiting_module', 'waiting_since', 'wait_deadline'):
+                job_data.pop(wait_field, None)
             
             # EXTRAIR _next_modules ANTES de processar o resto
             custom_next_modules = output.pop('_next_modules', None)
@@ -609,16 +1656,19 @@ class ModuleWorker:
             print(f"      - Valor: {custom_next_modules}")
             
             # Registrar execução
-            job_data['execution_chain'].append({
+            step = {
                 'module': self.module_name,
                 'input': job_data['data'],
                 'output': output,
                 'execution_time': execution_time,
                 'success': True,
                 'timestamp': datetime.now().isoformat()
-            })
+            }
+            if custom_next_modules:
+                step['next_modules'] = custom_next_modules  # Roteamento escolhido (replay.py)
             
             # Atualizar dados para próximo módulo
+            job_data['from_module'] = self.module_name  # Origem da chegada em nós de junção
             job_data['data'] = {
                 'username': job_data['username'],
                 'projeto': job_data['projeto'],
@@ -630,6 +1680,16 @@ class ModuleWorker:
             print(f"   ✅ Processado em {execution_time:.2f}s")
             print(f"   📤 Output: {list(output.keys())}")
             
+            # Transição atômica: job + filas + branches + conclusão do pai num único MULTI/EXEC
+            pipe = self._begin_transition(message_id)
+            final_status = None
+            
+            times_key = f"processing_times:{self.module_name}"
+            pipe.lpush(times_key, round(execution_time, 3))
+            pipe.ltrim(times_key, 0, PROCESSING_TIME_SAMPLES - 1)
+            if join_key:
+                pipe.delete(join_key)  # Junção consumida (a árvore pode passar por ela de novo)
+            
             # Depositar em próximos módulos
             # Verificar se o worker definiu próximos módulos customizados
             if custom_next_modules:
@@ -638,8 +1698,15 @@ class ModuleWorker:
             else:
                 next_modules = self.connections.get(self.module_name, [])
             
+            # Audit log pelo stream: a branch de log sai do grafo (mesmo estado que ela receberia)
+            if AUDIT_LOG_MODE == 'stream' and AUDIT_LOG_MODULE in next_modules:
+                next_modules = [module for module in next_modules if module != AUDIT_LOG_MODULE]
+                emit_audit_log(pipe, {**job_data['data'], 'parent_job_id': job_id, 'root_job_id': root_job_id})
+                print(f"   📝 Etapa publicada no audit log ({AUDIT_LOG_STREAM})")
+            
             if next_modules:
                 print(f"   ⬇️  Depositando em: {', '.join(next_modules)}")
+                owner = queue_owner(job_data['username'], job_data['projeto'])
                 
                 # Se múltiplos destinos (paralelo), criar job_id único para cada branch
                 if len(next_modules) > 1:
@@ -651,26 +1718,30 @@ class ModuleWorker:
                         branch_job_data = deepcopy(job_data)
                         branch_job_data['job_id'] = branch_job_id
                         branch_job_data['parent_job_id'] = job_id
+                        branch_job_data['root_job_id'] = root_job_id
                         branch_job_data['current_module'] = next_module
                         
                         # IMPORTANTE: Adicionar parent_job_id ao data para os workers
                         branch_job_data['data']['parent_job_id'] = job_id
                         
-                        # IMPORTANTE: Limpar execution_chain da branch para evitar duplicação
-                        # Cada branch terá seu próprio execution_chain independente
-                        branch_job_data['execution_chain'] = []
+                        # IMPORTANTE: a branch começa com chain:{branch_job_id} vazia
+                        # (só um job legado ainda traz execution_chain no documento)
+                        branch_job_data.pop('execution_chain', None)
                         
                         # Salvar job da branch
-                        self.redis_client.setex(
-                            f"job:{branch_job_id}",
-                            3600,
-                            json.dumps(branch_job_data)
-                        )
+                        save_job(pipe, branch_job_id, branch_job_data, 3600)
+                        
+                        # Registrar branch no índice do job raiz (consulta O(branches))
+                        children_key = f"children:{root_job_id}"
+                        pipe.sadd(children_key, branch_job_id)
+                        pipe.expire(children_key, 3600)
+                        index_user_job(pipe, job_data['username'], job_data['projeto'], branch_job_id)
+                        track_jobs(pipe, root_job_id, branch_job_id)
                         
-                        # Adicionar à fila do próximo módulo
-                        next_queue = f"queue:{next_module}"
-                        self.redis_client.rpush(next_queue, branch_job_id)
-                        print(f"   ✓ Branch {branch_job_id[:8]} → {next_queue}")
+                        # Adicionar à fila do próximo módulo (branch de background vai com prioridade baixa)
+                        priority = 'low' if next_module in QUEUE_BACKGROUND_MODULES else 'normal'
+                        enqueue_job(pipe, next_module, branch_job_id, owner, priority)
+                        print(f"   ✓ Branch {branch_job_id[:8]} → {next_module}")
                     
                     # Marcar job principal como completed (branches criadas com sucesso)
                     job_data['status'] = 'completed'
@@ -678,11 +1749,10 @@ class ModuleWorker:
                     job_data['note'] = f'Job split into {len(next_modules)} parallel branches'
                     
                     # TTL de 5 minutos para jobs completados (evita acúmulo no Redis)
-                    self.redis_client.setex(
-                        f"job:{job_id}",
-                        300,  # 5 minutos
-                        json.dumps(job_data)
-                    )
+                    save_job(pipe, job_id, job_data, 300)  # 5 minutos
+                    append_step(pipe, job_id, step, 300)
+                    mark_finished(pipe, job_data)
+                    final_status = 'completed'
                     
                     print(f"   🔀 Job principal marcado como completed ({len(next_modules)} branches criadas)")
                 else:
@@ -690,35 +1760,46 @@ class ModuleWorker:
                     next_module = next_modules[0]
                     job_data['current_module'] = next_module
                     
-                    # Salvar job atualizado
-                    self.redis_client.setex(
-                        f"job:{job_id}",
-                        3600,
-                        json.dumps(job_data)
-                    )
+                    # Salvar job atualizado (e anexar só a etapa deste módulo)
+                    save_job(pipe, job_id, job_data, 3600)
+                    append_step(pipe, job_id, step, 3600)
                     
                     # Adicionar à fila do próximo módulo
-                    next_queue = f"queue:{next_module}"
-                    self.redis_client.rpush(next_queue, job_id)
-                    print(f"   ✓ Job {job_id[:8]} depositado em fila: {next_queue}")
+                    enqueue_job(pipe, next_module, job_id, owner)
+                    print(f"   ✓ Job {job_id[:8]} depositado em fila: {next_module}")
             else:
                 # Nó final - marcar como completo
                 job_data['status'] = 'completed'
                 job_data['completed_at'] = datetime.now().isoformat()
                 
                 # TTL de 5 minutos para jobs completados (evita acúmulo no Redis)
-                self.redis_client.setex(
-                    f"job:{job_id}",
-                    300,  # 5 minutos
-                    json.dumps(job_data)
-                )
+                save_job(pipe, job_id, job_data, 300)  # 5 minutos
+                append_step(pipe, job_id, step, 300)
+                mark_finished(pipe, job_data)
+                final_status = 'completed'
                 
                 print(f"   🏁 Job completo - Nó final alcançado")
                 
                 # Salvar no PostgreSQL
 
             
+            pipe.execute()
+            
+            # Notificar websocket depois que a transição foi aplicada
+            self.publish_event(root_job_id, 'step', {
+                'job_id': job_id,
+                'module': step['module'],
+                'output': output,
+                'success': True,
+                'timestamp': step['timestamp']
+            })
+            if final_status:
+                self.publish_event(root_job_id, 'status', {
+                    'job_id': job_id, 'module': self.module_name, 'status': final_status
+                })
+            
             print()
+            return True
             
         except Exception as e:
             print(f"   ❌ Erro: {str(e)}\n")
@@ -728,11 +1809,16 @@ class ModuleWorker:
             job_data['failed_at'] = datetime.now().isoformat()
             
             # TTL de 5 minutos para jobs falhados (evita acúmulo no Redis)
-            self.redis_client.setex(
-                f"job:{job_id}",
-                300,  # 5 minutos
-                json.dumps(job_data)
-            )
+            pipe = self.job_store.pipeline(transaction=True)
+            save_job(pipe, job_id, job_data, 300)  # 5 minutos
+            mark_finished(pipe, job_data)
+            pipe.execute()
+            
+            self.publish_event(job_data.get('root_job_id') or job_id, 'status', {
+                'job_id': job_id, 'module': self.module_name, 'status': 'failed', 'error': str(e)
+            })
+            
+            return False
     
     def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -754,7 +1840,8 @@ class ModuleWorker:
             # Construir grafo para Flow Orchestration
             nodes = []
             
-            for idx, log in enumerate(job_data['execution_chain']):
+            execution_chain = job_data.get('execution_chain') or read_chain(self.job_store, job_data['job_id'])
+            for idx, log in enumerate(execution_chain):
                 module = log['module']
                 node_id = f"{module}_node_{idx}"
                 
@@ -769,8 +1856,8 @@ class ModuleWorker:
                 connected_to = []
                 next_modules = self.connections.get(module, [])
                 for next_module in next_modules:
-                    for future_idx in range(idx + 1, len(job_data['execution_chain'])):
-                        if job_data['execution_chain'][future_idx]['module'] == next_module:
+                    for future_idx in range(idx + 1, len(execution_chain)):
+                        if execution_chain[future_idx]['module'] == next_module:
                             connected_to.append(f"{next_module}_node_{future_idx}")
                             break
                 
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Janitor do Redis - limpeza em segundo plano
+
+Expira jobs terminais (completed/failed/cancelled) registrados no zset
+finished_jobs, em lotes limitados (ZRANGEBYSCORE), junto com as etapas
+(chain:*), a entrada no índice do usuário, o cancelled_jobs:* e as chaves
+pendentes (HITL) de jobs que morreram aguardando input.
+
+Roda como processo próprio (start_workers.sh / pm2): nenhuma requisição
+do usuário paga por limpeza do keyspace inteiro.
+
+Uso:
+    python agents/graph_orchestrator/janitor.py
+"""
+
+import sys
+import os
+import time
+from pathlib import Path
+
+# Adicionar paths
+backend_path = str(Path(__file__).parent.parent.parent)
+sys.path.insert(0, backend_path)
+
+from agents.graph_orchestrator.graph_orchestrator import GraphOrchestrator, FINISHED_JOBS_KEY
+
+JANITOR_INTERVAL = int(os.getenv('JANITOR_INTERVAL', 30))                 # Segundos entre rodadas
+JANITOR_MAX_AGE_MINUTES = int(os.getenv('JANITOR_MAX_AGE_MINUTES', 5))    # Idade mínima para expirar
+JANITOR_BATCH_SIZE = int(os.getenv('JANITOR_BATCH_SIZE', 500))            # Jobs por lote
+JANITOR_MAX_BATCHES = int(os.getenv('JANITOR_MAX_BATCHES', 20))           # Lotes por rodada (o resto fica para a próxima)
+
+
+class Janitor:
+    """Loop de limpeza de finished_jobs"""
+
+    def __init__(self):
+        self.orchestrator = GraphOrchestrator()
+        self.running = False
+
+    def run_once(self) -> int:
+        """
+        Uma rodada: lotes de JANITOR_BATCH_SIZE até esvaziar os jobs vencidos
+        ou atingir JANITOR_MAX_BATCHES
+
+        Returns:
+            Número de jobs deletados
+        """
+        deleted = 0
+        for _ in range(JANITOR_MAX_BATCHES):
+            batch_deleted = self.orchestrator.cleanup_old_jobs(
+                max_age_minutes=JANITOR_MAX_AGE_MINUTES,
+                batch_size=JANITOR_BATCH_SIZE
+            )
+            deleted += batch_deleted
+            if batch_deleted < JANITOR_BATCH_SIZE:
+                break
+        return deleted
+
+    def start(self):
+        """Inicia o janitor (loop infinito)"""
+        self.running = True
+        print(f"\n🧹 Janitor iniciado")
+        print(f"   ⏱️  Intervalo: {JANITOR_INTERVAL}s | idade mínima: {JANITOR_MAX_AGE_MINUTES} min")
+        print(f"   📦 Lote: {JANITOR_BATCH_SIZE} jobs (máx {JANITOR_MAX_BATCHES} lotes por rodada)\n")
+
+        while self.running:
+            try:
+                deleted = self.run_once()
+                if deleted:
+                    remaining = self.orchestrator.redis_client.zcard(FINISHED_JOBS_KEY)
+                    print(f"   ✅ Rodada: {deleted} jobs expirados ({remaining} em {FINISHED_JOBS_KEY})")
+                time.sleep(JANITOR_INTERVAL)
+            except KeyboardInterrupt:
+                print(f"\n⏹️  Janitor parando...")
+                self.running = False
+            except Exception as e:
+                print(f"❌ Erro no janitor: {str(e)}")
+                time.sleep(JANITOR_INTERVAL)
+
+
+if __name__ == '__main__':
+    janitor = Janitor()
+    janitor.start()
@@ -0,0 +1,174 @@
+"""
+Codec dos valores job:* no Redis
+
+Formato (versionado pelo primeiro byte, para jobs antigos e novos coexistirem
+durante o rollout):
+
+    '{' ...                  JSON legado (json.dumps) - sem cabeçalho
+    0x01 + payload           orjson
+    0x02 + payload           msgpack (ormsgpack)
+    (0x01|0x02) | 0x80       mesmo payload comprimido com zstd
+
+O codec de ESCRITA é escolhido por JOB_CODEC; a LEITURA aceita todos os
+formatos. Rollout seguro: subir todos os processos com esta versão mantendo
+JOB_CODEC=json e só depois trocar para orjson / msgpack / *+zstd.
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, Optional, Union
+from dotenv import load_dotenv
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ormsgpack
+except ImportError:
+    ormsgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+load_dotenv()
+
+# =====================================================
+# CONFIGURAÇÃO
+# =====================================================
+
+CODEC_ORJSON = 0x01
+CODEC_MSGPACK = 0x02
+FLAG_ZSTD = 0x80
+
+JOB_CODEC = os.getenv('JOB_CODEC', 'json').lower()                  # json | orjson | msgpack | orjson+zstd | msgpack+zstd
+JOB_CODEC_ZSTD_LEVEL = int(os.getenv('JOB_CODEC_ZSTD_LEVEL', 3))
+JOB_CODEC_ZSTD_MIN_BYTES = int(os.getenv('JOB_CODEC_ZSTD_MIN_BYTES', 1024))  # Jobs menores não compensam comprimir
+
+# Compressores zstd não são thread-safe: um par por thread (workers com concorrência > 1)
+_zstd_local = threading.local()
+
+
+def _compressor():
+    if not hasattr(_zstd_local, 'compressor'):
+        _zstd_local.compressor = zstandard.ZstdCompressor(level=JOB_CODEC_ZSTD_LEVEL)
+    return _zstd_local.compressor
+
+
+def _decompressor():
+    if not hasattr(_zstd_local, 'decompressor'):
+        _zstd_local.decompressor = zstandard.ZstdDecompressor()
+    return _zstd_local.decompressor
+
+
+def _resolve_codec(name: str):
+    """Converte o nome do codec em (codec_id | None para JSON, usar zstd)"""
+    base, _, compression = name.partition('+')
+    codec_id = {'json': None, 'orjson': CODEC_ORJSON, 'msgpack': CODEC_MSGPACK}.get(base)
+    
+    if base not in ('json', 'orjson', 'msgpack') or compression not in ('', 'zstd'):
+        print(f"⚠️  JOB_CODEC inválido '{name}' - usando json")
+        return None, False
+    if codec_id == CODEC_ORJSON and orjson is None:
+        print(f"⚠️  JOB_CODEC={name} mas orjson não está instalado - usando json")
+        return None, False
+    if codec_id == CODEC_MSGPACK and ormsgpack is None:
+        print(f"⚠️  JOB_CODEC={name} mas ormsgpack não está instalado - usando json")
+        return None, False
+    
+    use_zstd = compression == 'zstd'
+    if use_zstd and (codec_id is None or zstandard is None):
+        # JSON legado não tem cabeçalho, então não pode ser comprimido
+        print(f"⚠️  JOB_CODEC={name}: compressão zstd indisponível - sem compressão")
+        use_zstd = False
+    return codec_id, use_zstd
+
+
+_DEFAULT_CODEC = _resolve_codec(JOB_CODEC)
+
+
+# =====================================================
+# ENCODE / DECODE
+# =====================================================
+
+def encode_job(job_data: Dict[str, Any], codec: Optional[str] = None) -> Union[str, bytes]:
+    """
+    Serializa um job para gravar em job:{id}
+    
+    Args:
+        job_data: Documento do job
+        codec: Força um codec (padrão: JOB_CODEC)
+    
+    Returns:
+        str (JSON legado) ou bytes (cabeçalho de versão + payload)
+    """
+    codec_id, use_zstd = _resolve_codec(codec) if codec else _DEFAULT_CODEC
+    
+    if codec_id is None:
+        return json.dumps(job_data)
+    
+    if codec_id == CODEC_ORJSON:
+        payload = orjson.dumps(job_data, option=orjson.OPT_NON_STR_KEYS)
+    else:
+        payload = ormsgpack.packb(job_data, option=ormsgpack.OPT_NON_STR_KEYS)
+    
+    header = codec_id
+    if use_zstd and len(payload) >= JOB_CODEC_ZSTD_MIN_BYTES:
+        payload = _compressor().compress(payload)
+        header |= FLAG_ZSTD
+    
+    return bytes([header]) + payload
+
+
+def decode_job(raw: Union[str, bytes, None]) -> Optional[Dict[str, Any]]:
+    """
+    Desserializa um valor job:{id} em qualquer formato suportado
+    
+    Returns:
+        Documento do job ou None se raw for None
+    
+    Raises:
+        ValueError: valor corrompido em qualquer codec (JSON, orjson, msgpack,
+                    zstd) ou codec não instalado - os chamadores só tratam ValueError
+    """
+    if raw is None:
+        return None
+    try:
+        return _decode_job(raw)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Valor de job inválido: {e}") from e
+
+
+def _decode_job(raw: Union[str, bytes]) -> Dict[str, Any]:
+    if isinstance(raw, str):
+        return json.loads(raw)
+    if not raw:
+        raise ValueError("Valor de job vazio")
+    
+    header = raw[0]
+    codec_id = header & ~FLAG_ZSTD
+    
+    if codec_id not in (CODEC_ORJSON, CODEC_MSGPACK):
+        # JSON legado (começa com '{')
+        return json.loads(raw)
+    
+    payload = raw[1:]
+    if header & FLAG_ZSTD:
+        if zstandard is None:
+            raise ValueError("Job comprimido com zstd mas zstandard não está instalado")
+        payload = _decompressor().decompress(payload)
+    
+    if codec_id == CODEC_ORJSON:
+        if orjson is None:
+            return json.loads(payload)
+        return orjson.loads(payload)
+    
+    if ormsgpack is None:
+        raise ValueError("Job codificado em msgpack mas ormsgpack não está instalado")
+    return ormsgpack.unpackb(payload)
@@ -0,0 +1,175 @@
+"""
+Pool de conexões PostgreSQL do servidor Flask/Socket.IO
+
+Um pool por processo (limitado a PG_POOL_MAX conexões) compartilhado por
+todas as rotas: cada requisição faz checkout de UMA conexão e devolve no
+fim (ver get_db_connection em test_endpoint_websocket.py), sem pagar
+TCP + autenticação a cada chamada.
+
+- Checkout bloqueia até PG_POOL_TIMEOUT segundos quando o pool está cheio
+  (ThreadedConnectionPool sozinho falha na hora com PoolError)
+- Health check: conexão fechada é descartada; conexão ociosa há mais de
+  PG_POOL_HEALTHCHECK_IDLE segundos é testada com SELECT 1 antes de ser usada
+- Devolução faz rollback de transação aberta (próxima requisição recebe a
+  conexão limpa) e descarta conexões quebradas
+- stats() expõe métricas de uso (em /test-orchestrator/health)
+"""
+
+import os
+import time
+import threading
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+
+load_dotenv()
+
+# =====================================================
+# CONFIGURAÇÃO
+# =====================================================
+
+POSTGRES_CONFIG = {
+    'host': os.getenv('POSTGRES_HOST', 'localhost'),
+    'port': int(os.getenv('POSTGRES_PORT', 5546)),
+    'database': os.getenv('POSTGRES_DB', 'ezpocket_logs'),
+    'user': os.getenv('POSTGRES_USER', 'ezpocket_user'),
+    'password': os.getenv('POSTGRES_PASSWORD', 'ezpocket_pass_2025')
+}
+
+PG_POOL_MIN = int(os.getenv('PG_POOL_MIN', 1))
+PG_POOL_MAX = int(os.getenv('PG_POOL_MAX', 10))
+PG_POOL_TIMEOUT = float(os.getenv('PG_POOL_TIMEOUT', 5))                   # Espera máxima por uma conexão livre
+PG_POOL_HEALTHCHECK_IDLE = float(os.getenv('PG_POOL_HEALTHCHECK_IDLE', 30))  # Ociosa há mais que isso → SELECT 1
+
+
+class PostgresPool:
+    """Pool limitado de conexões com health check e métricas"""
+    
+    def __init__(self, minconn: int = PG_POOL_MIN, maxconn: int = PG_POOL_MAX,
+                 timeout: float = PG_POOL_TIMEOUT, config: Optional[Dict[str, Any]] = None):
+        self.minconn = minconn
+        self.maxconn = max(1, maxconn)
+        self.timeout = timeout
+        self.config = config or POSTGRES_CONFIG
+        self._pool = None
+        self._lock = threading.Lock()
+        # Garante o limite: só entra no pool quem tem vaga (o resto espera)
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._last_used = {}  # id(conn) -> último uso
+        self._metrics = {
+            'checkouts': 0,
+            'in_use': 0,
+            'max_in_use': 0,
+            'timeouts': 0,
+            'broken_discarded': 0,
+            'healthchecks': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0
+        }
+    
+    def _get_pool(self):
+        """Cria o pool no primeiro uso (importar o módulo não conecta no banco)"""
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(self.minconn, self.maxconn, **self.config)
+                    print(f"🐘 Pool PostgreSQL criado ({self.minconn}-{self.maxconn} conexões) em "
+                          f"{self.config['host']}:{self.config['port']}/{self.config['database']}")
+        return self._pool
+    
+    def _is_healthy(self, conn) -> bool:
+        """Conexão fechada ou ociosa há muito tempo que não responde SELECT 1 é descartada"""
+        if conn.closed:
+            return False
+        if time.time() - self._last_used.get(id(conn), 0) < PG_POOL_HEALTHCHECK_IDLE:
+            return True
+        
+        with self._lock:
+            self._metrics['healthchecks'] += 1
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._get_pool().putconn(conn, close=True)
+        with self._lock:
+            self._metrics['broken_discarded'] += 1
+    
+    def checkout(self):
+        """
+        Retira uma conexão saudável do pool (bloqueia até timeout se o pool está cheio)
+        
+        Raises:
+            PoolError: nenhuma conexão liberada dentro do timeout
+        """
+        start = time.time()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._metrics['timeouts'] += 1
+            raise PoolError(f"Pool PostgreSQL esgotado ({self.maxconn} conexões em uso há {self.timeout}s)")
+        
+        try:
+            conn = self._get_pool().getconn()
+            # Várias conexões ociosas podem ter caído juntas (restart do banco)
+            while not self._is_healthy(conn):
+                print(f"🐘 ⚠️ Conexão PostgreSQL quebrada descartada - abrindo outra")
+                self._discard(conn)
+                conn = self._get_pool().getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        
+        waited = time.time() - start
+        with self._lock:
+            self._metrics['checkouts'] += 1
+            self._metrics['in_use'] += 1
+            self._metrics['max_in_use'] = max(self._metrics['max_in_use'], self._metrics['in_use'])
+            self._metrics['wait_time_total'] += waited
+            self._metrics['wait_time_max'] = max(self._metrics['wait_time_max'], waited)
+        return conn
+    
+    def release(self, conn):
+        """Devolve a conexão ao pool (rollback do que não foi commitado)"""
+        try:
+            if conn.closed:
+                self._discard(conn)
+                return
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self._discard(conn)
+                return
+            self._last_used[id(conn)] = time.time()
+            self._get_pool().putconn(conn)
+        finally:
+            with self._lock:
+                self._metrics['in_use'] -= 1
+            self._slots.release()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Métricas de uso do pool"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        checkouts = metrics['checkouts']
+        metrics['wait_time_avg_ms'] = round(metrics['wait_time_total'] / checkouts * 1000, 2) if checkouts else 0.0
+        metrics['wait_time_max_ms'] = round(metrics.pop('wait_time_max') * 1000, 2)
+        metrics.pop('wait_time_total')
+        metrics['max_size'] = self.maxconn
+        metrics['initialized'] = self._pool is not None
+        return metrics
+    
+    def close(self):
+        """Fecha todas as conexões (shutdown do processo)"""
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+
+# Pool único do processo
+postgres_pool = PostgresPool()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Record/replay de jobs inteiros do Graph Orchestrator
+
+Mede o overhead do orquestrador (filas, serialização, fan-out, transições)
+separado da latência do OpenAI / Athena / PostgreSQL:
+
+1. record: lê a execution_chain consolidada de um job real (raiz + branches,
+   chain:{id}) e grava num arquivo JSON a saída de cada módulo, o tempo que
+   ele levou e o roteamento (_next_modules) que ele escolheu. Resultados do
+   Athena guardados em blob (claim-check) são trazidos para dentro do arquivo.
+
+2. replay: com REPLAY_RECORDING apontando para o arquivo, o ModuleWorker de
+   QUALQUER módulo devolve a saída gravada em vez de chamar o process() da
+   subclasse (sem rede). REPLAY_LATENCY_SCALE injeta a latência gravada
+   (0 = nenhuma, só overhead; 1 = como na gravação; 0.5 = metade).
+
+A ordem das saídas de cada módulo é mantida por job raiz em
+replay_cursor:{root_job_id}:{module} (INCR no Redis), então vários processos
+do mesmo módulo e várias execuções simultâneas da gravação funcionam.
+
+Uso:
+    python agents/graph_orchestrator/replay.py record <job_id> -o gravacao.json
+    python agents/graph_orchestrator/replay.py run gravacao.json --jobs 50 --concurrency 4
+    python agents/graph_orchestrator/replay.py run gravacao.json --latency-scale 1
+
+    # Workers reais (start_workers.sh / pm2) em modo replay:
+    REPLAY_RECORDING=gravacao.json ./agents/graph_orchestrator/start_workers.sh
+
+Use um Redis (ou REDIS_DB) separado: o replay grava jobs, filas e
+processing_times:* como um job de verdade.
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from copy import deepcopy
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from redis import Redis
+
+# Adicionar paths
+backend_path = str(Path(__file__).parent.parent.parent)
+sys.path.insert(0, backend_path)
+
+RECORDING_VERSION = 1
+REPLAY_CURSOR_TTL = 3600  # Mesmo TTL dos jobs
+REPLAY_POLL_INTERVAL = 0.05  # Segundos entre verificações de término no run
+
+# Campos que o orquestrador injeta no data (não fazem parte da pergunta original)
+INJECTED_FIELDS = ('username', 'projeto', 'job_id', 'root_job_id', 'parent_job_id')
+
+
+# =====================================================
+# GRAVAÇÃO
+# =====================================================
+
+def record_job(orchestrator, root_job_id: str) -> Dict[str, Any]:
+    """
+    Monta a gravação de um job (raiz + branches) a partir da execution_chain
+    
+    Returns:
+        {'version', 'recorded_at', 'root_job_id', 'start_module', 'username',
+         'projeto', 'initial_data', 'recorded_duration', 'steps': {module: [...]}}
+    """
+    from agents.graph_orchestrator.graph_orchestrator import load_blob
+    
+    job = orchestrator.get_job_with_branches(root_job_id)
+    if not job:
+        raise ValueError(f"Job {root_job_id} não encontrado (expirado?)")
+    chain = job.get('execution_chain', [])
+    if not chain:
+        raise ValueError(f"Job {root_job_id} não tem etapas executadas")
+    if job.get('consolidated_status') != 'completed':
+        print(f"   ⚠️  Job {root_job_id[:8]}... está '{job.get('consolidated_status')}' - gravando as etapas que existem")
+    
+    start_module = job.get('start_module')
+    first_step = next((step for step in chain if step['module'] == start_module), chain[0])
+    initial_data = {k: v for k, v in first_step.get('input', {}).items() if k not in INJECTED_FIELDS}
+    
+    steps = {}
+    for step in chain:
+        output = dict(step.get('output', {}))
+        # Claim-check: o blob expira junto com o job, a gravação não
+        if output.get('results_full_ref') and not output.get('results_full'):
+            rows = load_blob(orchestrator.redis_client, output.pop('results_full_ref'))
+            output['results_full'] = rows if rows is not None else output.get('results_preview', [])
+        steps.setdefault(step['module'], []).append({
+            'output': output,
+            'execution_time': step.get('execution_time', 0.0),
+            'next_modules': step.get('next_modules')
+        })
+    
+    return {
+        'version': RECORDING_VERSION,
+        'recorded_at': datetime.now().isoformat(),
+        'root_job_id': root_job_id,
+        'start_module': start_module,
+        'username': job.get('username'),
+        'projeto': job.get('projeto'),
+        'initial_data': initial_data,
+        'recorded_duration': tree_duration(job),
+        'steps': steps
+    }
+
+
+def save_recording(recording: Dict[str, Any], path: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(recording, f, ensure_ascii=False, indent=2, default=str)
+
+
+def load_recording(path: str) -> Dict[str, Any]:
+    with open(path, encoding='utf-8') as f:
+        recording = json.load(f)
+    if recording.get('version') != RECORDING_VERSION:
+        raise ValueError(f"Gravação {path} na versão {recording.get('version')} (esperado {RECORDING_VERSION})")
+    return recording
+
+
+def tree_duration(job: Dict[str, Any]) -> Optional[float]:
+    """Segundos entre a criação do job raiz e o término da última branch (None se não terminou)"""
+    ends = [job.get('completed_at') or job.get('failed_at')]
+    ends += [branch.get('completed_at') for branch in job.get('branch_details', [])]
+    if not job.get('created_at') or not all(ends):
+        return None
+    end = max(datetime.fromisoformat(ts) for ts in ends)
+    return (end - datetime.fromisoformat(job['created_at'])).total_seconds()
+
+
+# =====================================================
+# REPLAY
+# =====================================================
+
+class ReplayPlayer:
+    """Devolve as saídas gravadas no lugar do process() dos workers"""
+    
+    def __init__(self, recording: Dict[str, Any], redis_client: Redis, latency_scale: float = 0.0):
+        self.recording = recording
+        self.redis_client = redis_client
+        self.latency_scale = latency_scale
+    
+    @classmethod
+    def load(cls, path: str, redis_client: Redis, latency_scale: float = 0.0) -> 'ReplayPlayer':
+        return cls(load_recording(path), redis_client, latency_scale)
+    
+    def play(self, module: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Próxima saída gravada do módulo para o job raiz de data
+        
+        Se o módulo rodar mais vezes do que na gravação, repete a última saída.
+        """
+        recorded = self.recording['steps'].get(module)
+        if not recorded:
+            raise KeyError(f"Módulo {module} não está na gravação {self.recording.get('root_job_id')}")
+        
+        cursor_key = f"replay_cursor:{data.get('root_job_id')}:{module}"
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.incr(cursor_key)
+        pipe.expire(cursor_key, REPLAY_CURSOR_TTL)
+        index = pipe.execute()[0] - 1
+        step = recorded[min(index, len(recorded) - 1)]
+        
+        if self.latency_scale > 0:
+            time.sleep(step['execution_time'] * self.latency_scale)
+        
+        # Cópia: o process_job altera a saída (pop de _next_modules, claim-check)
+        output = deepcopy(step['output'])
+        if step.get('next_modules'):
+            output['_next_modules'] = list(step['next_modules'])
+        return output
+
+
+def run_replay(recording: Dict[str, Any], jobs: int = 10, concurrency: int = 4,
+               latency_scale: float = 0.0, timeout: float = 300) -> Dict[str, Any]:
+    """
+    Sobe um ModuleWorker por módulo (threads neste processo) em modo replay,
+    submete a gravação `jobs` vezes e mede até cada árvore terminar
+    
+    Returns:
+        Relatório com latência por job, vazão e divergências de roteamento
+    """
+    from agents.graph_orchestrator.graph_orchestrator import GraphOrchestrator, ModuleWorker
+    
+    orchestrator = GraphOrchestrator()
+    player = ReplayPlayer(recording, orchestrator.redis_client, latency_scale)
+    modules = set(recording['steps']) | set(orchestrator.connections)
+    
+    workers = []
+    for module in sorted(modules):
+        worker = ModuleWorker(module, concurrency)
+        worker.replay = player
+        workers.append(worker)
+    threads = [threading.Thread(target=worker.start, daemon=True) for worker in workers]
+    for thread in threads:
+        thread.start()
+    
+    expected = Counter({module: len(steps) for module, steps in recording['steps'].items()})
+    started = time.time()
+    job_ids = [
+        orchestrator.submit_job(recording['start_module'], recording['username'],
+                                recording['projeto'], deepcopy(recording['initial_data']))
+        for _ in range(jobs)
+    ]
+    
+    try:
+        pending = set(job_ids)
+        while pending and time.time() - started < timeout:
+            for job_id in list(pending):
+                status = orchestrator.get_tree_status(job_id)
+                if status and status['consolidated_status'] in ('completed', 'failed', 'partial_failure'):
+                    pending.discard(job_id)
+            time.sleep(REPLAY_POLL_INTERVAL)
+        wall_time = time.time() - started
+    finally:
+        for worker in workers:
+            worker.running = False
+        for thread in threads:
+            thread.join()
+    
+    durations, failed, divergent = [], [], []
+    for job_id in job_ids:
+        job = orchestrator.get_job_with_branches(job_id)
+        if job['consolidated_status'] != 'completed':
+            failed.append(job_id)
+            continue
+        durations.append(tree_duration(job))
+        if Counter(step['module'] for step in job['execution_chain']) != expected:
+            divergent.append(job_id)
+    
+    durations.sort()
+    return {
+        'jobs': jobs,
+        'completed': len(durations),
+        'failed': failed,
+        'timed_out': sorted(pending),
+        'divergent': divergent,
+        'wall_time': wall_time,
+        'throughput': len(durations) / wall_time if wall_time else 0.0,
+        'latency': {
+            'p50': percentile(durations, 50),
+            'p95': percentile(durations, 95),
+            'max': durations[-1] if durations else None
+        },
+        'recorded_duration': recording.get('recorded_duration'),
+        'latency_scale': latency_scale
+    }
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Percentil (nearest-rank) de uma lista já ordenada"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))]
+
+
+def print_report(report: Dict[str, Any]):
+    latency = report['latency']
+    print(f"\n🎬 REPLAY: {report['completed']}/{report['jobs']} jobs completos em {report['wall_time']:.2f}s "
+          f"({report['throughput']:.1f} jobs/s, latência injetada ×{report['latency_scale']})")
+    if latency['p50'] is not None:
+        print(f"   ⏱️  Latência por job: p50 {latency['p50'] * 1000:.0f}ms | "
+              f"p95 {latency['p95'] * 1000:.0f}ms | max {latency['max'] * 1000:.0f}ms")
+    if report['recorded_duration'] is not None:
+        print(f"   📼 Job gravado levou {report['recorded_duration']:.2f}s")
+    if report['failed']:
+        print(f"   ❌ Falharam: {len(report['failed'])}")
+    if report['timed_out']:
+        print(f"   ⏰ Não terminaram no prazo: {len(report['timed_out'])}")
+    if report['divergent']:
+        print(f"   ⚠️  Roteamento diferente da gravação: {len(report['divergent'])} job(s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record/replay de jobs do Graph Orchestrator')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    record_parser = commands.add_parser('record', help='Grava um job executado (precisa estar no Redis)')
+    record_parser.add_argument('job_id')
+    record_parser.add_argument('-o', '--output', help='Arquivo da gravação (padrão: replay_{job_id}.json)')
+    
+    run_parser = commands.add_parser('run', help='Executa a gravação com workers em modo replay')
+    run_parser.add_argument('recording')
+    run_parser.add_argument('--jobs', type=int, default=10, help='Quantas vezes submeter a gravação')
+    run_parser.add_argument('--concurrency', type=int, default=4, help='Jobs simultâneos por worker')
+    run_parser.add_argument('--latency-scale', type=float, default=0.0,
+                            help='Fração da latência gravada a injetar (0 = só overhead)')
+    run_parser.add_argument('--timeout', type=float, default=300)
+    
+    args = parser.parse_args()
+    
+    if args.command == 'record':
+        from agents.graph_orchestrator.graph_orchestrator import GraphOrchestrator
+        recording = record_job(GraphOrchestrator(), args.job_id)
+        path = args.output or f"replay_{args.job_id}.json"
+        save_recording(recording, path)
+        calls = sum(len(steps) for steps in recording['steps'].values())
+        print(f"✅ Gravação salva em {path} ({len(recording['steps'])} módulos, {calls} execuções)")
+    else:
+        report = run_replay(load_recording(args.recording), args.jobs, args.concurrency,
+                            args.latency_scale, args.timeout)
+        print_report(report)
+        sys.exit(1 if report['failed'] or report['timed_out'] or report['divergent'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,365 @@
+"""
+SQL especulativo durante a confirmação do plano
+
+Enquanto o usuário lê o plano (plan_confirm estacionado em waiting_input),
+o worker do plan_confirm já roda, numa thread, as etapas que viriam depois
+do "sim": analysis_orchestrator → sql_validator → auto_correction (se a
+query for inválida) → athena_executor (só com SPECULATIVE_SQL=execute).
+
+- Cada etapa grava o resultado em speculative:{root_job_id} junto com a
+  impressão digital dos argumentos da chamada ao agente
+- Se o plano for ACEITO, o grafo segue normalmente (mesmas etapas, mesmos
+  logs) e cada worker chama take() antes do agente: se a etapa especulada
+  recebeu exatamente os mesmos argumentos, usa o resultado pronto; se ainda
+  está rodando, espera até SPECULATIVE_WAIT; senão chama o agente como antes
+- Se o plano for REJEITADO (ou der timeout), discard() marca a especulação
+  como cancelada, o resultado é descartado e a query em andamento no Athena
+  é cancelada (StopQueryExecution). Se o usuário sair, a limpeza da sessão
+  (cleanup_user_session / cancel_active_jobs) faz o mesmo com
+  cancel_speculation: o plan_confirm estacionado é apagado e não volta
+
+Gravações da thread só valem enquanto status == running (Lua): uma etapa
+que termina depois do discard() não ressuscita a especulação.
+
+SPECULATIVE_SQL=off (padrão) desliga tudo.
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from redis import Redis
+
+from agents.graph_orchestrator.graph_orchestrator import store_blob, queue_owner, RESULT_BLOB_MIN_ROWS
+
+SPECULATIVE_SQL = os.getenv('SPECULATIVE_SQL', 'off').lower()                  # off | sql (gera e valida) | execute (também roda a query)
+SPECULATIVE_WAIT = float(os.getenv('SPECULATIVE_WAIT', 30))                    # Espera máxima por uma etapa especulada em andamento (s)
+SPECULATIVE_MAX_CONCURRENT = int(os.getenv('SPECULATIVE_MAX_CONCURRENT', 4))   # Especulações simultâneas por worker de plan_confirm
+SPECULATIVE_TTL = 600            # Prazo do plan_confirm (300s) + execução
+SPECULATIVE_POLL_INTERVAL = 0.2
+
+# KEYS: speculative:{root} | ARGV: run, campo, valor
+# Grava só se a especulação ainda está valendo (não foi descartada nem
+# substituída pela de um plano refinado)
+SPECULATIVE_SET_LUA = """
+if redis.call('HGET', KEYS[1], 'status') ~= 'running' or redis.call('HGET', KEYS[1], 'run') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+return 1
+"""
+
+
+def speculation_enabled() -> bool:
+    return SPECULATIVE_SQL in ('sql', 'execute')
+
+
+def speculation_key(root_job_id: str) -> str:
+    return f"speculative:{root_job_id}"
+
+
+def args_fingerprint(args: Dict[str, Any]) -> str:
+    """Impressão digital dos argumentos de uma chamada de agente"""
+    payload = json.dumps(args, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def analysis_key_args(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos do state que o AnalysisOrchestratorAgent.generate_query lê"""
+    return {
+        'plan': state.get('plan', ''),
+        'pergunta': state.get('pergunta', ''),
+        'intent_category': state.get('intent_category', 'unknown'),
+        'username': state.get('username', ''),
+        'projeto': state.get('projeto', ''),
+        'conversation_context': state.get('conversation_context', ''),
+        'has_history': state.get('has_history', False)
+    }
+
+
+def collect_validation_issues(data: Dict[str, Any]) -> list:
+    """Issues que o worker_auto_correction manda para o agente (mesma ordem)"""
+    issues = []
+    issues.extend(data.get('security_issues', []))
+    issues.extend(data.get('warnings', []))
+    if data.get('error'):
+        issues.append(data.get('error'))
+    return issues
+
+
+def take(redis_client: Redis, root_job_id: Optional[str], stage: str, key_args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Resultado especulado da etapa, se ela foi chamada com os mesmos argumentos
+    
+    Etapa ainda em andamento: espera até SPECULATIVE_WAIT (a alternativa
+    seria repetir a mesma chamada do zero).
+    
+    Returns:
+        Resultado do agente ou None (sem especulação / argumentos diferentes /
+        cancelada / falhou) - nesse caso o worker chama o agente normalmente
+    """
+    if not speculation_enabled() or not root_job_id:
+        return None
+    
+    key = speculation_key(root_job_id)
+    field = f"stage:{stage}"
+    deadline = time.time() + SPECULATIVE_WAIT
+    while True:
+        status, value = redis_client.hmget(key, 'status', field)
+        if status not in ('running', 'done') or value is None:
+            return None
+        if value != 'running':
+            break
+        if time.time() >= deadline:
+            print(f"   🔮 Especulação de {stage} ainda em andamento após {SPECULATIVE_WAIT:.0f}s - executando normalmente")
+            return None
+        time.sleep(SPECULATIVE_POLL_INTERVAL)
+    
+    entry = json.loads(value)
+    if entry['key'] != args_fingerprint(key_args):
+        print(f"   🔮 Especulação de {stage} com argumentos diferentes - executando normalmente")
+        return None
+    print(f"   🔮 Resultado especulativo de {stage} reaproveitado")
+    return entry['result']
+
+
+_athena_agent = None
+_athena_agent_lock = threading.Lock()
+
+
+def _stop_athena_query(query_execution_id: str):
+    """StopQueryExecution fora do worker de plan_confirm (agente criado no primeiro uso)"""
+    global _athena_agent
+    with _athena_agent_lock:
+        if _athena_agent is None:
+            from agents.athena_executor_agent.athena_executor import AthenaExecutorAgent
+            _athena_agent = AthenaExecutorAgent()
+    _athena_agent.stop_query(query_execution_id)
+
+
+def cancel_speculation(redis_client: Redis, root_job_id: Optional[str], reason: str,
+                       stop_query: Optional[Callable[[str], None]] = None) -> bool:
+    """
+    Marca speculative:{root} como cancelada e para a query do Athena em andamento
+    
+    Usada pelo SpeculativeRunner (plano rejeitado / timeout / novo plano) e
+    pela limpeza de sessão (cleanup_user_session, cancel_active_jobs): no
+    disconnect o plan_confirm estacionado é apagado e nunca é retomado, então
+    quem limpa a sessão é quem descarta a especulação.
+    
+    Args:
+        redis_client: Cliente com decode_responses=True
+        stop_query: Cancela a query (padrão: AthenaExecutorAgent deste processo)
+    
+    Returns:
+        True se havia especulação valendo
+    """
+    if not root_job_id:
+        return False
+    
+    key = speculation_key(root_job_id)
+    state = redis_client.hgetall(key)
+    if not state or state.get('status') == 'cancelled':
+        return False
+    
+    pipe = redis_client.pipeline()
+    pipe.hset(key, 'status', 'cancelled')
+    pipe.expire(key, 60)
+    pipe.execute()
+    
+    # Query que começa depois daqui é parada pela própria thread (gravação recusada pelo Lua)
+    query_execution_id = state.get('athena_query_id')
+    if query_execution_id and state.get('stage:athena_executor') == 'running':
+        try:
+            (stop_query or _stop_athena_query)(query_execution_id)
+            print(f"   🔮 Query especulativa {query_execution_id} cancelada no Athena")
+        except Exception as e:
+            print(f"   🔮 ⚠️ Erro ao cancelar query especulativa {query_execution_id}: {e}")
+    print(f"   🔮 Especulação descartada ({reason})")
+    return True
+
+
+class SpeculativeRunner:
+    """
+    Roda a especulação em threads do processo do plan_confirm
+    
+    Os agentes são criados no primeiro uso (só nos workers de plan_confirm
+    com a especulação ligada).
+    """
+    
+    def __init__(self, redis_client: Redis):
+        self.redis_client = redis_client  # decode_responses=True
+        self.pool = ThreadPoolExecutor(max_workers=SPECULATIVE_MAX_CONCURRENT, thread_name_prefix='speculative')
+        self._set = redis_client.register_script(SPECULATIVE_SET_LUA)
+        self._agents = {}
+        self._agents_lock = threading.Lock()
+    
+    def _agent(self, name: str):
+        with self._agents_lock:
+            return self._load_agent(name)
+    
+    def _load_agent(self, name: str):
+        if name not in self._agents:
+            if name == 'analysis_orchestrator':
+                from agents.analysis_orchestrator_agent.analysis_orchestrator import AnalysisOrchestratorAgent
+                self._agents[name] = AnalysisOrchestratorAgent()
+            elif name == 'sql_validator':
+                from agents.sql_validator_agent.sql_validator import SQLValidatorAgent
+                self._agents[name] = SQLValidatorAgent()
+            elif name == 'auto_correction':
+                from agents.auto_correction_agent.auto_correction import AutoCorrectionAgent
+                self._agents[name] = AutoCorrectionAgent()
+            elif name == 'athena_executor':
+                from agents.athena_executor_agent.athena_executor import AthenaExecutorAgent
+                self._agents[name] = AthenaExecutorAgent()
+        return self._agents[name]
+    
+    def _write(self, root_job_id: str, run_id: str, field: str, value: str) -> bool:
+        """Grava um campo se a especulação run_id ainda está valendo"""
+        return bool(self._set(keys=[speculation_key(root_job_id)], args=[run_id, field, value]))
+    
+    def start(self, data: Dict[str, Any]):
+        """Começa a especular para o plano que acabou de ir para confirmação"""
+        root_job_id = data.get('root_job_id')
+        if not root_job_id:
+            return
+        
+        # Plano refinado volta ao plan_confirm na mesma árvore: a especulação anterior não vale mais
+        self.discard(root_job_id, reason='novo plano')
+        
+        key = speculation_key(root_job_id)
+        run_id = uuid.uuid4().hex
+        pipe = self.redis_client.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping={'status': 'running', 'run': run_id, 'mode': SPECULATIVE_SQL, 'started_at': time.time()})
+        pipe.expire(key, SPECULATIVE_TTL)
+        pipe.execute()
+        
+        print(f"   🔮 Especulação iniciada ({SPECULATIVE_SQL}) enquanto o usuário confirma o plano")
+        self.pool.submit(self._run, root_job_id, run_id, dict(data))
+    
+    def _stage(self, root_job_id: str, run_id: str, stage: str, key_args: Dict[str, Any], call: Callable[[], Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Roda uma etapa e grava o resultado (None se a especulação foi descartada ou a etapa falhou)"""
+        field = f"stage:{stage}"
+        if not self._write(root_job_id, run_id, field, 'running'):
+            return None
+        
+        start = time.time()
+        try:
+            result = call()
+        except Exception as e:
+            print(f"   🔮 ⚠️ Especulação de {stage} falhou: {e}")
+            self.redis_client.hdel(speculation_key(root_job_id), field)
+            return None
+        
+        if not isinstance(result, dict):
+            self.redis_client.hdel(speculation_key(root_job_id), field)
+            return None
+        
+        entry = json.dumps({'key': args_fingerprint(key_args), 'result': result}, default=str, ensure_ascii=False)
+        if not self._write(root_job_id, run_id, field, entry):
+            print(f"   🔮 {stage} terminou depois do descarte - resultado ignorado")
+            return None
+        print(f"   🔮 {stage} especulado em {time.time() - start:.1f}s")
+        return result
+    
+    def _run(self, root_job_id: str, run_id: str, data: Dict[str, Any]):
+        """Mesma sequência dos workers depois do "sim" (ver worker_analysis_orchestrator/sql_validator/auto_correction/athena_executor)"""
+        try:
+            username = data.get('username', 'unknown')
+            projeto = data.get('projeto', 'default')
+            
+            # analysis_orchestrator: recebe o output do plan_confirm aceito
+            state = {
+                'pergunta': data.get('pergunta', ''),
+                'username': username,
+                'projeto': projeto,
+                'plan': data.get('plan', ''),
+                'plan_steps': data.get('plan_steps', []),
+                'estimated_complexity': data.get('estimated_complexity', 'média'),
+                'intent_category': data.get('intent_category')
+            }
+            analysis = self._stage(
+                root_job_id, run_id, 'analysis_orchestrator', analysis_key_args(state),
+                lambda: self._agent('analysis_orchestrator').generate_query(dict(state))
+            )
+            if not analysis or analysis.get('error') or not analysis.get('query_sql'):
+                return
+            
+            # sql_validator
+            validator_args = {
+                'query_sql': analysis.get('query_sql', ''),
+                'username': username,
+                'projeto': projeto,
+                'estimated_complexity': state['estimated_complexity']
+            }
+            validation = self._stage(
+                root_job_id, run_id, 'sql_validator', validator_args,
+                lambda: self._agent('sql_validator').validate(**validator_args)
+            )
+            if not validation:
+                return
+            query_source = {**validation, 'query_sql': validator_args['query_sql']}
+            
+            # auto_correction (query inválida)
+            if not validation.get('valid'):
+                correction_args = {
+                    'query_original': query_source.get('query_validated', query_source.get('query_sql', '')),
+                    'validation_issues': collect_validation_issues(query_source),
+                    'username': username,
+                    'projeto': projeto,
+                    'conversation_context': '',
+                    'has_history': False
+                }
+                correction = self._stage(
+                    root_job_id, run_id, 'auto_correction', correction_args,
+                    lambda: self._agent('auto_correction').correct(**correction_args)
+                )
+                if not correction:
+                    return
+                query_source = correction
+            
+            # athena_executor (só com SPECULATIVE_SQL=execute)
+            if SPECULATIVE_SQL == 'execute':
+                executor_args = {
+                    'query_sql': query_source.get('query_corrected') or query_source.get('query_validated') or query_source.get('query_sql', ''),
+                    'username': username,
+                    'projeto': projeto
+                }
+                self._stage(
+                    root_job_id, run_id, 'athena_executor', executor_args,
+                    lambda: self._execute(root_job_id, run_id, executor_args)
+                )
+        finally:
+            self._write(root_job_id, run_id, 'status', 'done')
+    
+    def _execute(self, root_job_id: str, run_id: str, executor_args: Dict[str, Any]) -> Dict[str, Any]:
+        """Executa a query guardando o QueryExecutionId (para o discard poder cancelar)"""
+        agent = self._agent('athena_executor')
+        
+        def on_query_started(query_execution_id: str):
+            if not self._write(root_job_id, run_id, 'athena_query_id', query_execution_id):
+                # Descartada entre a geração da query e o início da execução
+                agent.stop_query(query_execution_id)
+        
+        result = agent.execute(**executor_args, on_query_started=on_query_started)
+        
+        # Resultado grande vai para o blob (o worker do athena_executor faria o mesmo)
+        rows = result.get('results_full')
+        if rows and len(rows) > RESULT_BLOB_MIN_ROWS:
+            owner = queue_owner(executor_args['username'], executor_args['projeto'])
+            result['results_full_ref'] = store_blob(self.redis_client, rows, owner=owner)
+            del result['results_full']
+        return result
+    
+    def discard(self, root_job_id: Optional[str], reason: str = 'plano rejeitado'):
+        """Descarta a especulação do job e cancela a query do Athena em andamento"""
+        cancel_speculation(
+            self.redis_client, root_job_id, reason,
+            stop_query=lambda query_execution_id: self._agent('athena_executor').stop_query(query_execution_id)
+        )
@@ -49,6 +49,19 @@ cleanup() {
 
 trap cleanup SIGINT SIGTERM
 
+# WORKER_AUTOSCALE=true: o autoscaler sobe/derruba os workers conforme as filas
+# (no lugar de um processo fixo por módulo)
+if [ "$WORKER_AUTOSCALE" = "true" ]; then
+    echo -e "${GREEN}📈 Iniciando Autoscaler (workers dimensionados pelas filas)${NC}"
+    python agents/graph_orchestrator/janitor.py &
+    python agents/graph_orchestrator/audit_log_writer.py &
+    # Sem exec: o shell continua vivo com o trap e o cleanup derruba os três
+    # processos (SIGTERM - o autoscaler encerra os workers dele com graça)
+    python agents/graph_orchestrator/autoscaler.py &
+    wait
+    exit 0
+fi
+
 # Inicia workers em background
 echo -e "${BLUE}================================================================================${NC}"
 echo -e "${BLUE}🚀 INICIANDO WORKERS${NC}"
@@ -133,6 +146,18 @@ WORKER13_PID=$!
 echo -e "      PID: $WORKER13_PID"
 echo ""
 
+echo -e "${GREEN}Iniciando Janitor (limpeza de jobs finalizados)${NC}"
+python agents/graph_orchestrator/janitor.py &
+JANITOR_PID=$!
+echo -e "      PID: $JANITOR_PID"
+echo ""
+
+echo -e "${GREEN}Iniciando Audit Log Writer (logs por módulo em lote no PostgreSQL)${NC}"
+python agents/graph_orchestrator/audit_log_writer.py &
+AUDIT_WRITER_PID=$!
+echo -e "      PID: $AUDIT_WRITER_PID"
+echo ""
+
 echo -e "${BLUE}================================================================================${NC}"
 echo -e "${GREEN}✅ TODOS OS WORKERS INICIADOS${NC}"
 echo -e "${BLUE}================================================================================${NC}"
@@ -151,6 +176,8 @@ echo -e "  • Python Runtime (PID: $WORKER10_PID)"
 echo -e "  • Response Composer (PID: $WORKER11_PID)"
 echo -e "  • User Feedback (PID: $WORKER12_PID)"
 echo -e "  • History Preferences (PID: $WORKER13_PID)"
+echo -e "  • Janitor (PID: $JANITOR_PID)"
+echo -e "  • Audit Log Writer (PID: $AUDIT_WRITER_PID)"
 echo ""
 echo -e "${YELLOW}Pressione Ctrl+C para parar todos os workers${NC}"
 echo ""
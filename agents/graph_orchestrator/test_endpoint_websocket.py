@@ -3,16 +3,19 @@ Endpoint de teste para o Graph Orchestrator com suporte a WebSocket
 Permite testar o orquestrador com comunicação em tempo real
 """
 
-from flask import Flask, request, jsonify, render_template, make_response, redirect, url_for
+from flask import Flask, request, jsonify, render_template, make_response, redirect, url_for, g
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import sys
 import os
 from dotenv import load_dotenv
 import json
+import psycopg2
 import threading
+import socket
 import time
 from datetime import datetime, timedelta
+from typing import Optional
 
 # Carrega variáveis de ambiente do .env
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'config', '.env')
@@ -21,8 +24,15 @@ load_dotenv(dotenv_path)
 # Adiciona o caminho do backend ao sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
-from agents.graph_orchestrator.graph_orchestrator import GraphOrchestrator
+from agents.graph_orchestrator.graph_orchestrator import (
+    GraphOrchestrator, parse_job_event, save_job, mark_finished, store_blob, queue_owner,
+    user_jobs_key, user_pending_keys, user_memory_keys, user_queue_keys
+)
 from agents.graph_orchestrator.graph_config import EXPECTED_FLOW
+from agents.graph_orchestrator.pg_pool import postgres_pool, POSTGRES_CONFIG
+from agents.llm_client import llm_stats
+from agents.conversation_context import ConversationContextBuilder, count_tokens
+from agents.graph_orchestrator.admission import AdmissionController
 from agents.graph_orchestrator.auth import (
     authenticate_user, 
     verify_token, 
@@ -42,6 +52,32 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', logge
 # Inicializa o orquestrador
 orchestrator = GraphOrchestrator()
 
+# Admissão de jobs novos (fila global + token bucket por usuário/projeto)
+admission = AdmissionController(orchestrator)
+
+# Contexto da conversa com orçamento de tokens e resumo incremental por usuário/projeto
+context_builder = ConversationContextBuilder(orchestrator.redis_client)
+
+
+def get_db_connection():
+    """
+    Conexão PostgreSQL da requisição atual (checkout do pool compartilhado)
+    
+    A mesma conexão é reaproveitada dentro da requisição e devolvida ao pool
+    no teardown - inclusive em returns antecipados e exceções.
+    """
+    if 'db_conn' not in g:
+        g.db_conn = postgres_pool.checkout()
+    return g.db_conn
+
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    """Devolve ao pool a conexão usada pela requisição (rollback do que não foi commitado)"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        postgres_pool.release(conn)
+
 # Armazena sessões ativas (job_id -> sid)
 active_sessions = {}
 # Armazena inputs pendentes (job_id -> waiting_for)
@@ -52,264 +88,350 @@ sid_user_mapping = {}
 monitor_stop_flags = {}
 
 
-def monitor_job(job_id: str, sid: str):
+# Projeção do output de cada módulo no module_update: o navegador recebe só
+# o resumo e a primeira página dos resultados; as demais páginas vêm sob
+# demanda de /api/results (blob do claim-check). Módulos fora do dicionário
+# recebem o output sem os campos pesados.
+WS_RESULT_PAGE_SIZE = int(os.getenv('WS_RESULT_PAGE_SIZE', 20))
+WS_RESULT_MAX_PAGE_SIZE = 500
+
+WS_HEAVY_FIELDS = ['results_full', 'results_preview', 'results_full_ref', 'conversation_context']
+
+WS_OUTPUT_PROJECTIONS = {
+    'athena_executor': ['success', 'query_executed', 'row_count', 'column_count', 'columns',
+                        'execution_time_seconds', 'data_size_mb', 'error'],
+    'python_runtime': ['success', 'insights', 'recommendations', 'execution_time', 'error'],
+    'response_composer': ['success', 'response_text', 'user_friendly_score', 'execution_time', 'error'],
+}
+
+
+def project_module_output(module: str, output: dict, owner: Optional[str] = None) -> dict:
     """
-    Thread que monitora o status do job e envia atualizações via WebSocket
-    Monitora também as chaves do Redis para inputs do usuário
+    Output reduzido para o module_update (resumo + primeira página dos resultados)
+    
+    owner (queue_owner do job) é registrado no blob criado aqui: só ele pagina
+    o results_ref em /api/results
     """
-    print(f"[MONITOR] Iniciando monitoramento do job {job_id[:8]}... para sid {sid}")
-    last_chain_length = 0
-    last_status = None
-    confirmation_checked = False
-    feedback_checked = False  # Flag para evitar loop infinito
-    user_plan_checked = False  # Flag para user_proposed_plan
-    username = None
-    projeto = None
+    fields = WS_OUTPUT_PROJECTIONS.get(module)
+    if fields is None:
+        projected = {k: v for k, v in output.items() if k not in WS_HEAVY_FIELDS}
+    else:
+        projected = {k: output[k] for k in fields if k in output}
+    
+    rows = output.get('results_full') or output.get('results_preview')
+    if not rows:
+        return projected
+    
+    # Referência para buscar as próximas páginas: o blob do claim-check ou,
+    # se o resultado veio inline e não cabe numa página, um blob criado agora
+    results_ref = output.get('results_full_ref')
+    if not results_ref and output.get('results_full') and len(rows) > WS_RESULT_PAGE_SIZE:
+        results_ref = store_blob(orchestrator.redis_client, rows, owner=owner)
+    
+    row_count = output.get('row_count', len(rows))
+    projected.update({
+        'row_count': row_count,
+        'results_page': rows[:WS_RESULT_PAGE_SIZE],
+        'page_size': WS_RESULT_PAGE_SIZE,
+        'has_more': row_count > WS_RESULT_PAGE_SIZE and bool(results_ref),
+        'results_ref': results_ref
+    })
+    return projected
+
+
+def emit_module_step(step: dict, sid: str, owner: Optional[str] = None):
+    """Envia uma etapa da execution_chain (evento 'step') para o navegador"""
+    module = step.get('module', 'unknown')
+    output = step.get('output', {})
+    success = step.get('success', False)
     
-    # Verificar se é um job novo após flush (forçar reset das flags)
-    # Isso garante que após F5, o novo job será monitorado corretamente
-    print(f"[MONITOR] 🔄 Flags resetadas para novo monitoramento")
+    # Formatar mensagem baseada no módulo (output completo, no servidor)
+    message = format_module_output(module, output, success)
     
-    while True:
+    socketio.emit('module_update', {
+        'module': module,
+        'message': message,
+        'output': project_module_output(module, output, owner),
+        'success': success,
+        'timestamp': step.get('timestamp')
+    }, room=sid)
+
+
+def emit_input_needed(job_id: str, event: dict, sid: str):
+    """Envia pedido de input do usuário (evento 'input_needed') para o navegador"""
+    input_type = event.get('input_type')
+    
+    if input_type == 'plan_confirmation':
+        plan_text = event.get('plan', '')
+        plan_steps = event.get('plan_steps') or []
+        print(f"[MONITOR] ✅ Plan confirm recebido via stream - emitindo show_buttons para sid {sid}")
+        
+        # Montar mensagem formatada do plano
+        plan_message = f"📋 Plano criado:\n{plan_text}\n\n📊 Passos:\n"
+        if plan_steps:
+            for i, step in enumerate(plan_steps, 1):
+                plan_message += f"{i}. {step}\n"
+        else:
+            plan_message += "(Sem passos detalhados)\n"
+        
+        socketio.emit('module_update', {
+            'module': 'plan_confirm',
+            'message': plan_message,
+            'output': {
+                'plan': plan_text,
+                'plan_steps': plan_steps
+            },
+            'success': True,
+            'timestamp': datetime.utcnow().isoformat(),
+            'show_buttons': True  # Flag para mostrar botões de confirmação
+        }, room=sid)
+    
+    elif input_type == 'user_feedback':
+        print(f"[MONITOR] 📊 User feedback recebido via stream - pedindo nota ao usuário")
+        
+        socketio.emit('module_update', {
+            'module': 'user_feedback',
+            'message': 'Resposta gerada com sucesso!',
+            'output': {},
+            'success': True,
+            'timestamp': datetime.utcnow().isoformat(),
+            'show_rating': True  # Flag para pedir nota
+        }, room=sid)
+    
+    elif input_type == 'user_proposed_plan':
+        print(f"[MONITOR] User proposed plan recebido via stream - usuário pode propor plano alternativo")
+        
+        socketio.emit('need_input', {
+            'type': 'user_proposed_plan',
+            'data': {
+                'pergunta': event.get('pergunta', ''),
+                'rejected_plan': event.get('rejected_plan', '')
+            }
+        }, room=sid)
+    
+    else:
+        print(f"[MONITOR] ⚠️ input_needed desconhecido: {input_type}")
+        return
+    
+    pending_inputs[job_id] = input_type
+
+
+class JobMonitor:
+    """
+    Monitor único de todos os jobs ativos do processo websocket
+    
+    UMA thread faz um XREAD bloqueante sobre os streams job_events:{job_id}
+    de todos os jobs acompanhados e roteia cada evento para a room do sid
+    dono do job. Substitui uma thread (e uma thread de limpeza dormindo)
+    por job: memória e carga no Redis crescem com o número de eventos, não
+    com o número de usuários conectados.
+    
+    Jobs novos entram acordando o XREAD pelo stream de controle
+    ws_monitor:wakeup:{host}-{pid} (sem esperar o timeout do bloqueio).
+    """
+    
+    def __init__(self, block_ms: int = 5000, cleanup_timeout: int = 300):
+        self.redis_client = orchestrator.redis_client
+        self.block_ms = block_ms
+        self.cleanup_timeout = cleanup_timeout
+        self.jobs = {}          # job_id -> {'sid', 'owner', 'last_event_id', 'last_status', 'steps'}
+        self.cleanup_due = {}   # job_id -> horário para deletar o job (monitor falhou)
+        self.lock = threading.Lock()
+        self.wakeup_key = f"ws_monitor:wakeup:{socket.gethostname()}-{os.getpid()}"
+        self.wakeup_last_id = '0'
+        self.last_liveness_check = time.time()
+        self.thread = None
+    
+    def watch(self, job_id: str, sid: str, owner: Optional[str] = None):
+        """Passa a acompanhar job_id, enviando as atualizações para a room sid (owner: queue_owner do job)"""
+        print(f"[MONITOR] Iniciando monitoramento do job {job_id[:8]}... para sid {sid}")
+        
+        # Status inicial
+        initial_job = orchestrator.get_job_status(job_id, with_chain=False)
+        last_status = initial_job.get('status') if initial_job else None
+        if last_status:
+            socketio.emit('status_update', {
+                'status': last_status,
+                'branches_count': 0
+            }, room=sid)
+        
+        with self.lock:
+            # Ler o stream desde o início (não perde eventos anteriores ao monitor)
+            self.jobs[job_id] = {'sid': sid, 'owner': owner, 'last_event_id': '0', 'last_status': last_status, 'steps': 0}
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='job-monitor', daemon=True)
+                self.thread.start()
+        self._wake()
+    
+    def unwatch(self, job_id: str):
+        """Para de acompanhar job_id e limpa a sessão dele"""
+        with self.lock:
+            self.jobs.pop(job_id, None)
+        if job_id in active_sessions:
+            del active_sessions[job_id]
+        if job_id in pending_inputs:
+            del pending_inputs[job_id]
+    
+    def _wake(self):
+        """Acorda o XREAD em andamento para incluir os jobs novos"""
         try:
-            # VERIFICAR SE DEVEMOS PARAR ESTE MONITOR
-            if monitor_stop_flags.get(sid, False):
-                print(f"[MONITOR] 🛑 Monitor parado para sid {sid} (usuário desconectou)")
-                break
-            
-            # Buscar status do job com branches
-            status = orchestrator.get_job_with_branches(job_id)
-            
-            if not status:
-                print(f"[MONITOR] Job {job_id[:8]}... não encontrado (pode ter sido deletado via flush)")
-                # Apenas encerrar o monitor silenciosamente
-                break
-            
-            # Extrair username e projeto
-            if not username:
-                username = status.get('username', 'test_user')
-                projeto = status.get('projeto', 'test_project')
-            
-            current_status = status.get('consolidated_status', status.get('status'))
-            execution_chain = status.get('execution_chain', [])
-            
-            # Enviar novas etapas da execution_chain
-            if len(execution_chain) > last_chain_length:
-                new_steps = execution_chain[last_chain_length:]
-                for step in new_steps:
-                    module = step.get('module', 'unknown')
-                    output = step.get('output', {})
-                    success = step.get('success', False)
-                    
-                    # Formatar mensagem baseada no módulo
-                    message = format_module_output(module, output, success)
-                    
-                    socketio.emit('module_update', {
-                        'module': module,
-                        'message': message,
-                        'output': output,
-                        'success': success,
-                        'timestamp': step.get('timestamp')
-                    }, room=sid)
-                
-                last_chain_length = len(execution_chain)
-            
-            # Atualizar status
-            if current_status != last_status:
-                socketio.emit('status_update', {
-                    'status': current_status,
-                    'branches_count': status.get('branches_count', 0)
-                }, room=sid)
-                last_status = current_status
-            
-            # MONITORAR CHAVES DO REDIS (igual ao modo interativo)
-            if username and projeto:
-                # Verificar plan_confirm (pode acontecer múltiplas vezes após refinamentos)
-                if not confirmation_checked:
-                    pending_key = f"plan_confirm:pending:{username}:{projeto}"
-                    response_key = f"plan_confirm:response:{username}:{projeto}"
-                    
-                    exists = orchestrator.redis_client.exists(pending_key)
-                    already_answered = orchestrator.redis_client.exists(response_key)
-                    
-                    print(f"[MONITOR] 🔍 Verificando chave Redis: {pending_key} (existe: {exists}, respondida: {already_answered})")
-                    
-                    # IMPORTANTE: Só mostrar se existe E ainda não foi respondida
-                    if exists and not already_answered:
-                        plan_data = orchestrator.redis_client.hgetall(pending_key)
-                        print(f"[MONITOR] ✅ Plan confirm detectado via Redis: {pending_key}")
-                        print(f"[MONITOR] 📤 Emitindo module_update de plan_confirm com show_buttons=true para sid {sid}")
-                        print(f"[MONITOR] 📋 Plan data: {plan_data.get('plan', '')[:100]}...")
-                        
-                        # Montar mensagem formatada do plano
-                        plan_text = plan_data.get('plan', '')
-                        plan_steps_raw = plan_data.get('plan_steps', '[]')
-                        
-                        print(f"[MONITOR] 🔍 DEBUG plan_steps_raw: {plan_steps_raw} (tipo: {type(plan_steps_raw)})")
-                        
-                        # Tentar parsear JSON se for string
-                        try:
-                            plan_steps = json.loads(plan_steps_raw) if isinstance(plan_steps_raw, str) else plan_steps_raw
-                            print(f"[MONITOR] 🔍 DEBUG plan_steps parseado: {plan_steps} (len: {len(plan_steps)})")
-                        except Exception as e:
-                            print(f"[MONITOR] ⚠️ Erro ao parsear plan_steps: {e}")
-                            plan_steps = []
-                        
-                        plan_message = f"📋 Plano criado:\n{plan_text}\n\n📊 Passos:\n"
-                        if plan_steps:
-                            for i, step in enumerate(plan_steps, 1):
-                                plan_message += f"{i}. {step}\n"
-                        else:
-                            plan_message += "(Sem passos detalhados)\n"
-                        
-                        socketio.emit('module_update', {
-                            'module': 'plan_confirm',
-                            'message': plan_message,
-                            'output': {
-                                'plan': plan_text,
-                                'plan_steps': plan_steps
-                            },
-                            'success': True,
-                            'timestamp': datetime.utcnow().isoformat(),
-                            'show_buttons': True  # Flag para mostrar botões de confirmação
-                        }, room=sid)
-                        pending_inputs[job_id] = 'plan_confirmation'
-                        confirmation_checked = True
-                        print(f"[MONITOR] ✅ confirmation_checked=True (aguardando resposta do usuário)")
-                    elif exists and already_answered:
-                        print(f"[MONITOR] ⏭️  Plan confirm já foi respondido - pulando re-exibição")
-                
-                # Verificar user_feedback (só uma vez por job)
-                # Emitir evento para usuário digitar nota de 1 a 5
-                feedback_key = f"user_feedback:pending:{username}:{projeto}"
-                if not feedback_checked:
-                    feedback_response_key = f"user_feedback:response:{username}:{projeto}"
-                    
-                    exists = orchestrator.redis_client.exists(feedback_key)
-                    already_answered = orchestrator.redis_client.exists(feedback_response_key)
-                    
-                    # IMPORTANTE: Só mostrar se existe E ainda não foi respondida
-                    if exists and not already_answered:
-                        feedback_data = orchestrator.redis_client.hgetall(feedback_key)
-                        print(f"\n{'='*80}")
-                        print(f"[MONITOR] 📊 USER FEEDBACK DETECTADO!")
-                        print(f"[MONITOR] Key: {feedback_key}")
-                        print(f"[MONITOR] Pergunta: {feedback_data.get('pergunta', '')}")
-                        print(f"[MONITOR] 📤 Emitindo module_update para pedir nota ao usuário")
-                        print(f"{'='*80}\n")
-                        
-                        # Emitir evento pedindo nota
-                        socketio.emit('module_update', {
-                            'module': 'user_feedback',
-                            'message': 'Resposta gerada com sucesso!',
-                            'output': {},
-                            'success': True,
-                            'timestamp': datetime.utcnow().isoformat(),
-                            'show_rating': True  # Flag para pedir nota
-                        }, room=sid)
-                        
-                        pending_inputs[job_id] = 'user_feedback'
-                        feedback_checked = True
-                        print(f"[MONITOR] ✅ feedback_checked=True (aguardando nota do usuário)")
-                    elif exists and already_answered:
-                        print(f"[MONITOR] ⏭️  User feedback já foi respondido - pulando re-exibição")
-                
-                # Verificar user_proposed_plan (quando usuário rejeita o plano)
-                # Pode acontecer múltiplas vezes (loop de refinamento)
-                if not user_plan_checked:
-                    user_plan_key = f"user_proposed_plan:pending:{username}:{projeto}"
-                    user_plan_response_key = f"user_proposed_plan:response:{username}:{projeto}"
-                    
-                    exists = orchestrator.redis_client.exists(user_plan_key)
-                    already_answered = orchestrator.redis_client.exists(user_plan_response_key)
-                    
-                    # IMPORTANTE: Só mostrar se existe E ainda não foi respondida
-                    if exists and not already_answered:
-                        user_plan_data = orchestrator.redis_client.hgetall(user_plan_key)
-                        print(f"[MONITOR] User proposed plan detectado via Redis")
-                        print(f"[MONITOR] Usuário pode propor plano alternativo")
-                        
-                        socketio.emit('need_input', {
-                            'type': 'user_proposed_plan',
-                            'data': {
-                                'pergunta': user_plan_data.get('pergunta', ''),
-                                'rejected_plan': user_plan_data.get('rejected_plan', '')
-                            }
-                        }, room=sid)
-                        pending_inputs[job_id] = 'user_proposed_plan'
-                        user_plan_checked = True
-                        # Resetar confirmation_checked para permitir nova confirmação do plano refinado
-                        confirmation_checked = False
-                        print(f"[MONITOR] Flags resetadas: confirmation_checked=False para permitir re-confirmação")
-                    elif exists and already_answered:
-                        print(f"[MONITOR] ⏭️  User proposed plan já foi respondido - pulando re-exibição")
-                
-                # Se user_plan_checked e a chave não existe mais, resetar para permitir novo ciclo
-                elif user_plan_checked:
-                    user_plan_key = f"user_proposed_plan:pending:{username}:{projeto}"
-                    if not orchestrator.redis_client.exists(user_plan_key):
-                        # Worker processou, resetar flag para permitir nova rejeição
-                        user_plan_checked = False
-                        print(f"[MONITOR] user_plan_checked resetado - pronto para novo ciclo")
-                
-                # Resetar confirmation_checked se ambas as chaves foram deletadas (worker processou)
-                if confirmation_checked:
-                    pending_key = f"plan_confirm:pending:{username}:{projeto}"
-                    response_key = f"plan_confirm:response:{username}:{projeto}"
-                    if not orchestrator.redis_client.exists(pending_key) and not orchestrator.redis_client.exists(response_key):
-                        confirmation_checked = False
-                        print(f"[MONITOR] confirmation_checked resetado - confirmação foi processada")
-                
-                # Resetar feedback_checked se ambas as chaves foram deletadas (worker processou)
-                if feedback_checked:
-                    feedback_key = f"user_feedback:pending:{username}:{projeto}"
-                    feedback_response_key = f"user_feedback:response:{username}:{projeto}"
-                    if not orchestrator.redis_client.exists(feedback_key) and not orchestrator.redis_client.exists(feedback_response_key):
-                        feedback_checked = False
-                        print(f"[MONITOR] feedback_checked resetado - feedback foi processado")
-            
-            # Verificar se completou
-            if current_status in ['completed', 'failed', 'partial_failure']:
-                socketio.emit('job_completed', {
-                    'status': current_status,
-                    'job_id': job_id,
-                    'execution_chain_length': len(execution_chain)
-                }, room=sid)
-                print(f"[MONITOR] Job {job_id[:8]}... completado com status: {current_status}")
-                break
-            
-            time.sleep(1)  # Poll a cada 1 segundo
-            
+            self.redis_client.xadd(self.wakeup_key, {'wake': '1'}, maxlen=10, approximate=False)
+            self.redis_client.expire(self.wakeup_key, 3600)
         except Exception as e:
-            print(f"[MONITOR] Erro no monitoramento: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            socketio.emit('error', {
-                'message': f'Erro no monitoramento: {str(e)}'
-            }, room=sid)
-            
-            # Agendar limpeza automática do job
-            def cleanup_job():
-                try:
-                    cleanup_timeout = int(os.getenv('JOB_CLEANUP_TIMEOUT', 300))
-                    time.sleep(cleanup_timeout)
-                    if orchestrator.redis_client.exists(f"job:{job_id}"):
-                        orchestrator.redis_client.delete(f"job:{job_id}")
-                        print(f"[CLEANUP] 🗑️ Job {job_id[:8]}... deletado automaticamente após {cleanup_timeout}s")
-                except Exception as e:
-                    print(f"[CLEANUP] ⚠️ Erro ao limpar job {job_id[:8]}...: {e}")
-            
-            import threading
-            cleanup_thread = threading.Thread(target=cleanup_job, daemon=True)
-            cleanup_thread.start()
+            print(f"[MONITOR] ⚠️ Erro ao acordar monitor: {e}")
+    
+    def _run(self):
+        """Loop da thread do monitor"""
+        while True:
+            try:
+                self._tick()
+            except Exception as e:
+                print(f"[MONITOR] Erro no loop do monitor: {str(e)}")
+                import traceback
+                traceback.print_exc()
+                time.sleep(1)
+    
+    def _tick(self):
+        """Um ciclo: XREAD em todos os streams, liveness e limpezas agendadas"""
+        with self.lock:
+            # VERIFICAR SE DEVEMOS PARAR MONITORES (usuário desconectou)
+            for job_id, state in list(self.jobs.items()):
+                if monitor_stop_flags.get(state['sid'], False):
+                    print(f"[MONITOR] 🛑 Monitor parado para job {job_id[:8]}... (sid {state['sid']} desconectou)")
+                    self.jobs.pop(job_id)
+            streams = {f"job_events:{job_id}": state['last_event_id'] for job_id, state in self.jobs.items()}
+        streams[self.wakeup_key] = self.wakeup_last_id
+        
+        # Bloqueia até chegar evento de QUALQUER job (ou um job novo acordar o monitor)
+        result = self.redis_client.xread(streams, count=100, block=self.block_ms)
+        
+        for stream_key, entries in result or []:
+            if stream_key == self.wakeup_key:
+                self.wakeup_last_id = entries[-1][0]
+                continue
+            job_id = stream_key.split(':', 1)[1]
+            events = [parse_job_event(event_id, fields) for event_id, fields in entries]
+            try:
+                self._dispatch(job_id, events)
+            except Exception as e:
+                self._fail(job_id, e)
+        
+        self._check_liveness()
+        self._run_cleanups()
+    
+    def _dispatch(self, job_id: str, events: list):
+        """Envia os eventos de um job para o navegador (room do sid)"""
+        with self.lock:
+            state = self.jobs.get(job_id)
+        if not state:
+            return
+        sid = state['sid']
+        
+        status_changed = False
+        for event_id, event_type, payload in events:
+            state['last_event_id'] = event_id
             
-            break
+            if event_type == 'step':
+                state['steps'] += 1
+                emit_module_step(payload, sid, state.get('owner'))
+            elif event_type == 'input_needed':
+                emit_input_needed(job_id, payload, sid)
+            elif event_type == 'answer_delta':
+                socketio.emit('answer_delta', payload, room=sid)
+            elif event_type == 'status':
+                status_changed = True
+        
+        if not status_changed:
+            return
+        
+        # Algum job da árvore terminou: status consolidado pelos contadores da árvore (O(1))
+        status = orchestrator.get_tree_status(job_id)
+        
+        if not status:
+            print(f"[MONITOR] Job {job_id[:8]}... não encontrado (pode ter sido deletado via flush)")
+            self.unwatch(job_id)
+            return
+        
+        current_status = status.get('consolidated_status', status.get('status'))
+        
+        # Atualizar status
+        if current_status != state['last_status']:
+            socketio.emit('status_update', {
+                'status': current_status,
+                'branches_count': status.get('branches_count', 0)
+            }, room=sid)
+            state['last_status'] = current_status
+        
+        # Verificar se completou
+        if current_status in ['completed', 'failed', 'partial_failure']:
+            socketio.emit('job_completed', {
+                'status': current_status,
+                'job_id': job_id,
+                'execution_chain_length': state['steps']
+            }, room=sid)
+            print(f"[MONITOR] Job {job_id[:8]}... completado com status: {current_status}")
+            self.unwatch(job_id)
+    
+    def _fail(self, job_id: str, error: Exception):
+        """Erro ao monitorar um job: avisar o navegador e agendar limpeza do job"""
+        print(f"[MONITOR] Erro no monitoramento: {str(error)}")
+        import traceback
+        traceback.print_exc()
+        
+        with self.lock:
+            state = self.jobs.get(job_id)
+        if state:
+            socketio.emit('error', {
+                'message': f'Erro no monitoramento: {str(error)}'
+            }, room=state['sid'])
+        
+        # Agendar limpeza automática do job (executada pelo próprio loop, sem thread dormindo)
+        self.cleanup_due[job_id] = time.time() + self.cleanup_timeout
+        self.unwatch(job_id)
+    
+    def _check_liveness(self):
+        """A cada block_ms: confirmar (um pipeline só) que os jobs acompanhados ainda existem"""
+        if time.time() - self.last_liveness_check < self.block_ms / 1000:
+            return
+        self.last_liveness_check = time.time()
+        
+        with self.lock:
+            job_ids = list(self.jobs)
+        if not job_ids:
+            return
+        
+        pipe = self.redis_client.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.exists(f"job:{job_id}")
+        
+        for job_id, exists in zip(job_ids, pipe.execute()):
+            if not exists:
+                print(f"[MONITOR] Job {job_id[:8]}... não encontrado (pode ter sido deletado via flush)")
+                self.unwatch(job_id)
     
-    # Limpar sessão
-    if job_id in active_sessions:
-        del active_sessions[job_id]
-    if job_id in pending_inputs:
-        del pending_inputs[job_id]
+    def _run_cleanups(self):
+        """Deleta jobs cuja limpeza agendada venceu"""
+        now = time.time()
+        due = [job_id for job_id, deadline in self.cleanup_due.items() if deadline <= now]
+        if not due:
+            return
+        
+        pipe = self.redis_client.pipeline(transaction=False)
+        for job_id in due:
+            del self.cleanup_due[job_id]
+            pipe.delete(f"job:{job_id}", f"chain:{job_id}")
+        try:
+            for job_id, deleted in zip(due, pipe.execute()):
+                if deleted:
+                    print(f"[CLEANUP] 🗑️ Job {job_id[:8]}... deletado automaticamente após {self.cleanup_timeout}s")
+        except Exception as e:
+            print(f"[CLEANUP] ⚠️ Erro ao limpar jobs: {e}")
+
+
+job_monitor = JobMonitor(
+    block_ms=int(os.getenv('JOB_EVENTS_BLOCK_MS', 5000)),
+    cleanup_timeout=int(os.getenv('JOB_CLEANUP_TIMEOUT', 300))
+)
 
 
 def cancel_active_jobs(username: str, projeto: str, keep_pending_keys: bool = True):
@@ -325,23 +447,29 @@ def cancel_active_jobs(username: str, projeto: str, keep_pending_keys: bool = Tr
     print(f"\n[CANCEL] 🛑 Cancelando jobs ativos para {username}/{projeto} (keep_pending={keep_pending_keys})")
     
     # 1. CANCELAR JOBS ATIVOS (marcar como cancelled, não deletar ainda)
+    # Índice user_jobs:{username}:{projeto} - só os jobs deste usuário, sem varrer job:*
     jobs_cancelled = 0
-    for key in list(orchestrator.redis_client.scan_iter(match="job:*")):
-        try:
-            job_data_str = orchestrator.redis_client.get(key)
-            if job_data_str:
-                job_data = json.loads(job_data_str)
-                if job_data.get('username') == username and job_data.get('projeto') == projeto:
-                    # Marcar como cancelado
-                    job_data['status'] = 'cancelled'
-                    job_data['cancelled_at'] = datetime.now().isoformat()
-                    job_data['cancelled_reason'] = 'disconnect' if keep_pending_keys else 'logout'
-                    orchestrator.redis_client.set(key, json.dumps(job_data), ex=3600)
-                    jobs_cancelled += 1
-        except Exception as e:
-            print(f"[CANCEL] ⚠️ Erro ao cancelar job {key}: {e}")
+    user_jobs = orchestrator.get_user_jobs(username, projeto)
+    pipe = orchestrator.job_store.pipeline(transaction=False)
+    for job_data in user_jobs:
+        # Marcar como cancelado
+        job_data['status'] = 'cancelled'
+        job_data['cancelled_at'] = datetime.now().isoformat()
+        job_data['cancelled_reason'] = 'disconnect' if keep_pending_keys else 'logout'
+        save_job(pipe, job_data['job_id'], job_data, 3600)
+        mark_finished(pipe, job_data)  # Janitor expira depois (finished_jobs)
+        jobs_cancelled += 1
+    try:
+        pipe.execute()
+    except Exception as e:
+        print(f"[CANCEL] ⚠️ Erro ao cancelar jobs: {e}")
     
     print(f"[CANCEL] ❌ Marcou {jobs_cancelled} job(s) como cancelado")
+    
+    # SQL especulativo: o plan_confirm cancelado não é retomado para descartar (query do Athena para aqui)
+    speculations_cancelled = orchestrator.cancel_speculations(user_jobs, 'jobs cancelados')
+    if speculations_cancelled:
+        print(f"[CANCEL] 🔮 {speculations_cancelled} especulação(ões) de SQL descartada(s)")
     print(f"[CANCEL] ℹ️  Jobs permanecem nas filas - workers vão pular quando processar")
     
     # 2. NÃO REMOVEMOS JOBS DAS FILAS!
@@ -351,17 +479,7 @@ def cancel_active_jobs(username: str, projeto: str, keep_pending_keys: bool = Tr
     
     # 3. DELETAR CHAVES PENDENTES (só se keep_pending_keys=False)
     if not keep_pending_keys:
-        keys_patterns = [
-            f"plan_confirm:*:{username}:{projeto}",
-            f"user_feedback:*:{username}:{projeto}",
-            f"user_proposed_plan:*:{username}:{projeto}",
-        ]
-        
-        keys_deleted = 0
-        for pattern in keys_patterns:
-            for key in orchestrator.redis_client.scan_iter(match=pattern):
-                orchestrator.redis_client.delete(key)
-                keys_deleted += 1
+        keys_deleted = orchestrator.redis_client.delete(*user_pending_keys(username, projeto))
         
         print(f"[CANCEL] 🔑 Deletou {keys_deleted} chave(s) pendente(s)")
     else:
@@ -381,57 +499,24 @@ def flush_user_from_redis(username: str, projeto: str):
     cancel_active_jobs(username, projeto, keep_pending_keys=False)
     
     # 2. REMOVER JOBS DAS FILAS (só no flush completo/logout)
-    jobs_removed_from_queues = 0
-    for module in orchestrator.connections.keys():
-        queue_name = f"queue:{module}"
-        queue_length = orchestrator.redis_client.llen(queue_name)
-        
-        if queue_length > 0:
-            jobs_in_queue = orchestrator.redis_client.lrange(queue_name, 0, -1)
-            jobs_to_keep = []
-            
-            for job_id_bytes in jobs_in_queue:
-                job_id = job_id_bytes.decode('utf-8') if isinstance(job_id_bytes, bytes) else job_id_bytes
-                
-                job_data_str = orchestrator.redis_client.get(f"job:{job_id}")
-                if job_data_str:
-                    try:
-                        job_data = json.loads(job_data_str)
-                        if not (job_data.get('username') == username and job_data.get('projeto') == projeto):
-                            jobs_to_keep.append(job_id)
-                        else:
-                            jobs_removed_from_queues += 1
-                    except:
-                        jobs_to_keep.append(job_id)
-            
-            if len(jobs_to_keep) < len(jobs_in_queue):
-                orchestrator.redis_client.delete(queue_name)
-                if jobs_to_keep:
-                    orchestrator.redis_client.rpush(queue_name, *jobs_to_keep)
+    # LREM na fila de cada job do usuário - jobs de outros usuários não mudam de posição
+    jobs_removed_from_queues = orchestrator.remove_jobs_from_queues(orchestrator.get_user_jobs(username, projeto))
     
     print(f"[FLUSH] 📥 Removeu {jobs_removed_from_queues} job(s) das filas")
     
     # 3. DELETAR TODOS OS JOBS
-    jobs_deleted = 0
-    for key in list(orchestrator.redis_client.scan_iter(match="job:*")):
-        try:
-            job_data_str = orchestrator.redis_client.get(key)
-            if job_data_str:
-                job_data = json.loads(job_data_str)
-                if job_data.get('username') == username and job_data.get('projeto') == projeto:
-                    orchestrator.redis_client.delete(key)
-                    jobs_deleted += 1
-        except:
-            pass
+    index_key = user_jobs_key(username, projeto)
+    job_ids = list(orchestrator.redis_client.smembers(index_key))
+    pipe = orchestrator.redis_client.pipeline(transaction=False)
+    for job_id in job_ids:
+        pipe.delete(f"job:{job_id}", f"chain:{job_id}")
+    pipe.delete(index_key)
+    jobs_deleted = sum(1 for deleted in pipe.execute()[:len(job_ids)] if deleted)
     
     print(f"[FLUSH] 🗑️  Deletou {jobs_deleted} job(s)")
     
     # 4. DELETAR HISTÓRICO E PREFERÊNCIAS
-    history_keys_deleted = 0
-    for pattern in [f"history:*:{username}:{projeto}", f"preferences:*:{username}:{projeto}"]:
-        for key in orchestrator.redis_client.scan_iter(match=pattern):
-            orchestrator.redis_client.delete(key)
-            history_keys_deleted += 1
+    history_keys_deleted = orchestrator.redis_client.delete(*user_memory_keys(username, projeto))
     
     print(f"[FLUSH] 📚 Deletou {history_keys_deleted} chave(s) de histórico/preferências")
     print(f"[FLUSH] ✅ Flush completo finalizado!")
@@ -946,20 +1031,8 @@ def reset_session():
 def get_database_info():
     """Informações sobre a base de dados e última sincronização"""
     try:
-        import psycopg2
-        from datetime import datetime
-        
         print("🔍 Buscando informações do banco de dados...")
         
-        # Configuração PostgreSQL
-        postgres_config = {
-            'host': os.getenv('POSTGRES_HOST', 'localhost'),
-            'port': int(os.getenv('POSTGRES_PORT', 5546)),
-            'database': os.getenv('POSTGRES_DB', 'ezpocket_logs'),
-            'user': os.getenv('POSTGRES_USER', 'ezpocket_user'),
-            'password': os.getenv('POSTGRES_PASSWORD', 'ezpocket_pass_2025')
-        }
-        
         bd_reference = os.getenv('BD_REFERENCE', 'Athena')
         print(f"   BD_REFERENCE: {bd_reference}")
         
@@ -972,7 +1045,7 @@ def get_database_info():
         # Se for Local, buscar informações da última sincronização
         if bd_reference.lower() == 'local':
             try:
-                conn = psycopg2.connect(**postgres_config)
+                conn = get_db_connection()
                 cursor = conn.cursor()
                 
                 # Buscar última sincronização bem-sucedida
@@ -996,7 +1069,6 @@ def get_database_info():
                     print("   ⚠️ Nenhuma sincronização encontrada no banco")
                 
                 cursor.close()
-                conn.close()
                 
             except Exception as db_error:
                 print(f"Erro ao buscar informações do banco: {db_error}")
@@ -1020,18 +1092,8 @@ def get_database_schema():
     com informações de colunas e descrições (excluindo dados sensíveis)
     """
     try:
-        import psycopg2
         from psycopg2.extras import RealDictCursor
         
-        # Configurações do PostgreSQL
-        db_config = {
-            'host': os.getenv('POSTGRES_HOST', 'localhost'),
-            'port': int(os.getenv('POSTGRES_PORT', 5546)),
-            'database': os.getenv('POSTGRES_DB', 'ezpocket_logs'),
-            'user': os.getenv('POSTGRES_USER', 'ezpocket_user'),
-            'password': os.getenv('POSTGRES_PASSWORD', 'ezpocket_pass_2025')
-        }
-        
         # Lista de colunas sensíveis que devem ser ocultadas
         sensitive_columns = [
             'customer email', 'shipping address', 'zip code',
@@ -1041,8 +1103,8 @@ def get_database_schema():
             'token', 'secret', 'api_key', 'private_key'
         ]
         
-        # Conecta ao PostgreSQL
-        conn = psycopg2.connect(**db_config)
+        # Conexão do pool (devolvida ao fim da requisição)
+        conn = get_db_connection()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
         # Query para obter informações das tabelas e colunas
@@ -1103,7 +1165,6 @@ def get_database_schema():
                 })
         
         cursor.close()
-        conn.close()
         
         # Converte dict para lista
         tables_list = list(tables_dict.values())
@@ -1112,7 +1173,7 @@ def get_database_schema():
             "success": True,
             "schema": tables_list,
             "total_tables": len(tables_list),
-            "database": db_config['database']
+            "database": POSTGRES_CONFIG['database']
         })
         
     except Exception as e:
@@ -1156,16 +1217,7 @@ def get_projects():
     try:
         username = request.user.get('preferred_username') or request.user.get('sub')
         
-        import psycopg2
-        postgres_config = {
-            'host': os.getenv('POSTGRES_HOST', 'localhost'),
-            'port': int(os.getenv('POSTGRES_PORT', 5546)),
-            'database': os.getenv('POSTGRES_DB', 'ezpocket_logs'),
-            'user': os.getenv('POSTGRES_USER', 'ezpocket_user'),
-            'password': os.getenv('POSTGRES_PASSWORD', 'ezpocket_pass_2025')
-        }
-        
-        conn = psycopg2.connect(**postgres_config)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -1187,7 +1239,6 @@ def get_projects():
             })
         
         cursor.close()
-        conn.close()
         
         return jsonify({
             'projects': projects,
@@ -1213,16 +1264,7 @@ def create_project():
         if not name:
             return jsonify({'error': 'Nome do projeto é obrigatório'}), 400
         
-        import psycopg2
-        postgres_config = {
-            'host': os.getenv('POSTGRES_HOST', 'localhost'),
-            'port': int(os.getenv('POSTGRES_PORT', 5546)),
-            'database': os.getenv('POSTGRES_DB', 'ezpocket_logs'),
-            'user': os.getenv('POSTGRES_USER', 'ezpocket_user'),
-            'password': os.getenv('POSTGRES_PASSWORD', 'ezpocket_pass_2025')
-        }
-        
-        conn = psycopg2.connect(**postgres_config)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         # Metadata básico do projeto
@@ -1250,7 +1292,6 @@ def create_project():
         
         conn.commit()
         cursor.close()
-        conn.close()
         
         print(f"✅ Projeto criado: {name} para {username}")
         return jsonify({
@@ -1273,16 +1314,7 @@ def get_conversations(project_id):
     try:
         username = request.user.get('preferred_username') or request.user.get('sub')
         
-        import psycopg2
-        postgres_config = {
-            'host': os.getenv('POSTGRES_HOST', 'localhost'),
-            'port': int(os.getenv('POSTGRES_PORT', 5546)),
-            'database': os.getenv('POSTGRES_DB', 'ezpocket_logs'),
-            'user': os.getenv('POSTGRES_USER', 'ezpocket_user'),
-            'password': os.getenv('POSTGRES_PASSWORD', 'ezpocket_pass_2025')
-        }
-        
-        conn = psycopg2.connect(**postgres_config)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         # Verificar se o projeto pertence ao usuário
@@ -1314,7 +1346,6 @@ def get_conversations(project_id):
             })
         
         cursor.close()
-        conn.close()
         
         return jsonify({
             'conversations': conversations,
@@ -1340,16 +1371,7 @@ def save_conversation(project_id):
         if not sender or not message:
             return jsonify({'error': 'Sender e message são obrigatórios'}), 400
         
-        import psycopg2
-        postgres_config = {
-            'host': os.getenv('POSTGRES_HOST', 'localhost'),
-            'port': int(os.getenv('POSTGRES_PORT', 5546)),
-            'database': os.getenv('POSTGRES_DB', 'ezpocket_logs'),
-            'user': os.getenv('POSTGRES_USER', 'ezpocket_user'),
-            'password': os.getenv('POSTGRES_PASSWORD', 'ezpocket_pass_2025')
-        }
-        
-        conn = psycopg2.connect(**postgres_config)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         # Verificar permissão
@@ -1383,7 +1405,6 @@ def save_conversation(project_id):
         
         conn.commit()
         cursor.close()
-        conn.close()
         
         return jsonify({
             'id': str(conversation_id),
@@ -1403,16 +1424,7 @@ def delete_project(project_id):
     try:
         username = request.user.get('preferred_username') or request.user.get('sub')
         
-        import psycopg2
-        postgres_config = {
-            'host': os.getenv('POSTGRES_HOST', 'localhost'),
-            'port': int(os.getenv('POSTGRES_PORT', 5546)),
-            'database': os.getenv('POSTGRES_DB', 'ezpocket_logs'),
-            'user': os.getenv('POSTGRES_USER', 'ezpocket_user'),
-            'password': os.getenv('POSTGRES_PASSWORD', 'ezpocket_pass_2025')
-        }
-        
-        conn = psycopg2.connect(**postgres_config)
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         # Verificar se o projeto pertence ao usuário
@@ -1436,7 +1448,6 @@ def delete_project(project_id):
         
         conn.commit()
         cursor.close()
-        conn.close()
         
         print(f"✅ Projeto deletado: {project_name} (ID: {project_id}) do usuário {username}")
         return jsonify({
@@ -1449,6 +1460,41 @@ def delete_project(project_id):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/results', methods=['GET'])
+@token_required
+def get_result_page():
+    """
+    Página de resultados de uma query (results_ref recebido no module_update)
+    
+    Query params:
+        ref: results_ref (blob:{sha256})
+        projeto: Projeto do job que gerou o resultado (o blob precisa ser do
+                 usuário do token neste projeto)
+        page: Página, começando em 1 (padrão: 1)
+        page_size: Linhas por página (padrão: WS_RESULT_PAGE_SIZE, máx 500)
+    """
+    try:
+        username = request.user.get('preferred_username') or request.user.get('sub')
+        results_ref = request.args.get('ref', '')
+        projeto = request.args.get('projeto', '')
+        page = max(1, request.args.get('page', 1, type=int))
+        page_size = min(max(1, request.args.get('page_size', WS_RESULT_PAGE_SIZE, type=int)), WS_RESULT_MAX_PAGE_SIZE)
+        
+        if not projeto:
+            return jsonify({'error': 'Parâmetro projeto é obrigatório'}), 400
+        
+        # Blob de outro usuário/projeto responde como inexistente (não revela que o ref existe)
+        result_page = orchestrator.get_result_page(results_ref, queue_owner(username, projeto), page, page_size)
+        if result_page is None:
+            return jsonify({'error': 'Resultado não encontrado ou expirado'}), 404
+        
+        return jsonify(result_page), 200
+        
+    except Exception as e:
+        print(f"❌ Erro ao buscar página de resultados: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/test-orchestrator/health', methods=['GET'])
 def health():
     """Verifica se o serviço está rodando"""
@@ -1467,7 +1513,10 @@ def health():
         "websocket": "enabled",
         "redis_status": redis_status,
         "redis_host": REDIS_CONFIG['host'],
-        "redis_port": REDIS_CONFIG['port']
+        "redis_port": REDIS_CONFIG['port'],
+        "postgres_pool": postgres_pool.stats(),
+        "admission": admission.stats(),
+        "llm": llm_stats(orchestrator.redis_client)
     })
 
 
@@ -1570,9 +1619,8 @@ def handle_start_job(data):
         for existing_job_id, sid in list(active_sessions.items()):
             if sid == request.sid:
                 # Verificar se o job ainda está ativo
-                job_data_raw = orchestrator.redis_client.get(f"job:{existing_job_id}")
-                if job_data_raw:
-                    job_data = json.loads(job_data_raw)
+                job_data = orchestrator.get_job_status(existing_job_id, with_chain=False)
+                if job_data:
                     job_status = job_data.get('status', 'processing')
                     if job_status not in ['completed', 'failed', 'partial_failure', 'cancelled']:
                         print(f"[WS] ⚠️  Já existe um job ativo ({existing_job_id[:8]}...) para esta sessão")
@@ -1583,6 +1631,13 @@ def handle_start_job(data):
                         })
                         return
         
+        # ADMISSÃO: fila global cheia ou usuário/projeto acima do limite → recusa imediata
+        rejection = admission.check(username, projeto)
+        if rejection:
+            print(f"[WS] 🚦 Job recusado ({rejection['type']}) para {username}/{projeto} - tentar em {rejection['retry_after']}s")
+            emit('error', rejection)
+            return
+        
         print(f"\n{'='*80}")
         print(f"[WS] Novo job iniciado")
         print(f"[WS] Módulo: {module}")
@@ -1603,15 +1658,10 @@ def handle_start_job(data):
             'projeto': projeto
         }
         
-        # Preparar contexto para IA
-        context_for_ai = ""
-        if conversation_history:
-            context_for_ai = "\n\n--- HISTÓRICO DA CONVERSA ---\n"
-            for msg in conversation_history:
-                sender_label = "Usuário" if msg['sender'] == 'user' else "Assistente"
-                context_for_ai += f"{sender_label}: {msg['message']}\n"
-            context_for_ai += "--- FIM DO HISTÓRICO ---\n\n"
-            print(f"[WS] 📚 Contexto preparado com {len(conversation_history)} mensagens")
+        # Preparar contexto para IA: resumo das mensagens antigas + recentes, dentro do orçamento de tokens
+        context_for_ai = context_builder.build(username, projeto, conversation_history)
+        if context_for_ai:
+            print(f"[WS] 📚 Contexto preparado: {len(conversation_history)} mensagens → {count_tokens(context_for_ai)} tokens")
         
         # Submete o job com contexto
         job_id = orchestrator.submit_job(
@@ -1639,13 +1689,8 @@ def handle_start_job(data):
             'expected_flow': EXPECTED_FLOW.get(module, f"{module} (flow não definido)")
         })
         
-        # Iniciar thread de monitoramento
-        monitor_thread = threading.Thread(
-            target=monitor_job,
-            args=(job_id, request.sid),
-            daemon=True
-        )
-        monitor_thread.start()
+        # Acompanhar o job no monitor único (sem thread por job)
+        job_monitor.watch(job_id, request.sid, queue_owner(username, projeto))
         
     except Exception as e:
         print(f"[WS] Erro ao iniciar job: {str(e)}")
@@ -1670,12 +1715,11 @@ def handle_send_input(data):
         print(f"[WS] Input recebido: job={job_id[:8]}..., type={input_type}, value={input_value}")
         
         # Buscar job para pegar username e projeto
-        job_data_json = orchestrator.redis_client.get(f"job:{job_id}")
-        if not job_data_json:
+        job_data = orchestrator.get_job_status(job_id, with_chain=False)
+        if not job_data:
             emit('error', {'message': 'Job não encontrado'})
             return
         
-        job_data = json.loads(job_data_json)
         username = job_data.get('username', 'test_user')
         projeto = job_data.get('projeto', 'test_project')
         
@@ -1799,10 +1843,10 @@ def handle_send_input(data):
             # NÃO deletar pending - o worker faz isso
             
             # IMPORTANTE: Resetar flags para permitir nova confirmação do plano refinado
-            # O monitor_job já reseta confirmation_checked quando detecta user_proposed_plan
+            # O job_monitor já reseta confirmation_checked quando detecta user_proposed_plan
             # Mas precisamos resetar user_plan_checked aqui para permitir múltiplas rejeições
             for active_job_id, sid in active_sessions.items():
-                job = json.loads(orchestrator.redis_client.get(f"job:{active_job_id}") or '{}')
+                job = orchestrator.get_job_status(active_job_id, with_chain=False) or {}
                 if job.get('username') == username and job.get('projeto') == projeto:
                     # Flags serão resetadas na próxima iteração do monitor
                     print(f"[WS] Flags de controle serão resetadas para permitir nova confirmação")
@@ -1812,6 +1856,17 @@ def handle_send_input(data):
                 'message': 'Sugestão registrada e será processada pelo Plan Refiner'
             })
         
+        # Re-enfileirar o job que estava estacionado aguardando este input
+        # (user_feedback_rating só guarda a nota - o job volta com o comentário)
+        resume_module = {
+            'plan_confirmation': 'plan_confirm',
+            'user_feedback': 'user_feedback',
+            'user_feedback_comment': 'user_feedback',
+            'user_proposed_plan': 'user_proposed_plan'
+        }.get(input_type)
+        if resume_module:
+            orchestrator.resume_waiting_job(resume_module, username, projeto)
+        
         # Remover de pending_inputs
         if job_id in pending_inputs:
             del pending_inputs[job_id]
@@ -1897,35 +1952,31 @@ def handle_flush_redis(data):
         
         # 2. Buscar e deletar TODOS os jobs do usuário/projeto (ativos + completados)
         print(f"\n[WS] 🔍 Buscando TODOS os jobs de {username}/{projeto}...")
-        all_job_keys = orchestrator.redis_client.keys("job:*")
         jobs_deleted = 0
         sessions_closed = 0
         
-        for job_key in all_job_keys:
+        # Índice user_jobs:{username}:{projeto} - só os jobs deste usuário, sem KEYS job:*
+        for job_obj in orchestrator.get_user_jobs(username, projeto):
             try:
-                job_data = orchestrator.redis_client.get(job_key)
-                if job_data:
-                    job_obj = json.loads(job_data)
-                    if job_obj.get('username') == username and job_obj.get('projeto') == projeto:
-                        job_id = job_key.decode('utf-8') if isinstance(job_key, bytes) else job_key
-                        job_id = job_id.replace('job:', '')
-                        
-                        # Remover sessão ativa se existir
-                        if job_id in active_sessions:
-                            del active_sessions[job_id]
-                            sessions_closed += 1
-                            print(f"[WS] 🔌 Sessão fechada: {job_id[:8]}...")
-                        
-                        if job_id in pending_inputs:
-                            del pending_inputs[job_id]
-                        
-                        # Deletar job do Redis (independente do status)
-                        orchestrator.redis_client.delete(job_key)
-                        jobs_deleted += 1
-                        status = job_obj.get('consolidated_status', job_obj.get('status', 'unknown'))
-                        print(f"[WS] 🗑️ Job [{status}] deletado: {job_id[:8]}...")
+                job_id = job_obj['job_id']
+                
+                # Remover sessão ativa se existir
+                if job_id in active_sessions:
+                    del active_sessions[job_id]
+                    sessions_closed += 1
+                    print(f"[WS] 🔌 Sessão fechada: {job_id[:8]}...")
+                
+                if job_id in pending_inputs:
+                    del pending_inputs[job_id]
+                
+                # Deletar job do Redis (independente do status)
+                orchestrator.redis_client.delete(f"job:{job_id}", f"chain:{job_id}")
+                jobs_deleted += 1
+                status = job_obj.get('consolidated_status', job_obj.get('status', 'unknown'))
+                print(f"[WS] 🗑️ Job [{status}] deletado: {job_id[:8]}...")
             except Exception as e:
-                print(f"[WS] ⚠️ Erro ao processar {job_key}: {e}")
+                print(f"[WS] ⚠️ Erro ao processar job {job_obj.get('job_id')}: {e}")
+        orchestrator.redis_client.delete(user_jobs_key(username, projeto))
         
         # 3. Deletar TODAS as filas (queues) dos módulos
         print(f"\n[WS] 🔍 Removendo filas (queues) dos módulos...")
@@ -1953,6 +2004,10 @@ def handle_flush_redis(data):
                 orchestrator.redis_client.delete(queue_name)
                 queues_deleted += 1
                 print(f"[WS] 🗑️ Fila deletada: {queue_name} ({queue_length} items)")
+            
+            # Sub-filas deste usuário/projeto (escalonamento fair)
+            module = queue_name.split(':', 1)[1]
+            queues_deleted += orchestrator.redis_client.delete(*user_queue_keys(module, username, projeto))
         
         total_deleted = deleted_count + jobs_deleted + queues_deleted
         print(f"\n[WS] ✅ LIMPEZA TOTAL CONCLUÍDA:")
@@ -1999,6 +2054,7 @@ if __name__ == '__main__':
     print("  disconnect           - Desconectar")
     print("\nHTTP Endpoints:")
     print("  GET  /                              - Frontend HTML")
+    print("  GET  /api/results?ref=&page=        - Página de resultados de uma query")
     print("  GET  /test-orchestrator/health      - Status do serviço")
     print("=" * 80)
     
@@ -12,6 +12,7 @@ backend_path = str(Path(__file__).parent.parent.parent)
 sys.path.insert(0, backend_path)
 
 from agents.graph_orchestrator.graph_orchestrator import ModuleWorker
+from agents.graph_orchestrator.speculation import take, analysis_key_args
 from agents.analysis_orchestrator_agent.analysis_orchestrator import AnalysisOrchestratorAgent
 from typing import Dict, Any
 
@@ -57,8 +58,10 @@ class AnalysisOrchestratorWorker(ModuleWorker):
         # Passar state completo (inclui conversation_context e has_history)
         state = dict(data)
         
-        # Gerar query SQL
-        result = self.agent.generate_query(state)
+        # Gerar query SQL (ou reaproveitar a gerada durante a confirmação do plano)
+        result = take(self.redis_client, data.get('root_job_id'), 'analysis_orchestrator', analysis_key_args(state))
+        if result is None:
+            result = self.agent.generate_query(state)
         
         # Verificar se houve erro
         if result.get('error'):
@@ -11,7 +11,8 @@ from pathlib import Path
 backend_path = str(Path(__file__).parent.parent.parent)
 sys.path.insert(0, backend_path)
 
-from agents.graph_orchestrator.graph_orchestrator import ModuleWorker
+from agents.graph_orchestrator.graph_orchestrator import ModuleWorker, queue_owner
+from agents.graph_orchestrator.speculation import take
 from agents.athena_executor_agent.athena_executor import AthenaExecutorAgent
 from typing import Dict, Any
 
@@ -41,6 +42,7 @@ class AthenaExecutorWorker(ModuleWorker):
             - column_count: int
             - columns: list
             - results_preview: list (primeiras 100 linhas)
+            - results_full: list (inline se pequeno) ou results_full_ref: str (blob)
             - data_size_mb: float
             - database: str
             - region: str
@@ -62,12 +64,15 @@ class AthenaExecutorWorker(ModuleWorker):
         print(f"[ATHENA_EXECUTOR]    Projeto: {projeto}")
         print(f"[ATHENA_EXECUTOR]    Origem: {'AutoCorrection' if came_from_correction else 'SQLValidator'}")
         
-        # Executar query
-        result = self.agent.execute(
-            query_sql=query_sql,
-            username=username,
-            projeto=projeto
-        )
+        # Executar query (ou reaproveitar a execução especulativa, SPECULATIVE_SQL=execute)
+        execute_args = {
+            'query_sql': query_sql,
+            'username': username,
+            'projeto': projeto
+        }
+        result = take(self.redis_client, data.get('root_job_id'), 'athena_executor', execute_args)
+        if result is None:
+            result = self.agent.execute(**execute_args)
         
         # Debug: verificar tipo do result
         print(f"[ATHENA_EXECUTOR] 🔍 DEBUG: type(result) = {type(result)}")
@@ -94,6 +99,9 @@ class AthenaExecutorWorker(ModuleWorker):
                     'error': f'Tipo inesperado retornado pelo agent: {type(result)}'
                 }
         
+        # Resultado completo vai para o blob (claim-check): só a referência segue no grafo
+        self.offload_results(result, queue_owner(username, projeto))
+        
         print(f"[ATHENA_EXECUTOR] ✅ Execução concluída")
         print(f"[ATHENA_EXECUTOR]    Success: {result.get('success', False)}")
         print(f"[ATHENA_EXECUTOR]    Rows: {result.get('row_count', 0)}")
@@ -12,6 +12,7 @@ backend_path = str(Path(__file__).parent.parent.parent)
 sys.path.insert(0, backend_path)
 
 from agents.graph_orchestrator.graph_orchestrator import ModuleWorker
+from agents.graph_orchestrator.speculation import take, collect_validation_issues
 from agents.auto_correction_agent.auto_correction import AutoCorrectionAgent
 from typing import Dict, Any
 
@@ -47,29 +48,26 @@ class AutoCorrectionWorker(ModuleWorker):
         username = data.get('username', 'unknown')
         projeto = data.get('projeto', 'default')
         
-        # Combinar issues de validação
-        validation_issues = []
-        validation_issues.extend(data.get('security_issues', []))
-        validation_issues.extend(data.get('warnings', []))
-        
-        # Adicionar erro se houver
-        if data.get('error'):
-            validation_issues.append(data.get('error'))
+        # Combinar issues de validação (security_issues + warnings + erro, se houver)
+        validation_issues = collect_validation_issues(data)
         
         print(f"[AUTO_CORRECTION] 🔧 Corrigindo query SQL...")
         print(f"[AUTO_CORRECTION]    Username: {username}")
         print(f"[AUTO_CORRECTION]    Projeto: {projeto}")
         print(f"[AUTO_CORRECTION]    Issues: {len(validation_issues)}")
         
-        # Corrigir query (com contexto se houver)
-        result = self.agent.correct(
-            query_original=query_original,
-            validation_issues=validation_issues,
-            username=username,
-            projeto=projeto,
-            conversation_context=data.get('conversation_context', ''),
-            has_history=data.get('has_history', False)
-        )
+        # Corrigir query (com contexto se houver) ou reaproveitar a correção especulativa
+        correct_args = {
+            'query_original': query_original,
+            'validation_issues': validation_issues,
+            'username': username,
+            'projeto': projeto,
+            'conversation_context': data.get('conversation_context', ''),
+            'has_history': data.get('has_history', False)
+        }
+        result = take(self.redis_client, data.get('root_job_id'), 'auto_correction', correct_args)
+        if result is None:
+            result = self.agent.correct(**correct_args)
         
         print(f"[AUTO_CORRECTION] ✅ Correção concluída")
         print(f"[AUTO_CORRECTION]    Success: {result['success']}")
@@ -57,6 +57,10 @@ class HistoryPreferencesWorker(ModuleWorker):
         # Isso mantém TODOS os campos do módulo anterior
         state = dict(data)  # Copia tudo
         
+        # athena_executor: carregar results_full do blob (claim-check) para gravar no log
+        if data.get('previous_module') == 'athena_executor':
+            state = self.resolve_results(state)
+        
         # Carregar contexto
         result_state = self.agent.load_context(state)
         
@@ -74,16 +78,7 @@ class HistoryPreferencesWorker(ModuleWorker):
             'execution_time': 0.1,  # TODO: medir tempo real
         })
         
-        # Se o agente definiu _next_modules, repassar (ex: response_composer → user_feedback)
-        if '_next_modules' in save_state:
-            output['_next_modules'] = save_state['_next_modules']
-            print(f"   🔀 Repassando _next_modules: {save_state['_next_modules']}")
-        
-        # IMPORTANTE: Repassar response_text para user_feedback
-        if 'response_text' in save_state:
-            output['response_text'] = save_state['response_text']
-            print(f"   📝 Repassando response_text ({len(save_state['response_text'])} chars) para próximo módulo")
-        
+        # Branch de log: termina aqui (response_composer já segue direto para user_feedback)
         return output
 
 if __name__ == '__main__':
@@ -12,6 +12,7 @@ backend_path = str(Path(__file__).parent.parent.parent)
 sys.path.insert(0, backend_path)
 
 from agents.graph_orchestrator.graph_orchestrator import ModuleWorker
+from agents.graph_orchestrator.speculation import SpeculativeRunner, speculation_enabled
 from agents.plan_confirm_agent.plan_confirm import PlanConfirmAgent
 from typing import Dict, Any
 
@@ -21,6 +22,8 @@ class PlanConfirmWorker(ModuleWorker):
     def __init__(self):
         super().__init__('plan_confirm')
         self.agent = PlanConfirmAgent()
+        # SPECULATIVE_SQL: gera/valida (e opcionalmente executa) a query enquanto o usuário confirma
+        self.speculation = SpeculativeRunner(self.redis_client) if speculation_enabled() else None
     
     def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -63,103 +66,130 @@ class PlanConfirmWorker(ModuleWorker):
         pending_key = f"plan_confirm:pending:{username}:{projeto}"
         response_key = f"plan_confirm:response:{username}:{projeto}"
         
-        # Salvar plano no Redis
-        plan_data = {
-            'pergunta': pergunta,
-            'plan': plan,
-            'plan_steps': json.dumps(plan_steps),
-            'username': username,
-            'projeto': projeto,
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        redis_client.hset(pending_key, mapping=plan_data)
-        redis_client.expire(pending_key, 300)  # Expira em 5 minutos
-        
-        print(f"[PLAN_CONFIRM]    ✅ Plano salvo no Redis: {pending_key}")
-        print(f"[PLAN_CONFIRM]    ⏳ Aguardando resposta do usuário (máx 5 min)...")
-        
-        # Aguardar resposta do test_client por até 5 minutos
+        # Aguardar resposta por até 5 minutos sem segurar o worker:
+        # o job é estacionado e volta para esta fila quando o usuário responder
+        # (ou quando o prazo expirar), com data['_wait'] preenchido
         timeout = 300
-        start = time.time()
-        
-        while (time.time() - start) < timeout:
-            # VERIFICAR SE A CHAVE PENDENTE AINDA EXISTE (pode ter sido apagada no disconnect)
-            if not redis_client.exists(pending_key):
-                print(f"[PLAN_CONFIRM]    🚫 Chave pendente foi removida (usuário desconectou) - cancelando espera")
-                # Retornar resultado neutro para não criar jobs subsequentes
-                return {
-                    'pergunta': pergunta,
-                    'username': username,
-                    'projeto': projeto,
-                    'previous_module': 'plan_confirm',
-                    'confirmed': False,
-                    'cancelled': True,
-                    'cancel_reason': 'user_disconnected',
-                    '_next_modules': []  # Não criar próximos módulos
-                }
-            
-            response = redis_client.get(response_key)
-            if response:
-                print(f"[PLAN_CONFIRM]    🔍 DEBUG - Resposta bruta do Redis: '{response}' (tipo: {type(response)})")
-                print(f"[PLAN_CONFIRM]    🔍 DEBUG - response.lower(): '{response.lower()}'")
-                print(f"[PLAN_CONFIRM]    🔍 DEBUG - response.strip(): '{response.strip()}'")
-                
-                confirmed = response.strip().lower() in ['true', 'yes', 's', 'sim', '1']
-                
-                print(f"[PLAN_CONFIRM]    🔍 DEBUG - confirmed final: {confirmed}")
-                
-                # Limpar Redis
-                redis_client.delete(pending_key)
-                redis_client.delete(response_key)
-                
-                print(f"[PLAN_CONFIRM]    ✅ Resposta recebida: {'APROVADO' if confirmed else 'REJEITADO'}")
-                
-                # Log será salvo automaticamente pelo History Preferences Agent
-                
-                # LÓGICA CONDICIONAL:
-                # Se ACEITO (SIM) → [analysis_orchestrator, history_preferences] (2 paralelos)
-                # Se REJEITADO (NÃO) → [user_proposed_plan, history_preferences] (2 paralelos)
-                next_modules = ['analysis_orchestrator', 'history_preferences'] if confirmed else ['user_proposed_plan', 'history_preferences']
-                
-                print(f"[PLAN_CONFIRM]    ❗ DEBUG:")
-                print(f"[PLAN_CONFIRM]       confirmed = {confirmed}")
-                print(f"[PLAN_CONFIRM]       Ramo escolhido: {'ACEITO (analysis_orchestrator)' if confirmed else 'REJEITADO (user_proposed_plan)'}")
-                print(f"[PLAN_CONFIRM]    🔀 Próximos módulos definidos: {next_modules}")
-                
-                output = {
-                    'pergunta': pergunta,
-                    'username': username,
-                    'projeto': projeto,
-                    'previous_module': 'plan_confirm',
-                    'confirmed': confirmed,
-                    'confirmation_method': 'interactive',
-                    'confirmation_time': datetime.now().isoformat(),
-                    'user_feedback': 'Plano aprovado' if confirmed else 'Plano rejeitado',
-                    'plan_accepted': confirmed,
-                    # Manter dados do plano para o history salvar
-                    'plan': plan,
-                    'plan_steps': plan_steps,
-                    'estimated_complexity': data.get('estimated_complexity', 'média'),
-                    'execution_time': time.time() - start,
-                    '_next_modules': next_modules,
-                    # Parent IDs para propagar
-                    'parent_intent_validator_id': data.get('intent_validator_id'),
-                    'parent_plan_builder_id': data.get('parent_id'),
-                    'intent_category': data.get('intent_category')
-                }
-                
-                print(f"[PLAN_CONFIRM]    ✅ Output contém '_next_modules': {'_next_modules' in output}")
-                print(f"[PLAN_CONFIRM]    ✅ Valor de '_next_modules': {output.get('_next_modules')}")
-                
-                return output
-            
-            time.sleep(0.5)
+        wait = data.get('_wait')
+        
+        if not wait:
+            # Salvar plano no Redis
+            plan_data = {
+                'pergunta': pergunta,
+                'plan': plan,
+                'plan_steps': json.dumps(plan_steps),
+                'username': username,
+                'projeto': projeto,
+                'timestamp': datetime.now().isoformat()
+            }
+            
+            redis_client.hset(pending_key, mapping=plan_data)
+            # Vive além do prazo (como waiting:*): no timeout a chave ainda existe e não parece disconnect
+            redis_client.expire(pending_key, timeout + 60)
+            
+            print(f"[PLAN_CONFIRM]    ✅ Plano salvo no Redis: {pending_key}")
+            print(f"[PLAN_CONFIRM]    ⏳ Aguardando resposta do usuário (máx 5 min) - worker liberado")
+            
+            if self.speculation:
+                self.speculation.start(data)
+            
+            # Avisar o websocket (push) que o usuário precisa confirmar o plano
+            # (publicado pelo ModuleWorker depois que o job está estacionado)
+            return self.wait_for_input(timeout, input_needed={
+                'input_type': 'plan_confirmation',
+                'plan': plan,
+                'plan_steps': plan_steps
+            })
+        
+        start = wait['since']
+        
+        response = redis_client.get(response_key)
+        if response:
+            print(f"[PLAN_CONFIRM]    🔍 DEBUG - Resposta bruta do Redis: '{response}' (tipo: {type(response)})")
+            print(f"[PLAN_CONFIRM]    🔍 DEBUG - response.lower(): '{response.lower()}'")
+            print(f"[PLAN_CONFIRM]    🔍 DEBUG - response.strip(): '{response.strip()}'")
+            
+            confirmed = response.strip().lower() in ['true', 'yes', 's', 'sim', '1']
+            
+            print(f"[PLAN_CONFIRM]    🔍 DEBUG - confirmed final: {confirmed}")
+            
+            # Limpar Redis
+            redis_client.delete(pending_key)
+            redis_client.delete(response_key)
+            
+            print(f"[PLAN_CONFIRM]    ✅ Resposta recebida: {'APROVADO' if confirmed else 'REJEITADO'}")
+            
+            # Aceito: analysis_orchestrator em diante reaproveitam a especulação; rejeitado: descartar
+            if self.speculation and not confirmed:
+                self.speculation.discard(data.get('root_job_id'))
+            
+            # Log será salvo automaticamente pelo History Preferences Agent
+            
+            # LÓGICA CONDICIONAL:
+            # Se ACEITO (SIM) → [analysis_orchestrator, history_preferences] (2 paralelos)
+            # Se REJEITADO (NÃO) → [user_proposed_plan, history_preferences] (2 paralelos)
+            next_modules = ['analysis_orchestrator', 'history_preferences'] if confirmed else ['user_proposed_plan', 'history_preferences']
+            
+            print(f"[PLAN_CONFIRM]    ❗ DEBUG:")
+            print(f"[PLAN_CONFIRM]       confirmed = {confirmed}")
+            print(f"[PLAN_CONFIRM]       Ramo escolhido: {'ACEITO (analysis_orchestrator)' if confirmed else 'REJEITADO (user_proposed_plan)'}")
+            print(f"[PLAN_CONFIRM]    🔀 Próximos módulos definidos: {next_modules}")
+            
+            output = {
+                'pergunta': pergunta,
+                'username': username,
+                'projeto': projeto,
+                'previous_module': 'plan_confirm',
+                'confirmed': confirmed,
+                'confirmation_method': 'interactive',
+                'confirmation_time': datetime.now().isoformat(),
+                'user_feedback': 'Plano aprovado' if confirmed else 'Plano rejeitado',
+                'plan_accepted': confirmed,
+                # Manter dados do plano para o history salvar
+                'plan': plan,
+                'plan_steps': plan_steps,
+                'estimated_complexity': data.get('estimated_complexity', 'média'),
+                'execution_time': time.time() - start,
+                '_next_modules': next_modules,
+                # Parent IDs para propagar
+                'parent_intent_validator_id': data.get('intent_validator_id'),
+                'parent_plan_builder_id': data.get('parent_id'),
+                'intent_category': data.get('intent_category')
+            }
+            
+            print(f"[PLAN_CONFIRM]    ✅ Output contém '_next_modules': {'_next_modules' in output}")
+            print(f"[PLAN_CONFIRM]    ✅ Valor de '_next_modules': {output.get('_next_modules')}")
+            
+            return output
+        
+        # VERIFICAR SE A CHAVE PENDENTE AINDA EXISTE (pode ter sido apagada no disconnect)
+        # Prazo expirado é timeout (rejeição automática), mesmo sem a chave
+        if not wait['expired'] and not redis_client.exists(pending_key):
+            print(f"[PLAN_CONFIRM]    🚫 Chave pendente foi removida (usuário desconectou) - cancelando espera")
+            if self.speculation:
+                self.speculation.discard(data.get('root_job_id'), reason='usuário desconectou')
+            # Retornar resultado neutro para não criar jobs subsequentes
+            return {
+                'pergunta': pergunta,
+                'username': username,
+                'projeto': projeto,
+                'previous_module': 'plan_confirm',
+                'confirmed': False,
+                'cancelled': True,
+                'cancel_reason': 'user_disconnected',
+                '_next_modules': []  # Não criar próximos módulos
+            }
+        
+        # Retomado sem resposta antes do prazo (ex: prazo desatualizado) - voltar a esperar
+        if not wait['expired']:
+            return self.wait_for_input(max(1, int(wait['deadline'] - time.time())))
         
         # Timeout
         redis_client.delete(pending_key)
         
         print(f"[PLAN_CONFIRM]    ⏱️  TIMEOUT - Rejeitando automaticamente")
+        if self.speculation:
+            self.speculation.discard(data.get('root_job_id'), reason='timeout')
         
         # Log será salvo automaticamente pelo History Preferences Agent
         
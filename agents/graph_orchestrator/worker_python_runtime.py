@@ -29,7 +29,7 @@ class PythonRuntimeWorker(ModuleWorker):
         Processa análise estatística dos resultados
         
         Input esperado (de Athena Executor):
-            - results_full: list (todos os resultados)
+            - results_full: list (todos os resultados) ou results_full_ref: str (blob)
             - results_preview: list (primeiras 100 linhas)
             - query_executed: str
             - pergunta: str
@@ -52,6 +52,8 @@ class PythonRuntimeWorker(ModuleWorker):
         """
         
         # Extrair dados do input
+        # O agente só amostra as 100 primeiras linhas (= results_preview), então
+        # results_full_ref (claim-check) não precisa ser carregado aqui
         results_full = data.get('results_full', [])
         results_preview = data.get('results_preview', [])
         query_executed = data.get('query_executed', '')
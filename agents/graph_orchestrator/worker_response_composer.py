@@ -2,6 +2,12 @@
 """
 Worker para Response Composer Agent
 Recebe análise do Python Runtime e formata resposta bonita para o usuário
+
+Com RESPONSE_STREAMING=true o texto da resposta vai para o navegador
+enquanto o modelo gera: os pedaços são publicados como eventos
+answer_delta no stream job_events:{root_job_id} (o mesmo que o monitor do
+websocket já consome) e o output completo segue para o grafo no fim, como
+antes.
 """
 
 import sys
@@ -17,6 +23,43 @@ from agents.graph_orchestrator.graph_orchestrator import ModuleWorker
 from agents.response_composer_agent.response_composer import ResponseComposerAgent
 from typing import Dict, Any
 
+RESPONSE_STREAMING = os.getenv('RESPONSE_STREAMING', 'true').lower() == 'true'  # Resposta em streaming para o navegador
+RESPONSE_STREAM_FLUSH_MS = int(os.getenv('RESPONSE_STREAM_FLUSH_MS', 50))       # Intervalo mínimo entre eventos answer_delta
+
+
+class AnswerDeltaPublisher:
+    """Junta os pedaços do response_text e publica como eventos answer_delta do job raiz"""
+    
+    def __init__(self, worker: ModuleWorker, root_job_id: str, job_id: str):
+        self.worker = worker
+        self.root_job_id = root_job_id
+        self.job_id = job_id
+        self.pending = []
+        self.seq = 0
+        self.last_flush = 0.0  # Primeiro pedaço sai na hora
+    
+    def __call__(self, text: str):
+        self.pending.append(text)
+        if (time.time() - self.last_flush) * 1000 >= RESPONSE_STREAM_FLUSH_MS:
+            self.flush()
+    
+    def flush(self, done: bool = False):
+        if not self.pending and not done:
+            return
+        payload = {
+            'module': 'response_composer',
+            'job_id': self.job_id,
+            'seq': self.seq,
+            'delta': "".join(self.pending)
+        }
+        if done:
+            payload['done'] = True
+        self.worker.publish_event(self.root_job_id, 'answer_delta', payload)
+        self.seq += 1
+        self.pending = []
+        self.last_flush = time.time()
+
+
 class ResponseComposerWorker(ModuleWorker):
     """Worker para o módulo response_composer"""
     
@@ -64,7 +107,14 @@ class ResponseComposerWorker(ModuleWorker):
         start_time = time.time()
         
         # Executar composição - passar data completo como state
-        result = self.agent.execute(data)
+        publisher = None
+        if RESPONSE_STREAMING and data.get('root_job_id'):
+            publisher = AnswerDeltaPublisher(self, data['root_job_id'], data.get('job_id'))
+        
+        result = self.agent.execute(data, on_delta=publisher)
+        
+        if publisher is not None:
+            publisher.flush(done=True)
         
         execution_time = time.time() - start_time
         
@@ -93,13 +143,12 @@ class ResponseComposerWorker(ModuleWorker):
             **result,
             # Tempo de execução
             'execution_time': execution_time,
-            # Próximo módulo: history_preferences (salvar response_composer primeiro)
-            '_next_modules': ['history_preferences']
+            # Próximos módulos: user_feedback (pedir rating) + history_preferences (log)
+            '_next_modules': ['user_feedback', 'history_preferences']
         }
         
-        print(f"[RESPONSE_COMPOSER] 🔀 Enviando resposta formatada para: history_preferences")
+        print(f"[RESPONSE_COMPOSER] 🔀 Enviando resposta formatada para: user_feedback, history_preferences")
         print(f"[RESPONSE_COMPOSER]    response_text no output? {'response_text' in output}")
-        print(f"[RESPONSE_COMPOSER] 📝 History vai salvar e depois chamar user_feedback")
         
         return output
 
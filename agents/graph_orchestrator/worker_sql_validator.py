@@ -12,6 +12,7 @@ backend_path = str(Path(__file__).parent.parent.parent)
 sys.path.insert(0, backend_path)
 
 from agents.graph_orchestrator.graph_orchestrator import ModuleWorker
+from agents.graph_orchestrator.speculation import take
 from agents.sql_validator_agent.sql_validator import SQLValidatorAgent
 from typing import Dict, Any
 
@@ -57,13 +58,16 @@ class SQLValidatorWorker(ModuleWorker):
         print(f"[SQL_VALIDATOR]    Projeto: {projeto}")
         print(f"[SQL_VALIDATOR]    Complexidade: {estimated_complexity}")
         
-        # Validar query
-        result = self.agent.validate(
-            query_sql=query_sql,
-            username=username,
-            projeto=projeto,
-            estimated_complexity=estimated_complexity
-        )
+        # Validar query (ou reaproveitar a validação especulativa)
+        validate_args = {
+            'query_sql': query_sql,
+            'username': username,
+            'projeto': projeto,
+            'estimated_complexity': estimated_complexity
+        }
+        result = take(self.redis_client, data.get('root_job_id'), 'sql_validator', validate_args)
+        if result is None:
+            result = self.agent.validate(**validate_args)
         
         print(f"[SQL_VALIDATOR] ✅ Validação concluída")
         print(f"[SQL_VALIDATOR]    Valid: {result['valid']}")
@@ -117,50 +117,61 @@ class UserFeedbackWorker(ModuleWorker):
             feedback_key = f"user_feedback:pending:{username}:{projeto}"
             feedback_response_key = f"user_feedback:response:{username}:{projeto}"
             
-            # Salvar dados do feedback no Redis
-            r.hset(feedback_key, mapping={
-                'pergunta': pergunta,
-                'response_text': response_text,
-                'username': username,
-                'projeto': projeto
-            })
-            r.expire(feedback_key, 300)  # 5 minutos
+            # A espera não segura o worker: o job é estacionado e volta para esta
+            # fila quando o usuário responder (ou o prazo expirar), com data['_wait']
+            wait = data.get('_wait')
             
-            print(f"[USER_FEEDBACK] ⏳ Aguardando resposta do usuário...")
+            if not wait:
+                # Salvar dados do feedback no Redis
+                r.hset(feedback_key, mapping={
+                    'pergunta': pergunta,
+                    'response_text': response_text,
+                    'username': username,
+                    'projeto': projeto
+                })
+                # Vive além do prazo (como waiting:*): no timeout a chave ainda existe e não parece disconnect
+                r.expire(feedback_key, 300 + 60)
+                
+                print(f"[USER_FEEDBACK] ⏳ Aguardando resposta do usuário (máx 5 min) - worker liberado")
+                
+                # Avisar o websocket (push) que o usuário precisa dar a nota
+                # (publicado pelo ModuleWorker depois que o job está estacionado)
+                return self.wait_for_input(300, input_needed={
+                    'input_type': 'user_feedback',
+                    'pergunta': pergunta
+                })
             
-            # Aguardar resposta (timeout 5 minutos)
             comment = ''
-            for _ in range(300):
-                # VERIFICAR SE A CHAVE PENDENTE AINDA EXISTE (pode ter sido apagada no disconnect)
-                if not r.exists(feedback_key):
-                    print(f"[USER_FEEDBACK] 🚫 Chave pendente foi removida (usuário desconectou) - cancelando espera")
-                    # Retornar resultado neutro sem criar próximos módulos
-                    return {
-                        'pergunta': pergunta,
-                        'username': username,
-                        'projeto': projeto,
-                        'previous_module': 'user_feedback',
-                        'cancelled': True,
-                        'cancel_reason': 'user_disconnected',
-                        '_next_modules': []
-                    }
+            if r.exists(feedback_response_key):
+                feedback_response = json.loads(r.get(feedback_response_key))
+                rating = feedback_response.get('rating', 3)
+                comment = feedback_response.get('comment', '')
+                print(f"[USER_FEEDBACK] ✅ Resposta recebida: rating={rating}")
                 
-                if r.exists(feedback_response_key):
-                    feedback_response = json.loads(r.get(feedback_response_key))
-                    rating = feedback_response.get('rating', 3)
-                    comment = feedback_response.get('comment', '')
-                    print(f"[USER_FEEDBACK] ✅ Resposta recebida: rating={rating}")
-                    
-                    # Limpar chaves
-                    r.delete(feedback_key)
-                    r.delete(feedback_response_key)
-                    break
-                time.sleep(1)
+                # Limpar chaves
+                r.delete(feedback_key)
+                r.delete(feedback_response_key)
+            elif not wait['expired'] and not r.exists(feedback_key):
+                # CHAVE PENDENTE REMOVIDA (pode ter sido apagada no disconnect)
+                # Prazo expirado é timeout (rating padrão), mesmo sem a chave
+                print(f"[USER_FEEDBACK] 🚫 Chave pendente foi removida (usuário desconectou) - cancelando espera")
+                # Retornar resultado neutro sem criar próximos módulos
+                return {
+                    'pergunta': pergunta,
+                    'username': username,
+                    'projeto': projeto,
+                    'previous_module': 'user_feedback',
+                    'cancelled': True,
+                    'cancel_reason': 'user_disconnected',
+                    '_next_modules': []
+                }
+            elif not wait['expired']:
+                # Retomado sem resposta antes do prazo - voltar a esperar
+                return self.wait_for_input(max(1, int(wait['deadline'] - time.time())))
             else:
                 # Timeout - usar rating padrão
                 print(f"[USER_FEEDBACK] ⏱️  Timeout - usando rating padrão (3)")
                 rating = 3
-                comment = ''
                 r.delete(feedback_key)
         else:
             # Rating já foi fornecido no input
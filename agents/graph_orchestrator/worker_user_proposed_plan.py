@@ -46,77 +46,93 @@ class UserProposedPlanWorker(ModuleWorker):
         pending_key = f"user_proposed_plan:pending:{username}:{projeto}"
         response_key = f"user_proposed_plan:response:{username}:{projeto}"
         
-        # Salvar contexto no Redis
-        context_data = {
-            'pergunta': pergunta,
-            'username': username,
-            'projeto': projeto,
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        redis_client.hset(pending_key, mapping=context_data)
-        redis_client.expire(pending_key, 300)  # Expira em 5 minutos
+        # Aguardar resposta por até 5 minutos sem segurar o worker:
+        # o job é estacionado e volta para esta fila quando o usuário responder
+        # (ou quando o prazo expirar), com data['_wait'] preenchido
+        timeout = 300
+        wait = data.get('_wait')
         
-        print(f"[USER_PROPOSED_PLAN]    ✅ Contexto salvo no Redis: {pending_key}")
-        print(f"[USER_PROPOSED_PLAN]    ⏳ Aguardando sugestão do usuário (máx 5 min)...")
+        if not wait:
+            # Salvar contexto no Redis
+            context_data = {
+                'pergunta': pergunta,
+                'username': username,
+                'projeto': projeto,
+                'timestamp': datetime.now().isoformat()
+            }
+            
+            redis_client.hset(pending_key, mapping=context_data)
+            # Vive além do prazo (como waiting:*): no timeout a chave ainda existe e não parece disconnect
+            redis_client.expire(pending_key, timeout + 60)
+            
+            print(f"[USER_PROPOSED_PLAN]    ✅ Contexto salvo no Redis: {pending_key}")
+            print(f"[USER_PROPOSED_PLAN]    ⏳ Aguardando sugestão do usuário (máx 5 min) - worker liberado")
+            
+            # Avisar o websocket (push) que o usuário pode propor um plano alternativo
+            # (publicado pelo ModuleWorker depois que o job está estacionado)
+            return self.wait_for_input(timeout, input_needed={
+                'input_type': 'user_proposed_plan',
+                'pergunta': pergunta,
+                'rejected_plan': data.get('plan', '')
+            })
         
-        # Aguardar resposta por até 5 minutos
-        timeout = 300
-        start = time.time()
+        start = wait['since']
         
-        while (time.time() - start) < timeout:
-            # VERIFICAR SE A CHAVE PENDENTE AINDA EXISTE (pode ter sido apagada no disconnect)
-            if not redis_client.exists(pending_key):
-                print(f"[USER_PROPOSED_PLAN]    🚫 Chave pendente foi removida (usuário desconectou) - cancelando espera")
-                # Retornar resultado neutro sem criar próximos módulos
-                return {
-                    'pergunta': pergunta,
-                    'username': username,
-                    'projeto': projeto,
-                    'previous_module': 'user_proposed_plan',
-                    'cancelled': True,
-                    'cancel_reason': 'user_disconnected',
-                    '_next_modules': []
-                }
+        response = redis_client.get(response_key)
+        if response:
+            user_suggestion = response
             
-            response = redis_client.get(response_key)
-            if response:
-                user_suggestion = response
-                
-                # Limpar Redis
-                redis_client.delete(pending_key)
-                redis_client.delete(response_key)
-                
-                print(f"[USER_PROPOSED_PLAN]    ✅ Sugestão recebida!")
-                print(f"[USER_PROPOSED_PLAN]    💬 Sugestão: {user_suggestion[:100]}...")
-                
-                # Retornar para plan_builder com a sugestão como "plan"
-                wait_time = time.time() - start
-                return {
-                    'user_proposed_plan': user_suggestion,
-                    'user_suggestion': user_suggestion,  # Para plan_refiner
-                    'plan': data.get('plan', ''),  # Plano rejeitado anterior
-                    'original_plan': data.get('plan', ''),  # Para plan_refiner
-                    'plan_received': True,
-                    'received_at': datetime.now().isoformat(),
-                    'input_method': 'interactive',
-                    'wait_time': wait_time,
-                    'previous_module': 'user_proposed_plan',
-                    'pergunta': pergunta,
-                    'username': username,
-                    'projeto': projeto,
-                    'intent_category': data.get('intent_category'),
-                    'execution_time': wait_time,
-                    # Parent IDs - propagar do PlanConfirm/PlanBuilder
-                    'parent_intent_validator_id': data.get('parent_intent_validator_id'),
-                    'parent_plan_builder_id': data.get('parent_plan_builder_id'),
-                    'parent_user_proposed_plan_id': None,  # Será preenchido pelo History
-                    # Propagar contexto para plan_refiner
-                    'conversation_context': data.get('conversation_context', ''),
-                    'has_history': data.get('has_history', False)
-                }
+            # Limpar Redis
+            redis_client.delete(pending_key)
+            redis_client.delete(response_key)
             
-            time.sleep(0.5)
+            print(f"[USER_PROPOSED_PLAN]    ✅ Sugestão recebida!")
+            print(f"[USER_PROPOSED_PLAN]    💬 Sugestão: {user_suggestion[:100]}...")
+            
+            # Retornar para plan_builder com a sugestão como "plan"
+            wait_time = time.time() - start
+            return {
+                'user_proposed_plan': user_suggestion,
+                'user_suggestion': user_suggestion,  # Para plan_refiner
+                'plan': data.get('plan', ''),  # Plano rejeitado anterior
+                'original_plan': data.get('plan', ''),  # Para plan_refiner
+                'plan_received': True,
+                'received_at': datetime.now().isoformat(),
+                'input_method': 'interactive',
+                'wait_time': wait_time,
+                'previous_module': 'user_proposed_plan',
+                'pergunta': pergunta,
+                'username': username,
+                'projeto': projeto,
+                'intent_category': data.get('intent_category'),
+                'execution_time': wait_time,
+                # Parent IDs - propagar do PlanConfirm/PlanBuilder
+                'parent_intent_validator_id': data.get('parent_intent_validator_id'),
+                'parent_plan_builder_id': data.get('parent_plan_builder_id'),
+                'parent_user_proposed_plan_id': None,  # Será preenchido pelo History
+                # Propagar contexto para plan_refiner
+                'conversation_context': data.get('conversation_context', ''),
+                'has_history': data.get('has_history', False)
+            }
+        
+        # VERIFICAR SE A CHAVE PENDENTE AINDA EXISTE (pode ter sido apagada no disconnect)
+        # Prazo expirado é timeout, mesmo sem a chave
+        if not wait['expired'] and not redis_client.exists(pending_key):
+            print(f"[USER_PROPOSED_PLAN]    🚫 Chave pendente foi removida (usuário desconectou) - cancelando espera")
+            # Retornar resultado neutro sem criar próximos módulos
+            return {
+                'pergunta': pergunta,
+                'username': username,
+                'projeto': projeto,
+                'previous_module': 'user_proposed_plan',
+                'cancelled': True,
+                'cancel_reason': 'user_disconnected',
+                '_next_modules': []
+            }
+        
+        # Retomado sem resposta antes do prazo (ex: prazo desatualizado) - voltar a esperar
+        if not wait['expired']:
+            return self.wait_for_input(max(1, int(wait['deadline'] - time.time())))
         
         # Timeout
         redis_client.delete(pending_key)
@@ -7,12 +7,32 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 import json
 import os
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from pathlib import Path
 from dotenv import load_dotenv
 
 
+class _SharedConnection:
+    """
+    Conexão de um lote do audit log (ver batch_transaction): commit e close
+    ficam com o dono do lote, então várias gravações entram na mesma transação
+    """
+    
+    def __init__(self, conn):
+        self._conn = conn
+    
+    def cursor(self, *args, **kwargs):
+        return self._conn.cursor(*args, **kwargs)
+    
+    def commit(self):
+        pass
+    
+    def close(self):
+        pass
+
+
 class HistoryPreferencesAgent:
     """
     Agente responsável por gerenciar histórico de interações e preferências do usuário.
@@ -38,6 +58,9 @@ class HistoryPreferencesAgent:
             'password': os.getenv('POSTGRES_PASSWORD', 'ezpocket_pass_2025')
         }
         
+        # Conexão do lote em andamento (batch_transaction) - None = uma conexão por chamada
+        self._shared_conn = None
+        
         # Carrega config.json
         self.config = self._load_config()
         print("✅ Configurações carregadas de config.json")
@@ -54,9 +77,26 @@ class HistoryPreferencesAgent:
             return json.load(f)
     
     def _get_connection(self):
-        """Cria conexão com PostgreSQL"""
+        """Cria conexão com PostgreSQL (ou devolve a do lote em andamento)"""
+        if self._shared_conn is not None:
+            return self._shared_conn
         return psycopg2.connect(**self.db_config)
     
+    @contextmanager
+    def batch_transaction(self, conn):
+        """
+        Faz save_interaction (e as buscas de parent_id) usarem conn sem commit
+        próprio: o chamador commita o lote inteiro de uma vez (audit_log_writer.py)
+        
+        As buscas de parent_id enxergam as linhas ainda não commitadas do lote
+        (mesma transação), então a ordem dos eventos é preservada.
+        """
+        self._shared_conn = _SharedConnection(conn)
+        try:
+            yield
+        finally:
+            self._shared_conn = None
+    
     def _get_intent_validator_id_by_context(self, username, projeto, pergunta):
         """Busca o intent_validator_log_id mais recente para o mesmo contexto"""
         conn = self._get_connection()
@@ -1615,11 +1655,6 @@ class HistoryPreferencesAgent:
             print(f"  • Tabela: {previous_module}_logs")
             print(f"  • ID: {log_id}")
             
-            # Se salvou response_composer, próximo é user_feedback
-            if previous_module == "response_composer":
-                print(f"  🔀 Próximo módulo: user_feedback (pedir rating ao usuário)")
-                state["_next_modules"] = ['user_feedback']
-            
             print("="*80 + "\n")
             
             state["interaction_saved"] = True
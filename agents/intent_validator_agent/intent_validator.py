@@ -5,7 +5,9 @@ Valida a intenção e escopo da pergunta do usuário antes de processar.
 
 import os
 import json
-from openai import OpenAI
+from agents.llm_client import get_llm_client
+from agents.conversation_context import fit_context
+from agents.prompt_cache import CompiledPrompt
 from typing import Dict, Any
 
 class IntentValidatorAgent:
@@ -23,21 +25,25 @@ class IntentValidatorAgent:
         print("✅ Agente inicializado")
         print("="*80 + "\n")
         
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = get_llm_client('intent_validator')
         self.model = "gpt-4o"
         
-        # Carrega definições de categorias do roles.json
+        # Carrega definições de categorias do roles.json e compila o system prompt
+        # (recompilado só quando o roles.json muda)
         roles_path = os.path.join(os.path.dirname(__file__), 'roles.json')
-        with open(roles_path, 'r', encoding='utf-8') as f:
-            self.roles = json.load(f)
+        self.prompt = CompiledPrompt(roles_path, self._build_system_prompt)
     
-    def _build_system_prompt(self) -> str:
+    @property
+    def roles(self) -> Dict[str, Any]:
+        return self.prompt.roles
+    
+    def _build_system_prompt(self, roles: Dict[str, Any]) -> str:
         """Constrói o system prompt a partir do roles.json"""
-        categories = self.roles['categories']
-        rules = self.roles['classification_rules']
-        security = self.roles['security_rules']
+        categories = roles['categories']
+        rules = roles['classification_rules']
+        security = roles['security_rules']
         
-        prompt = f"""{self.roles['system_prompt_intro']}
+        prompt = f"""{roles['system_prompt_intro']}
 
 """
         
@@ -52,7 +58,7 @@ class IntentValidatorAgent:
         prompt += f"\n🔒 AÇÃO: {security['action']}\n"
         prompt += "\n" + "="*80 + "\n\n"
         
-        prompt += f"""{self.roles['system_prompt_scope']}
+        prompt += f"""{roles['system_prompt_scope']}
 
 CATEGORIAS VÁLIDAS (retorne valid=true):
 
@@ -95,7 +101,7 @@ EXEMPLOS DE CLASSIFICAÇÃO CORRETA:
             prompt += f"- \"{example['question']}\" → {example['correct_category']} ({example['reason']})\n"
         
         prompt += f"""
-{self.roles['system_prompt_output']}"""
+{roles['system_prompt_output']}"""
         
         return prompt
         
@@ -130,11 +136,9 @@ EXEMPLOS DE CLASSIFICAÇÃO CORRETA:
         
         # Processamento
         print(f"\n⚙️  PROCESSAMENTO:")
-        print(f"   🔄 Carregando regras do roles.json...")
-        
-        # Constrói o prompt dinamicamente do roles.json
-        system_prompt = self._build_system_prompt()
-        print(f"   ✅ Prompt construído ({len(system_prompt)} caracteres)")
+        # System prompt compilado do roles.json (prefixo fixo: prompt caching do provedor)
+        system_prompt = self.prompt.get()
+        print(f"   ✅ Prompt compilado ({len(system_prompt)} caracteres)")
         
         # Verificações de segurança
         if "pilares" in system_prompt.lower():
@@ -143,7 +147,7 @@ EXEMPLOS DE CLASSIFICAÇÃO CORRETA:
             print(f"   ✅ Regras de segurança ativadas")
 
         # Verificar se há contexto de conversa (projeto ativo)
-        conversation_context = state.get("conversation_context", "")
+        conversation_context = fit_context(state.get("conversation_context", ""), 'intent_validator')
         has_history = state.get("has_history", False)
         
         # Construir prompt do usuário com contexto se disponível
@@ -0,0 +1,379 @@
+"""
+Cliente LLM compartilhado pelos agentes
+
+Um cliente OpenAI por processo no lugar de um OpenAI(...) por agente:
+
+- Pool HTTP keep-alive (httpx) limitado a LLM_POOL_MAX conexões, com
+  timeout de conexão e de resposta
+- Teto de chamadas simultâneas por processo (LLM_MAX_CONCURRENCY): o resto
+  espera a vez em vez de abrir mais conexões
+- Orçamento por modelo no Redis (llm_budget:{model}:requests / :tokens),
+  compartilhado por todos os workers: token bucket de requisições/minuto e
+  tokens/minuto. Sem orçamento a chamada ESPERA (até LLM_BUDGET_MAX_WAIT)
+  em vez de tomar 429 do provedor. Os tokens são reservados pela estimativa
+  (prompt + max_tokens) e acertados pelo usage da resposta
+- Retry com backoff exponencial e jitter (full jitter) em 429, 5xx, timeout
+  e erro de conexão; respeita Retry-After quando o provedor manda
+- Métricas por agente em llm_metrics:{agente} (chamadas, erros, retries,
+  429, tokens, espera por orçamento) e latências recentes em
+  llm_latency:{agente} (ver llm_stats, em /test-orchestrator/health)
+
+Uso nos agentes (mesma interface do OpenAI para chat.completions.create):
+
+    from agents.llm_client import get_llm_client
+    self.client = get_llm_client('intent_validator')
+
+Streaming: self.client.chat.completions.stream(on_delta, **kwargs) chama
+on_delta a cada pedaço do texto e devolve (texto completo, usage).
+
+Sem Redis o cliente continua funcionando, só sem orçamento e sem métricas.
+"""
+
+import os
+import math
+import time
+import random
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import redis
+from redis import Redis
+from dotenv import load_dotenv
+from openai import OpenAI, APIConnectionError, APITimeoutError, APIStatusError, RateLimitError
+
+from agents.token_bucket import take_tokens
+
+load_dotenv()
+
+# =====================================================
+# CONFIGURAÇÃO
+# =====================================================
+
+LLM_POOL_MAX = int(os.getenv('LLM_POOL_MAX', 20))                          # Conexões HTTP por processo
+LLM_POOL_KEEPALIVE = float(os.getenv('LLM_POOL_KEEPALIVE', 60))            # Segundos que uma conexão ociosa fica aberta
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 60))                          # Timeout de resposta (s)
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', 5))           # Timeout de conexão (s)
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', LLM_POOL_MAX))  # Chamadas simultâneas por processo
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 4))                     # Retries em 429/5xx/timeout
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', 0.5))               # Backoff do 1º retry (s), dobra a cada tentativa
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', 20))                  # Teto do backoff (s)
+LLM_RPM = float(os.getenv('LLM_RPM', 500))                                 # Requisições/minuto por modelo; 0 desliga
+LLM_TPM = float(os.getenv('LLM_TPM', 150000))                              # Tokens/minuto por modelo; 0 desliga
+LLM_BUDGET_BURST = float(os.getenv('LLM_BUDGET_BURST', 10))                # Segundos de orçamento acumuláveis (rajada)
+LLM_BUDGET_MAX_WAIT = float(os.getenv('LLM_BUDGET_MAX_WAIT', 30))          # Espera máxima por orçamento antes de falhar
+LLM_DEFAULT_COMPLETION_TOKENS = int(os.getenv('LLM_DEFAULT_COMPLETION_TOKENS', 1000))  # Reserva quando não há max_tokens
+
+LLM_LATENCY_SAMPLES = 100
+LLM_METRICS_TTL = 86400
+LLM_AGENTS_KEY = 'llm_agents'  # Agentes com métricas (llm_stats lê sem varrer o keyspace)
+
+REDIS_CONFIG = {
+    'host': os.getenv('REDIS_HOST', 'localhost'),
+    'port': int(os.getenv('REDIS_PORT', 6493)),
+    'db': int(os.getenv('REDIS_DB', 0)),
+    'decode_responses': True
+}
+
+class LLMBudgetExceeded(Exception):
+    """Orçamento do modelo não liberou dentro de LLM_BUDGET_MAX_WAIT"""
+
+
+def model_limits(model: str) -> tuple:
+    """(requisições/min, tokens/min) do modelo - override por LLM_RPM_{MODELO} / LLM_TPM_{MODELO} (ex: LLM_TPM_GPT_4O)"""
+    suffix = ''.join(c if c.isalnum() else '_' for c in model.upper())
+    rpm = float(os.getenv(f"LLM_RPM_{suffix}", LLM_RPM))
+    tpm = float(os.getenv(f"LLM_TPM_{suffix}", LLM_TPM))
+    return rpm, tpm
+
+
+def estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    """Reserva de tokens da chamada: prompt (~4 caracteres por token) + limite da resposta"""
+    prompt_chars = sum(len(str(message.get('content') or '')) for message in kwargs.get('messages', []))
+    completion = kwargs.get('max_tokens') or kwargs.get('max_completion_tokens') or LLM_DEFAULT_COMPLETION_TOKENS
+    return prompt_chars // 4 + completion
+
+
+def is_retryable(error: Exception) -> bool:
+    """429, 5xx, timeout e falha de conexão valem retry; 4xx (prompt inválido, auth) não"""
+    if isinstance(error, (RateLimitError, APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Retry-After do provedor, se houver; senão backoff exponencial com full jitter"""
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+class SharedLLM:
+    """Cliente OpenAI do processo com pool, orçamento por modelo, retries e métricas"""
+    
+    def __init__(self):
+        self._client = None
+        self._redis = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, LLM_MAX_CONCURRENCY))
+        self._redis_warned = False
+    
+    @property
+    def client(self) -> OpenAI:
+        """OpenAI com pool keep-alive, criado no primeiro uso (sem retries próprios: o retry é daqui)"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    http_client = httpx.Client(
+                        limits=httpx.Limits(
+                            max_connections=LLM_POOL_MAX,
+                            max_keepalive_connections=LLM_POOL_MAX,
+                            keepalive_expiry=LLM_POOL_KEEPALIVE
+                        ),
+                        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+                    )
+                    self._client = OpenAI(
+                        api_key=os.getenv('OPENAI_API_KEY'),
+                        http_client=http_client,
+                        max_retries=0
+                    )
+                    print(f"🤖 Cliente LLM compartilhado criado (pool {LLM_POOL_MAX} conexões, "
+                          f"{LLM_MAX_CONCURRENCY} chamadas simultâneas)")
+        return self._client
+    
+    @property
+    def redis_client(self) -> Redis:
+        if self._redis is None:
+            self._redis = Redis(**REDIS_CONFIG)
+        return self._redis
+    
+    def _redis_unavailable(self, error: Exception):
+        """Sem Redis: segue sem orçamento/métricas (avisa uma vez por processo)"""
+        if not self._redis_warned:
+            self._redis_warned = True
+            print(f"🤖 ⚠️ Redis indisponível para o cliente LLM ({error}) - sem orçamento por modelo e sem métricas")
+    
+    def _reserve(self, model: str, tokens: int) -> float:
+        """
+        Consome 1 requisição e `tokens` do orçamento do modelo, esperando o
+        saldo se preciso
+        
+        Returns:
+            Segundos esperados por orçamento
+        
+        Raises:
+            LLMBudgetExceeded: saldo não liberou em LLM_BUDGET_MAX_WAIT
+        """
+        rpm, tpm = model_limits(model)
+        buckets = []
+        for key, per_minute, cost in ((f"llm_budget:{model}:requests", rpm, 1), (f"llm_budget:{model}:tokens", tpm, tokens)):
+            if per_minute > 0:
+                rate = per_minute / 60
+                capacity = max(1, rate * LLM_BUDGET_BURST)
+                buckets.append((key, capacity, rate, min(cost, capacity)))  # Chamada maior que a rajada não trava para sempre
+        if not buckets:
+            return 0.0
+        
+        start = time.time()
+        while True:
+            try:
+                wait = take_tokens(self.redis_client, buckets)
+            except redis.RedisError as e:
+                self._redis_unavailable(e)
+                return time.time() - start
+            if not wait:
+                return time.time() - start
+            
+            waited = time.time() - start
+            if waited + wait > LLM_BUDGET_MAX_WAIT:
+                raise LLMBudgetExceeded(
+                    f"Orçamento de {model} esgotado (espera necessária {wait:.1f}s, já esperou {waited:.1f}s)"
+                )
+            time.sleep(wait)
+    
+    def _settle(self, model: str, reserved: int, used: Optional[int]):
+        """Acerta o bucket de tokens com o usage real (devolve ou cobra a diferença)"""
+        if used is None or model_limits(model)[1] <= 0:
+            return
+        try:
+            self.redis_client.hincrbyfloat(f"llm_budget:{model}:tokens", 'tokens', reserved - used)
+        except redis.RedisError as e:
+            self._redis_unavailable(e)
+    
+    def _record(self, agent: str, model: str, metrics: Dict[str, float], latency: Optional[float]):
+        """Soma as métricas da chamada em llm_metrics:{agente} (um round trip)"""
+        metrics_key = f"llm_metrics:{agent}"
+        latency_key = f"llm_latency:{agent}"
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.sadd(LLM_AGENTS_KEY, agent)
+            pipe.hset(metrics_key, 'model', model)
+            for field, value in metrics.items():
+                if value:
+                    pipe.hincrbyfloat(metrics_key, field, value)
+            pipe.expire(metrics_key, LLM_METRICS_TTL)
+            if latency is not None:
+                pipe.lpush(latency_key, round(latency, 3))
+                pipe.ltrim(latency_key, 0, LLM_LATENCY_SAMPLES - 1)
+                pipe.expire(latency_key, LLM_METRICS_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            self._redis_unavailable(e)
+    
+    def _call(self, agent: str, kwargs: Dict[str, Any], request: Callable[[], tuple],
+              can_retry: Callable[[], bool] = lambda: True):
+        """
+        Orçamento, teto de concorrência, retries e métricas em volta de
+        request() → (resultado, usage)
+        """
+        model = kwargs.get('model', '')
+        reserved = estimate_tokens(kwargs)
+        metrics = {'calls': 1, 'errors': 0, 'retries': 0, 'rate_limited': 0,
+                   'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0, 'budget_wait_ms': 0}
+        latency = None
+        
+        try:
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                metrics['budget_wait_ms'] += self._reserve(model, reserved) * 1000
+                try:
+                    with self._slots:
+                        start = time.time()
+                        result, usage = request()
+                        latency = time.time() - start
+                except Exception as e:
+                    self._settle(model, reserved, 0)  # Chamada que falhou não gasta tokens
+                    if isinstance(e, RateLimitError):
+                        metrics['rate_limited'] += 1
+                    if not is_retryable(e) or not can_retry() or attempt == LLM_MAX_RETRIES:
+                        raise
+                    delay = retry_delay(e, attempt)
+                    metrics['retries'] += 1
+                    print(f"🤖 ⚠️ {agent}: {type(e).__name__} em {model} - retry {attempt + 1}/{LLM_MAX_RETRIES} em {delay:.1f}s")
+                    time.sleep(delay)
+                    continue
+                
+                if usage is not None:
+                    metrics['prompt_tokens'] = usage.prompt_tokens or 0
+                    metrics['completion_tokens'] = usage.completion_tokens or 0
+                    details = getattr(usage, 'prompt_tokens_details', None)
+                    metrics['cached_tokens'] = (getattr(details, 'cached_tokens', 0) or 0) if details else 0
+                    self._settle(model, reserved, usage.total_tokens)
+                return result
+        except Exception:
+            metrics['errors'] = 1
+            raise
+        finally:
+            self._record(agent, model, metrics, latency)
+    
+    def create_chat_completion(self, agent: str, **kwargs):
+        """
+        chat.completions.create com orçamento, teto de concorrência e retries
+        
+        Raises:
+            LLMBudgetExceeded ou o erro do OpenAI depois dos retries
+            (os agentes tratam com o except/fallback que já tinham)
+        """
+        def request():
+            response = self.client.chat.completions.create(**kwargs)
+            return response, getattr(response, 'usage', None)
+        
+        return self._call(agent, kwargs, request)
+    
+    def stream_chat_completion(self, agent: str, on_delta: Callable[[str], None], **kwargs) -> tuple:
+        """
+        chat.completions.create com stream=True: chama on_delta(texto) a cada
+        pedaço recebido e devolve o texto completo no fim
+        
+        Retry só enquanto nenhum pedaço foi entregue (depois disso o erro sobe:
+        repetir duplicaria o texto já enviado).
+        
+        Returns:
+            (texto completo, usage)
+        """
+        kwargs = {**kwargs, 'stream': True, 'stream_options': {'include_usage': True}}
+        delivered = []
+        
+        def request():
+            parts, usage = [], None
+            for chunk in self.client.chat.completions.create(**kwargs):
+                if getattr(chunk, 'usage', None) is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    delivered.append(True)
+                    on_delta(delta)
+            return ("".join(parts), usage), usage
+        
+        return self._call(agent, kwargs, request, can_retry=lambda: not delivered)
+
+
+class _Completions:
+    def __init__(self, llm: SharedLLM, agent: str):
+        self._llm = llm
+        self._agent = agent
+    
+    def create(self, **kwargs):
+        return self._llm.create_chat_completion(self._agent, **kwargs)
+    
+    def stream(self, on_delta: Callable[[str], None], **kwargs) -> tuple:
+        """Chamada em streaming (ver SharedLLM.stream_chat_completion) → (texto completo, usage)"""
+        return self._llm.stream_chat_completion(self._agent, on_delta, **kwargs)
+
+
+class _Chat:
+    def __init__(self, llm: SharedLLM, agent: str):
+        self.completions = _Completions(llm, agent)
+
+
+class LLMClient:
+    """Visão de um agente sobre o cliente compartilhado (métricas separadas por agente)"""
+    
+    def __init__(self, llm: SharedLLM, agent: str):
+        self.agent = agent
+        self.chat = _Chat(llm, agent)
+
+
+# Cliente único do processo
+shared_llm = SharedLLM()
+
+
+def get_llm_client(agent: str) -> LLMClient:
+    """Cliente do agente (interface client.chat.completions.create do OpenAI)"""
+    return LLMClient(shared_llm, agent)
+
+
+def llm_stats(redis_client: Redis) -> Dict[str, Dict[str, Any]]:
+    """
+    Métricas agregadas de todos os processos, por agente
+    (chamadas, erros, retries, 429, tokens, tokens do prompt cache, latência média/p95)
+    """
+    agents = sorted(redis_client.smembers(LLM_AGENTS_KEY))
+    if not agents:
+        return {}
+    
+    pipe = redis_client.pipeline(transaction=False)
+    for agent in agents:
+        pipe.hgetall(f"llm_metrics:{agent}")
+        pipe.lrange(f"llm_latency:{agent}", 0, -1)
+    results = pipe.execute()
+    
+    stats = {}
+    for agent, metrics, samples in zip(agents, results[0::2], results[1::2]):
+        latencies: List[float] = sorted(float(sample) for sample in samples)
+        entry = {field: (value if field == 'model' else int(float(value))) for field, value in metrics.items()}
+        if entry.get('prompt_tokens'):
+            # Fração do prompt servida pelo prompt caching do provedor (prefixo fixo, ver prompt_cache.py)
+            entry['cached_tokens_ratio'] = round(entry.get('cached_tokens', 0) / entry['prompt_tokens'], 3)
+        if latencies:
+            entry['latency_avg_ms'] = round(sum(latencies) / len(latencies) * 1000, 1)
+            entry['latency_p95_ms'] = round(latencies[max(0, math.ceil(len(latencies) * 0.95) - 1)] * 1000, 1)
+        stats[agent] = entry
+    return stats
@@ -4,8 +4,11 @@ Gera um plano em linguagem natural para responder à pergunta do usuário
 """
 
 import os
+import json
 import time
-from openai import OpenAI
+from agents.llm_client import get_llm_client
+from agents.conversation_context import fit_context
+from agents.prompt_cache import CompiledPrompt
 from typing import Dict, Any
 
 class PlanBuilderAgent:
@@ -21,10 +24,9 @@ class PlanBuilderAgent:
         print("✅ Agente inicializado")
         print("="*80 + "\n")
         
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = get_llm_client('plan_builder')
         
         # Carregar roles.json ou roles_local.json
-        import json
         from pathlib import Path
         from dotenv import load_dotenv
         
@@ -42,12 +44,44 @@ class PlanBuilderAgent:
             roles_file = "roles.json"
             print(f"   🔧 Plan Builder usando roles.json (AWS Athena)")
         
+        # System prompt compilado uma vez (recompilado só quando o roles file muda)
         roles_path = Path(__file__).parent / roles_file
-        with open(roles_path, 'r', encoding='utf-8') as f:
-            self.roles = json.load(f)
+        self.prompt = CompiledPrompt(roles_path, self._build_system_prompt)
         
         self.model = self.roles.get('model_config', {}).get('model', 'gpt-4o')
     
+    @property
+    def roles(self) -> Dict[str, Any]:
+        return self.prompt.roles
+    
+    def _build_system_prompt(self, roles: Dict[str, Any]) -> str:
+        """Constrói o system prompt a partir do roles.json (só partes invariantes)"""
+        return f"""{roles['system_prompt_intro']} {roles['description']}
+
+🎯 OBJETIVO:
+{roles['objective']}
+
+🔒 REGRAS DE SEGURANÇA:
+{roles['security_rules']['directive']}
+
+📊 CONTEXTO DO BANCO DE DADOS:
+{json.dumps(roles['database_context'], indent=2, ensure_ascii=False)}
+
+📋 REGRAS DE PLANEJAMENTO:
+{json.dumps(roles['planning_rules'], indent=2, ensure_ascii=False)}
+
+⚙️ DIRETRIZES DE COMPLEXIDADE:
+{json.dumps(roles['complexity_guidelines'], indent=2, ensure_ascii=False)}
+
+💡 EXEMPLOS:
+{json.dumps(roles['examples'], indent=2, ensure_ascii=False)}
+
+✓ CHECKLIST DE VALIDAÇÃO:
+{json.dumps(roles['validation_checklist'], indent=2, ensure_ascii=False)}
+
+RETORNE APENAS JSON válido no formato:
+{json.dumps(roles['output_structure'], indent=2, ensure_ascii=False)}"""
+    
     def build_plan(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """
         Gera um plano em linguagem natural
@@ -88,36 +122,11 @@ class PlanBuilderAgent:
         start_time = time.time()
         
         try:
-            # Construir prompt para o GPT usando roles.json
-            import json
-            system_prompt = f"""{self.roles['system_prompt_intro']} {self.roles['description']}
-
-🎯 OBJETIVO:
-{self.roles['objective']}
-
-🔒 REGRAS DE SEGURANÇA:
-{self.roles['security_rules']['directive']}
-
-📊 CONTEXTO DO BANCO DE DADOS:
-{json.dumps(self.roles['database_context'], indent=2, ensure_ascii=False)}
-
-📋 REGRAS DE PLANEJAMENTO:
-{json.dumps(self.roles['planning_rules'], indent=2, ensure_ascii=False)}
-
-⚙️ DIRETRIZES DE COMPLEXIDADE:
-{json.dumps(self.roles['complexity_guidelines'], indent=2, ensure_ascii=False)}
-
-💡 EXEMPLOS:
-{json.dumps(self.roles['examples'], indent=2, ensure_ascii=False)}
-
-✓ CHECKLIST DE VALIDAÇÃO:
-{json.dumps(self.roles['validation_checklist'], indent=2, ensure_ascii=False)}
-
-RETORNE APENAS JSON válido no formato:
-{json.dumps(self.roles['output_structure'], indent=2, ensure_ascii=False)}"""
+            # System prompt compilado do roles.json (prefixo fixo: prompt caching do provedor)
+            system_prompt = self.prompt.get()
 
             # Verificar se há contexto de conversa (projeto ativo)
-            conversation_context = state.get("conversation_context", "")
+            conversation_context = fit_context(state.get("conversation_context", ""), 'plan_builder')
             has_history = state.get("has_history", False)
             
             # Verificar se há sugestão do usuário vinda do user_proposed_plan
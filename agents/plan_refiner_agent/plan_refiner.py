@@ -6,7 +6,9 @@ Refina planos de análise baseado na sugestão do usuário
 import os
 import json
 import time
-from openai import OpenAI
+from agents.llm_client import get_llm_client
+from agents.conversation_context import fit_context
+from agents.prompt_cache import CompiledPrompt
 from typing import Dict, Any, List
 
 class PlanRefinerAgent:
@@ -21,7 +23,7 @@ class PlanRefinerAgent:
         print("🔧 PLAN REFINER AGENT - REFINADOR DE PLANOS")
         print("="*80)
         
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self.client = get_llm_client('plan_refiner')
         self.model = "gpt-4o"
         
         print("✅ Agente inicializado")
@@ -45,10 +47,9 @@ class PlanRefinerAgent:
             roles_file = "roles.json"
             print(f"   🔧 Plan Refiner usando roles.json (AWS Athena)")
         
-        # Carrega roles
+        # Carrega roles e compila o system prompt (recompilado só quando o arquivo muda)
         roles_path = os.path.join(os.path.dirname(__file__), roles_file)
-        with open(roles_path, 'r', encoding='utf-8') as f:
-            self.roles = json.load(f)
+        self.prompt = CompiledPrompt(roles_path, self._build_system_prompt)
         
         print("✅ Agente inicializado")
         print("="*80 + "\n")
@@ -83,12 +84,13 @@ class PlanRefinerAgent:
             print(f"   Sugestão: {user_suggestion[:80]}...")
             
             # Construir prompt
-            system_prompt = self._build_system_prompt()
+            system_prompt = self.prompt.get()
             base_user_prompt = self._build_user_prompt(
                 pergunta, original_plan, user_suggestion, intent_category
             )
             
             # Injetar contexto ANTES do prompt se houver histórico
+            conversation_context = fit_context(conversation_context, 'plan_refiner')
             if has_history and conversation_context:
                 user_prompt = f"{conversation_context}\n\n{base_user_prompt}"
                 print(f"   📚 Contexto adicionado: {len(conversation_context)} caracteres")
@@ -150,25 +152,29 @@ class PlanRefinerAgent:
                 'error': str(e)
             }
     
-    def _build_system_prompt(self) -> str:
+    @property
+    def roles(self) -> Dict[str, Any]:
+        return self.prompt.roles
+    
+    def _build_system_prompt(self, roles: Dict[str, Any]) -> str:
         """Constrói prompt de sistema"""
-        return f"""{self.roles['system_prompt_intro']}
+        return f"""{roles['system_prompt_intro']}
 
-ROLE: {self.roles['role']}
-DESCRIÇÃO: {self.roles['description']}
+ROLE: {roles['role']}
+DESCRIÇÃO: {roles['description']}
 
-OBJETIVO: {self.roles['objective']}
+OBJETIVO: {roles['objective']}
 
 REGRAS DE REFINAMENTO:
-{chr(10).join(f"- {rule}" for rule in self.roles['refinement_rules'])}
+{chr(10).join(f"- {rule}" for rule in roles['refinement_rules'])}
 
 PROCESSO DE REFINAMENTO:
-{chr(10).join(f"{step}: {desc}" for step, desc in self.roles['refinement_process'].items())}
+{chr(10).join(f"{step}: {desc}" for step, desc in roles['refinement_process'].items())}
 
 VERIFICAÇÕES DE QUALIDADE:
-{chr(10).join(f"- {check}" for check in self.roles['quality_checks'])}
+{chr(10).join(f"- {check}" for check in roles['quality_checks'])}
 
-{self.roles['system_prompt_output']}
+{roles['system_prompt_output']}
 """
     
     def _build_user_prompt(
@@ -0,0 +1,81 @@
+"""
+System prompts compilados dos agentes
+
+Cada agente montava o system prompt a partir do roles.json a CADA chamada
+(concatenações e json.dumps de arquivos de até 35 KB). Agora o prompt é
+compilado uma vez e só é recompilado quando o roles file muda (mtime,
+verificado no máximo a cada PROMPT_RELOAD_CHECK segundos): editar o
+roles.json continua valendo sem reiniciar o worker.
+
+Layout das mensagens para o prompt caching automático do provedor (que
+reaproveita o maior PREFIXO idêntico da requisição, a partir de ~1024 tokens):
+
+    system → tudo que é invariante (regras, schema, exemplos, formato de saída),
+             byte a byte igual entre chamadas
+    user   → só o que muda por pergunta (contexto da conversa, pergunta, dados)
+
+Os tokens servidos do cache aparecem em cached_tokens nas métricas do
+cliente LLM (llm_stats).
+"""
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Union
+
+PROMPT_RELOAD_CHECK = float(os.getenv('PROMPT_RELOAD_CHECK', 2))  # Segundos entre verificações do mtime do roles file
+
+
+class CompiledPrompt:
+    """roles file carregado + system prompt compilado, recompilados quando o arquivo muda"""
+    
+    def __init__(self, roles_path: Union[str, Path], compile_fn: Callable[[Dict[str, Any]], str]):
+        self.roles_path = str(roles_path)
+        self._compile = compile_fn
+        self._lock = threading.Lock()
+        self._checked_at = time.time()
+        self._mtime = None
+        self.roles = None
+        self.system_prompt = None
+        self._load()
+    
+    def _load(self):
+        """Lê o roles file e compila o prompt (o estado anterior só é trocado se tudo deu certo)"""
+        mtime = os.stat(self.roles_path).st_mtime_ns
+        with open(self.roles_path, 'r', encoding='utf-8') as f:
+            roles = json.load(f)
+        system_prompt = self._compile(roles)
+        
+        self.roles, self.system_prompt, self._mtime = roles, system_prompt, mtime
+        print(f"   📜 System prompt compilado de {os.path.basename(self.roles_path)} ({len(system_prompt)} caracteres)")
+    
+    def refresh(self):
+        """Recompila se o roles file mudou desde a última compilação"""
+        now = time.time()
+        if now - self._checked_at < PROMPT_RELOAD_CHECK:
+            return
+        self._checked_at = now
+        
+        try:
+            mtime = os.stat(self.roles_path).st_mtime_ns
+        except OSError:
+            return  # Arquivo sendo substituído: fica com o prompt atual
+        if mtime == self._mtime:
+            return
+        
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                self._load()
+            except (OSError, ValueError, KeyError) as e:
+                # roles.json inválido no meio da edição: mantém o prompt anterior
+                self._mtime = mtime
+                print(f"   ⚠️  {os.path.basename(self.roles_path)} inválido ({e}) - mantendo o system prompt anterior")
+    
+    def get(self) -> str:
+        """System prompt atual (recompilado se o roles file mudou)"""
+        self.refresh()
+        return self.system_prompt
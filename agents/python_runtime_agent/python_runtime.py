@@ -10,7 +10,9 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 from typing import Dict, Any, List
-from openai import OpenAI
+from agents.llm_client import get_llm_client
+from agents.conversation_context import fit_context
+from agents.prompt_cache import CompiledPrompt
 
 class PythonRuntimeAgent:
     """
@@ -20,107 +22,114 @@ class PythonRuntimeAgent:
     
     def __init__(self):
         """Inicializa o agente com configurações"""
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = get_llm_client('python_runtime')
         self.model = os.getenv("LLM_MODEL", "gpt-4o")
         
-        # Carregar roles.json
+        # Carregar roles.json e compilar o system prompt (recompilado só quando o arquivo muda)
         roles_path = Path(__file__).parent / "roles.json"
-        with open(roles_path, 'r', encoding='utf-8') as f:
-            self.roles = json.load(f)
+        self.prompt = CompiledPrompt(roles_path, self._build_system_prompt)
     
-    def _build_prompt(self, state: Dict[str, Any]) -> str:
-        """Constrói o prompt para análise com GPT-4o"""
-        
-        pergunta = state.get('pergunta', '')
-        results_preview = state.get('results_preview', [])
-        results_full = state.get('results_full', [])
-        row_count = state.get('row_count', 0)
-        columns = state.get('columns', [])
-        query_executed = state.get('query_executed', '')
-        conversation_context = state.get('conversation_context', '')
-        has_history = state.get('has_history', False)
-        
-        # Usar results_full se disponível, senão results_preview
-        results_to_analyze = results_full if results_full else results_preview
-        
-        # Construir prompt a partir do roles.json
-        results_sample = json.dumps(results_to_analyze[:100], indent=2, ensure_ascii=False)
-        columns_str = ', '.join(columns)
-        responsibilities_str = chr(10).join('- ' + r for r in self.roles['responsibilities'])
-        analysis_types_str = json.dumps(self.roles['analysis_types'], indent=2, ensure_ascii=False)
-        insight_guidelines_str = json.dumps(self.roles['insight_guidelines'], indent=2, ensure_ascii=False)
+    @property
+    def roles(self) -> Dict[str, Any]:
+        return self.prompt.roles
+    
+    def _build_system_prompt(self, roles: Dict[str, Any]) -> str:
+        """System prompt com as partes invariantes do roles.json (responsabilidades, tipos de análise, formato)"""
         
-        prompt_intro = self.roles['analysis_prompt_intro'].format(
-            agent_role=self.roles['agent_role'],
-            pergunta=pergunta,
-            query_executed=query_executed,
-            row_count=row_count,
-            columns=columns_str,
-            results_sample=results_sample
-        )
+        responsibilities_str = chr(10).join('- ' + r for r in roles['responsibilities'])
+        analysis_types_str = json.dumps(roles['analysis_types'], indent=2, ensure_ascii=False)
+        insight_guidelines_str = json.dumps(roles['insight_guidelines'], indent=2, ensure_ascii=False)
         
-        prompt_responsibilities = self.roles['analysis_responsibilities'].format(
+        prompt_responsibilities = roles['analysis_responsibilities'].format(
             responsibilities=responsibilities_str
         )
         
-        prompt_types = self.roles['analysis_types_section'].format(
+        prompt_types = roles['analysis_types_section'].format(
             analysis_types=analysis_types_str
         )
         
-        prompt_guidelines = self.roles['insight_guidelines_section'].format(
+        prompt_guidelines = roles['insight_guidelines_section'].format(
             insight_guidelines=insight_guidelines_str
         )
         
-        prompt_task = self.roles['analysis_task']
+        prompt_task = roles['analysis_task']
         
         # JSON format template (mantido hardcoded por ser estrutural)
-        json_format = f"""
+        json_format = """
 **FORMATO DE RESPOSTA (JSON):**
-{{{{
+{{
   "analysis_summary": "Resumo executivo da análise em 2-3 frases",
-  "statistics": {{{{
-    "total_records": {row_count},
-    "key_metrics": {{}},
-    "trends": {{}},
-    "comparisons": {{}}
-  }}}},
+  "statistics": {{
+    "total_records": <total de linhas retornadas>,
+    "key_metrics": {},
+    "trends": {},
+    "comparisons": {}
+  }},
   "insights": [
-    {{{{
+    {{
       "title": "Título do insight",
       "description": "Descrição detalhada do insight",
       "impact": "alto|médio|baixo",
       "business_value": "Como isso impacta o negócio"
-    }}}}
+    }}
   ],
   "visualizations": [
-    {{{{
+    {{
       "type": "line_chart|bar_chart|pie_chart|scatter_plot",
       "title": "Título do gráfico",
       "x_axis": "nome_coluna_x",
       "y_axis": "nome_coluna_y",
       "reason": "Por que esse gráfico é relevante"
-    }}}}
+    }}
   ],
   "recommendations": [
-    {{{{
+    {{
       "action": "Ação recomendada",
       "priority": "alta|média|baixa",
       "expected_impact": "Impacto esperado"
-    }}}}
+    }}
   ],
   "analysis_type": "descriptive_statistics|trend_analysis|comparative_analysis|anomaly_detection"
-}}}}
+}}
 
 Responda APENAS com o JSON, sem texto adicional."""
         
+        return f"{roles['system_prompt_initial']}\n\n{prompt_responsibilities}\n\n{prompt_types}\n\n{prompt_guidelines}\n\n{prompt_task}\n{json_format}"
+    
+    def _build_prompt(self, state: Dict[str, Any]) -> str:
+        """Constrói o prompt do usuário (só o que muda por pergunta: contexto, pergunta e dados)"""
+        
+        pergunta = state.get('pergunta', '')
+        results_preview = state.get('results_preview', [])
+        results_full = state.get('results_full', [])
+        row_count = state.get('row_count', 0)
+        columns = state.get('columns', [])
+        query_executed = state.get('query_executed', '')
+        conversation_context = fit_context(state.get('conversation_context', ''), 'python_runtime')
+        has_history = state.get('has_history', False)
+        
+        # Usar results_full se disponível, senão results_preview
+        results_to_analyze = results_full if results_full else results_preview
+        
+        # Construir prompt a partir do roles.json
+        results_sample = json.dumps(results_to_analyze[:100], indent=2, ensure_ascii=False)
+        columns_str = ', '.join(columns)
+        
+        prompt_intro = self.roles['analysis_prompt_intro'].format(
+            agent_role=self.roles['agent_role'],
+            pergunta=pergunta,
+            query_executed=query_executed,
+            row_count=row_count,
+            columns=columns_str,
+            results_sample=results_sample
+        )
+        
         # Adicionar contexto de conversa se houver
         context_section = ""
         if has_history and conversation_context:
             context_section = f"{conversation_context}\n\n"
         
-        prompt = f"{context_section}{prompt_intro}\n\n{prompt_responsibilities}\n\n{prompt_types}\n\n{prompt_guidelines}\n\n{prompt_task}\n{json_format}"
-        
-        return prompt
+        return f"{context_section}{prompt_intro}"
     
     def execute(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -142,7 +151,8 @@ Responda APENAS com o JSON, sem texto adicional."""
             print(f"[PYTHON_RUNTIME_AGENT]    Pergunta: {pergunta}")
             print(f"[PYTHON_RUNTIME_AGENT]    Rows: {row_count}")
             
-            # Construir prompt
+            # Construir prompt (system compilado primeiro: prefixo fixo para o prompt caching)
+            system_prompt = self.prompt.get()
             prompt = self._build_prompt(state)
             
             # Chamar GPT-4o
@@ -152,7 +162,7 @@ Responda APENAS com o JSON, sem texto adicional."""
                 messages=[
                     {
                         "role": "system",
-                        "content": self.roles['system_prompt_initial']
+                        "content": system_prompt
                     },
                     {
                         "role": "user",
@@ -7,8 +7,78 @@ Transforma dados técnicos em respostas elegantes e amigáveis para o usuário
 import os
 import json
 from pathlib import Path
-from typing import Dict, Any, List
-from openai import OpenAI
+import re
+import time
+from typing import Callable, Dict, Any, List, Optional
+from agents.llm_client import get_llm_client
+from agents.conversation_context import fit_context
+from agents.prompt_cache import CompiledPrompt
+
+JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class JsonStringFieldStream:
+    """
+    Extrai, enquanto o JSON chega em pedaços, o texto de um campo string
+    (ex.: response_text de {"response_text": "...", ...})
+    
+    feed(pedaço) devolve o texto NOVO do campo já sem os escapes do JSON;
+    escapes cortados entre dois pedaços ficam pendentes até o próximo.
+    """
+    
+    def __init__(self, field: str):
+        self._start = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""     # JSON ainda não consumido
+        self._inside = False  # Já passou da aspa de abertura do valor
+        self.done = False     # Aspa de fechamento encontrada
+        self._high = None     # Metade alta de um par surrogate (\ud83d\ude00)
+    
+    def feed(self, chunk: str) -> str:
+        if self.done:
+            return ""
+        self._buffer += chunk
+        
+        if not self._inside:
+            match = self._start.search(self._buffer)
+            if not match:
+                return ""
+            self._buffer = self._buffer[match.end():]
+            self._inside = True
+        
+        out = []
+        i, buffer = 0, self._buffer
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self.done = True
+                i += 1
+                break
+            if char != '\\':
+                out.append(char)
+                i += 1
+                continue
+            if i + 1 >= len(buffer):
+                break  # Escape incompleto
+            code = buffer[i + 1]
+            if code != 'u':
+                out.append(JSON_ESCAPES.get(code, code))
+                i += 2
+                continue
+            if i + 6 > len(buffer):
+                break  # \uXXXX incompleto
+            unit = int(buffer[i + 2:i + 6], 16)
+            i += 6
+            if 0xD800 <= unit < 0xDC00:
+                self._high = unit
+                continue
+            if 0xDC00 <= unit < 0xE000 and self._high is not None:
+                unit = 0x10000 + ((self._high - 0xD800) << 10) + (unit - 0xDC00)
+            self._high = None
+            out.append(chr(unit))
+        
+        self._buffer = buffer[i:]
+        return "".join(out)
+
 
 class ResponseComposerAgent:
     """
@@ -18,16 +88,44 @@ class ResponseComposerAgent:
     
     def __init__(self):
         """Inicializa o agente com configurações"""
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = get_llm_client('response_composer')
         self.model = os.getenv("LLM_MODEL", "gpt-4o")
         
-        # Carregar roles.json
+        # Carregar roles.json e compilar o system prompt (recompilado só quando o arquivo muda)
         roles_path = Path(__file__).parent / "roles.json"
-        with open(roles_path, 'r', encoding='utf-8') as f:
-            self.roles = json.load(f)
+        self.prompt = CompiledPrompt(roles_path, self._build_system_prompt)
+    
+    @property
+    def roles(self) -> Dict[str, Any]:
+        return self.prompt.roles
+    
+    def _build_system_prompt(self, roles: Dict[str, Any]) -> str:
+        """System prompt com as diretrizes invariantes do roles.json (tom, formatação, formato de saída)"""
+        
+        return f"""{roles['system_message']['content']}
+
+{roles['prompt_intro']}
+
+**DIRETRIZES DO AGENTE (roles.json):**
+
+**Responsibilities:**
+{json.dumps(roles.get('responsibilities', []), indent=2, ensure_ascii=False)}
+
+**Formatting Guidelines:**
+```json
+{json.dumps(roles.get('formatting_guidelines', {}), indent=2, ensure_ascii=False)}
+```
+
+**SUA TAREFA:**
+{roles['response_instructions'].get('follow_all_guidelines', 'Componha uma resposta seguindo TODAS as diretrizes')}
+
+**FORMATO DE RESPOSTA (JSON):**
+{json.dumps(roles.get('output_format', {}), indent=2, ensure_ascii=False)}
+
+{roles['response_instructions'].get('format', 'Retorne JSON válido')}"""
     
     def _build_prompt(self, state: Dict[str, Any]) -> str:
-        """Constrói o prompt para formatação da resposta"""
+        """Constrói o prompt do usuário (só o que muda por pergunta: contexto, análise e dados)"""
         
         pergunta = state.get('pergunta', '')
         analysis_summary = state.get('analysis_summary', '')
@@ -39,7 +137,7 @@ class ResponseComposerAgent:
         results = state.get('results', [])
         
         # Verificar se há contexto de conversa (projeto ativo)
-        conversation_context = state.get('conversation_context', '')
+        conversation_context = fit_context(state.get('conversation_context', ''), 'response_composer')
         has_history = state.get('has_history', False)
         
         # Limitar dados brutos para evitar tokens excessivos (max 50 registros)
@@ -50,9 +148,7 @@ class ResponseComposerAgent:
         if has_history and conversation_context:
             context_section = f"{conversation_context}\n\n"
         
-        prompt = f"""{self.roles['prompt_intro']}
-
-{context_section}**PERGUNTA ORIGINAL DO USUÁRIO:**
+        prompt = f"""{context_section}**PERGUNTA ORIGINAL DO USUÁRIO:**
 {pergunta}
 
 **ANÁLISE TÉCNICA DISPONÍVEL:**
@@ -75,36 +171,52 @@ class ResponseComposerAgent:
 - Dados disponíveis:
 ```json
 {json.dumps(results_sample, indent=2, ensure_ascii=False)}
-```
-
----
-
-**DIRETRIZES DO AGENTE (roles.json):**
-
-**Responsibilities:**
-{json.dumps(self.roles.get('responsibilities', []), indent=2, ensure_ascii=False)}
-
-**Formatting Guidelines:**
-```json
-{json.dumps(self.roles.get('formatting_guidelines', {}), indent=2, ensure_ascii=False)}
-```
-
-**SUA TAREFA:**
-{self.roles['response_instructions'].get('follow_all_guidelines', 'Componha uma resposta seguindo TODAS as diretrizes')}
-
-**FORMATO DE RESPOSTA (JSON):**
-{json.dumps(self.roles.get('output_format', {}), indent=2, ensure_ascii=False)}
-
-{self.roles['response_instructions'].get('format', 'Retorne JSON válido')}"""
+```"""
         
         return prompt
     
-    def execute(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    def _complete(self, messages: List[Dict[str, str]], on_delta: Optional[Callable[[str], None]]) -> tuple:
+        """
+        Chamada ao LLM → (JSON da resposta, total de tokens)
+        
+        Com on_delta a resposta vem em streaming e on_delta recebe cada
+        pedaço do response_text assim que chega (o JSON completo continua
+        sendo parseado no fim).
+        """
+        params = {
+            'model': self.model,
+            'messages': messages,
+            'temperature': 0.7,  # Mais criativo para respostas bonitas
+            'response_format': {"type": "json_object"}
+        }
+        
+        if on_delta is None:
+            response = self.client.chat.completions.create(**params)
+            return response.choices[0].message.content, response.usage.total_tokens
+        
+        field_stream = JsonStringFieldStream('response_text')
+        start = time.time()
+        first_token = []
+        
+        def forward(chunk: str):
+            text = field_stream.feed(chunk)
+            if text:
+                if not first_token:
+                    first_token.append(time.time() - start)
+                    print(f"[RESPONSE_COMPOSER_AGENT] ⚡ Primeiro trecho da resposta em {first_token[0] * 1000:.0f}ms")
+                on_delta(text)
+        
+        content, usage = self.client.chat.completions.stream(forward, **params)
+        return content, usage.total_tokens if usage is not None else 0
+    
+    def execute(self, state: Dict[str, Any], on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """
         Executa composição da resposta formatada
         
         Args:
             state: Estado completo com análise do Python Runtime
+            on_delta: Se informado, recebe o response_text em pedaços enquanto
+                o modelo gera (streaming)
             
         Returns:
             Dict com resposta formatada
@@ -118,34 +230,30 @@ class ResponseComposerAgent:
             print(f"[RESPONSE_COMPOSER_AGENT]    Pergunta: {pergunta}")
             print(f"[RESPONSE_COMPOSER_AGENT]    Username: {username}")
             
-            # Construir prompt
+            # Construir prompt (system compilado primeiro: prefixo fixo para o prompt caching)
+            system_prompt = self.prompt.get()
             prompt = self._build_prompt(state)
             
             # Chamar GPT-4o
             print(f"[RESPONSE_COMPOSER_AGENT] 🤖 Chamando GPT-4o para formatar resposta...")
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": self.roles['system_message']['role'],
-                        "content": self.roles['system_message']['content']
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,  # Mais criativo para respostas bonitas
-                response_format={"type": "json_object"}
-            )
+            content, tokens_used = self._complete([
+                {
+                    "role": self.roles['system_message']['role'],
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ], on_delta)
             
             # Parsear resposta
-            composed = json.loads(response.choices[0].message.content)
+            composed = json.loads(content)
             
             print(f"[RESPONSE_COMPOSER_AGENT] ✅ Resposta composta!")
             print(f"[RESPONSE_COMPOSER_AGENT]    Tamanho: {len(composed.get('response_text', ''))} caracteres")
             print(f"[RESPONSE_COMPOSER_AGENT]    User-friendly score: {composed.get('user_friendly_score', 0)}")
-            print(f"[RESPONSE_COMPOSER_AGENT]    Tokens usados: {response.usage.total_tokens}")
+            print(f"[RESPONSE_COMPOSER_AGENT]    Tokens usados: {tokens_used}")
             
             # Retornar resposta formatada + dados originais da análise para metadata
             return {
@@ -154,7 +262,7 @@ class ResponseComposerAgent:
                 'key_numbers': composed.get('key_numbers', []),
                 'formatting_style': composed.get('formatting_style', 'markdown_with_emojis'),
                 'user_friendly_score': composed.get('user_friendly_score', 0.0),
-                'tokens_used': response.usage.total_tokens,
+                'tokens_used': tokens_used,
                 'model_used': self.model,
                 'error': None,
                 # Preservar dados da análise Python Runtime para metadata
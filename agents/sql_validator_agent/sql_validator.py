@@ -16,7 +16,7 @@ from datetime import datetime
 backend_path = str(Path(__file__).parent.parent.parent)
 sys.path.insert(0, backend_path)
 
-from openai import OpenAI
+from agents.llm_client import get_llm_client
 
 class SQLValidatorAgent:
     """
@@ -30,7 +30,7 @@ class SQLValidatorAgent:
     
     def __init__(self):
         """Inicializa o agente"""
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self.client = get_llm_client('sql_validator')
         self.roles = self._load_roles()
         self.model = 'gpt-4o'
         
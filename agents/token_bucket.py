@@ -0,0 +1,71 @@
+"""
+Token bucket no Redis
+
+Script único usado pela admissão do start_job (ratelimit:*, custo 1 por
+pergunta) e pelo orçamento por modelo do cliente LLM (llm_budget:*, custo 1
+requisição + tokens estimados).
+
+Os buckets de uma chamada são verificados e consumidos atomicamente: se um
+recusar, os outros não perdem saldo. Cada bucket é um hash {tokens, ts} que
+repõe `rate` fichas/segundo até `capacity`.
+"""
+
+import time
+from typing import List, Optional, Tuple
+
+from redis import Redis
+
+# KEYS: buckets | ARGV: agora, depois (capacidade, fichas/segundo, custo) de cada bucket
+# Retorna {1, 0} se consumiu ou {0, ms até ter saldo no bucket mais restrito}
+TOKEN_BUCKET_LUA = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local wait_ms = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[3 * i - 1])
+    local rate = tonumber(ARGV[3 * i])
+    local cost = tonumber(ARGV[3 * i + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < cost then
+        wait_ms = math.max(wait_ms, math.ceil((cost - tokens) / rate * 1000))
+    end
+end
+if wait_ms > 0 then
+    return {0, wait_ms}
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[3 * i - 1])
+    local rate = tonumber(ARGV[3 * i])
+    local cost = tonumber(ARGV[3 * i + 1])
+    redis.call('HSET', key, 'tokens', levels[i] - cost, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 60)
+end
+return {1, 0}
+"""
+
+
+def take_tokens(redis_client: Redis, buckets: List[Tuple[str, float, float, float]], now: Optional[float] = None) -> float:
+    """
+    Consome o custo de cada bucket, todos ou nenhum
+    
+    Args:
+        buckets: [(chave, capacidade, fichas/segundo, custo), ...]
+        now: Relógio usado na reposição (padrão: time.time() de quem chama)
+    
+    Returns:
+        0 se consumiu, senão segundos até o bucket mais restrito ter saldo
+    """
+    if not buckets:
+        return 0.0
+    
+    keys, args = [], [time.time() if now is None else now]
+    for key, capacity, rate, cost in buckets:
+        keys.append(key)
+        args += [capacity, rate, cost]
+    
+    allowed, wait_ms = redis_client.eval(TOKEN_BUCKET_LUA, len(keys), *keys, *args)
+    return 0.0 if allowed else int(wait_ms) / 1000
@@ -5,6 +5,10 @@ const PYTHON_PATH = `${BASE_PATH}/ezinho_assistente/bin/python`;
 // Carregar variáveis de ambiente do .env
 require('dotenv').config({ path: `${BASE_PATH}/.env` });
 
+// WORKER_AUTOSCALE=true: graph-autoscaler dimensiona os workers pelas filas
+// (substitui os apps worker-* de um processo fixo por módulo)
+const WORKER_AUTOSCALE = process.env.WORKER_AUTOSCALE === "true";
+
 module.exports = {
   apps: [
     // Graph Orchestrator WebSocket Server
@@ -246,6 +250,58 @@ module.exports = {
       log_date_format: "YYYY-MM-DD HH:mm:ss"
     },
 
+    // Janitor: expira jobs finalizados (zset finished_jobs) em segundo plano
+    {
+      name: "graph-janitor",
+      script: "agents/graph_orchestrator/janitor.py",
+      interpreter: PYTHON_PATH,
+      cwd: BASE_PATH,
+      autorestart: true,
+      watch: false,
+      max_memory_restart: "256M",
+      env: {
+        PYTHONPATH: BASE_PATH
+      },
+      out_file: "/var/log/pm2/graph-janitor.out.log",
+      error_file: "/var/log/pm2/graph-janitor.err.log",
+      log_date_format: "YYYY-MM-DD HH:mm:ss"
+    },
+
+    // Audit log writer: grava em lote os logs por módulo (stream audit_log)
+    {
+      name: "graph-audit-writer",
+      script: "agents/graph_orchestrator/audit_log_writer.py",
+      interpreter: PYTHON_PATH,
+      cwd: BASE_PATH,
+      autorestart: true,
+      watch: false,
+      max_memory_restart: "512M",
+      env: {
+        PYTHONPATH: BASE_PATH
+      },
+      out_file: "/var/log/pm2/graph-audit-writer.out.log",
+      error_file: "/var/log/pm2/graph-audit-writer.err.log",
+      log_date_format: "YYYY-MM-DD HH:mm:ss"
+    },
+
+    // Autoscaler dos workers (só com WORKER_AUTOSCALE=true)
+    {
+      name: "graph-autoscaler",
+      script: "agents/graph_orchestrator/autoscaler.py",
+      interpreter: PYTHON_PATH,
+      cwd: BASE_PATH,
+      autorestart: true,
+      watch: false,
+      max_memory_restart: "256M",
+      env: {
+        PYTHONPATH: BASE_PATH
+      },
+      out_file: "/var/log/pm2/graph-autoscaler.out.log",
+      error_file: "/var/log/pm2/graph-autoscaler.err.log",
+      log_date_format: "YYYY-MM-DD HH:mm:ss",
+      kill_timeout: 600000
+    },
+
     // Data Sync Agent - Sincronização Athena -> PostgreSQL
     {
       name: "data-sync-agent",
@@ -268,4 +324,8 @@ module.exports = {
       max_restarts: 0
     }
   ]
-};
\ No newline at end of file
+};
+
+module.exports.apps = module.exports.apps.filter(app =>
+  WORKER_AUTOSCALE ? !app.name.startsWith("worker-") : app.name !== "graph-autoscaler"
+);